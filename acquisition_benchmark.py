@@ -0,0 +1,224 @@
+import itertools
+import json
+import os
+import platform
+import shutil
+import subprocess
+import tempfile
+import time
+import numpy as np
+from automization import CameraFilterSyncronizer
+from simulated_devices import SENSOR_TYPE, create_simulated_session
+
+
+# the stages of the acquisition hot path reported per frame, see `CameraFilterSyncronizer.gatherImages`
+STAGES = ('tune', 'settle', 'exposure', 'readout', 'copy', 'transform_to_48', 'average', 'dark_subtraction',
+          'normalization', 'compression_wait', 'tiff_write', 'journal')
+
+
+# The `AcquisitionBenchmark` class runs normalized scans against simulated devices over a grid of exposure times,
+# region sizes, sensor types and wavelength counts, and reports the time per frame spent in every stage of the
+# acquisition hot path. Every run is appended to a JSON lines history and compared to the previous run of the same
+# case on the same host, so regressions show up as soon as they are committed.
+class AcquisitionBenchmark:
+
+    def __init__(self, exposures: list = (1000, 20000), roi_sizes: list = (128, 512),
+                 sensor_types: list = (SENSOR_TYPE.MONOCHROME, SENSOR_TYPE.BAYER), wavelength_counts: list = (10, 50),
+                 repeats: int = 1, history_path: str = 'benchmark_history.jsonl', device_options: dict = None,
+                 warmup_repeats: int = 1) -> None:
+        """
+        The function initializes the benchmark grid.
+
+        @param exposures The exposure times in microseconds.
+        @param roi_sizes The edge lengths in pixels of the square regions of interest read out from the sensor.
+        @param sensor_types The sensor types of the simulated camera, `SENSOR_TYPE.BAYER` runs the color transform.
+        @param wavelength_counts The numbers of wavelengths per scan, spread evenly over 430nm-730nm.
+        @param repeats The number of scans per case, the median time of every stage is reported.
+        @param history_path The JSON lines file the results are appended to, None to keep no history.
+        @param device_options Keyword arguments of `create_simulated_session`, e.g. `tuning_time`. By default the
+        simulated devices respond instantly, so only the time spent on the host is measured.
+        @param warmup_repeats The number of scans per case run before the measured ones and discarded, which take
+        the one-time costs, e.g. computing the gain tables of the calibration.
+        """
+        self.exposures = list(exposures)
+        self.roi_sizes = list(roi_sizes)
+        self.sensor_types = list(sensor_types)
+        self.wavelength_counts = list(wavelength_counts)
+        self.repeats = repeats
+        self.warmup_repeats = warmup_repeats
+        self.history_path = history_path
+        self.device_options = dict(time_scale=0.0)
+        if device_options is not None:
+            self.device_options.update(device_options)
+
+    def cases(self) -> list:
+        """
+        The function returns the cases of the grid as dictionaries with the keys 'sensor', 'roi_size',
+        'wavelengths' and 'exposure_us'.
+        """
+        return [{'sensor': SENSOR_TYPE(sensor_type).name.lower(), 'roi_size': int(roi_size),
+                 'wavelengths': int(wavelength_count), 'exposure_us': int(exposure)}
+                for sensor_type, roi_size, wavelength_count, exposure
+                in itertools.product(self.sensor_types, self.roi_sizes, self.wavelength_counts, self.exposures)]
+
+    def run(self, output_dir: str = None) -> list:
+        """
+        The function runs all cases, prints a report with the regressions found in the history and appends the
+        results to the history.
+
+        @param output_dir The directory of the calibration and scan files, a temporary directory deleted afterwards
+        if it is None.
+
+        @return the list of result records, see `run_case`.
+        """
+        temporary = output_dir is None
+        if temporary:
+            output_dir = tempfile.mkdtemp(prefix='acquisition_benchmark_')
+        run_info = {'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'), 'commit': self._commit(),
+                    'host': platform.node(), 'python': platform.python_version(), 'numpy': np.__version__,
+                    'devices': self.device_options}
+        records = []
+        try:
+            # one session and calibration per sensor type, the calibration covers the largest region
+            for sensor_type in self.sensor_types:
+                sensor = SENSOR_TYPE(sensor_type).name.lower()
+                session = create_simulated_session(sensor_type=sensor_type, **self.device_options)
+                with session:
+                    syncroniser = CameraFilterSyncronizer(wavelengths=[], exposure=min(self.exposures), session=session)
+                    calib_filepath = self._calibrate(syncroniser, output_dir, sensor)
+                    for case in self.cases():
+                        if case['sensor'] == sensor:
+                            records.append(dict(run_info, **self.run_case(syncroniser, case, output_dir, calib_filepath)))
+        finally:
+            if temporary:
+                shutil.rmtree(output_dir, ignore_errors=True)
+        regressions = self.compare(records)
+        self.report(records, regressions)
+        if self.history_path is not None:
+            with open(self.history_path, 'a') as file:
+                for record in records:
+                    file.write(json.dumps(record) + '\n')
+        return records
+
+    def run_case(self, syncroniser: CameraFilterSyncronizer, case: dict, output_dir: str, calib_filepath: str) -> dict:
+        """
+        The function scans one case `warmup_repeats` times without measuring and then `repeats` times.
+
+        @param syncroniser The `CameraFilterSyncronizer` on the simulated session of the sensor type of the case.
+        @param case The case, see `cases`.
+        @param output_dir The directory of the scan file.
+        @param calib_filepath The calibration file used for normalization.
+
+        @return a dictionary with the case, the number of frames, the median scan time in seconds, the median
+        time per frame in seconds of every stage and the time in seconds of the first warm-up scan, None without.
+        """
+        wavelengths = np.linspace(430, 730, case['wavelengths']).round().astype(int).tolist()
+        roi = (0, 0, case['roi_size'], case['roi_size'])
+        syncroniser.configure(wavelengths, case['exposure_us'])
+        runs = []
+        for _ in range(self.warmup_repeats + self.repeats):
+            syncroniser.gatherImages(output_dir, 'benchmark.tif', calib_filepath, is_calib=False, roi=roi,
+                                     resume=False)
+            runs.append(syncroniser.last_scan_stage_times)
+        warmup_total = runs[0]['total'] if self.warmup_repeats > 0 else None
+        runs = runs[self.warmup_repeats:]
+        per_frame = dict((stage, float(np.median([run.get(stage, 0.0) for run in runs]))/len(wavelengths))
+                         for stage in STAGES)
+        return {'case': case, 'frames': len(wavelengths), 'total': float(np.median([run['total'] for run in runs])),
+                'per_frame': per_frame, 'warmup_total': warmup_total}
+
+    def compare(self, records: list, tolerance: float = 0.25, min_difference: float = 2e-4) -> list:
+        """
+        The function compares the results with the latest earlier result of the same case on the same host with the
+        same simulated device timings in the history.
+
+        @param records The result records of `run_case`.
+        @param tolerance The relative increase of the time per frame of a stage regarded as regression.
+        @param min_difference The increase in seconds per frame below which a stage is not regarded as regression,
+        so the jitter of very short stages is ignored.
+
+        @return a list of `(case, stage, previous seconds per frame, current seconds per frame)` tuples.
+        """
+        previous = {}
+        for record in self.load_history(self.history_path):
+            previous[self._case_key(record)] = record
+        regressions = []
+        for record in records:
+            baseline = previous.get(self._case_key(record))
+            if baseline is None:
+                continue
+            for stage in STAGES:
+                before = baseline['per_frame'].get(stage, 0.0)
+                after = record['per_frame'][stage]
+                if after - before > min_difference and after > before*(1 + tolerance):
+                    regressions.append((record['case'], stage, before, after))
+        return regressions
+
+    @staticmethod
+    def load_history(history_path: str) -> list:
+        """
+        The function reads the result records of all earlier runs, an empty list if there is no history.
+        """
+        if history_path is None or not os.path.exists(history_path):
+            return []
+        with open(history_path) as file:
+            return [json.loads(line) for line in file if line.strip()]
+
+    @staticmethod
+    def report(records: list, regressions: list = ()):
+        """
+        The function prints the time per frame in milliseconds of every stage and case, the scan time and the time
+        of the warm-up scan, followed by the regressions.
+        """
+        print(f'{"sensor":>10} {"roi":>5} {"wls":>4} {"exp_us":>7} ' + ' '.join(f'{stage[:9]:>9}' for stage in STAGES)
+              + f' {"total_s":>8} {"warmup_s":>8}')
+        for record in records:
+            case = record['case']
+            print(f'{case["sensor"]:>10} {case["roi_size"]:>5} {case["wavelengths"]:>4} {case["exposure_us"]:>7} '
+                  + ' '.join(f'{record["per_frame"][stage]*1e3:9.3f}' for stage in STAGES)
+                  + f' {record["total"]:8.2f}'
+                  + (f' {record["warmup_total"]:8.2f}' if record.get('warmup_total') is not None else f' {"-":>8}'))
+        for case, stage, before, after in regressions:
+            print(f'Regression in {stage} of {case}: {before*1e3:.3f} ms -> {after*1e3:.3f} ms per frame')
+
+    def _calibrate(self, syncroniser, output_dir, sensor):
+        calib_filepath = os.path.join(output_dir, f'benchmark_calib_{sensor}.tif')
+        size = max(self.roi_sizes)
+        syncroniser.gatherImages(output_dir, os.path.basename(calib_filepath), None, is_calib=True,
+                                 roi=(0, 0, size, size), resume=False)
+        return calib_filepath
+
+    @staticmethod
+    def _case_key(record):
+        return record.get('host'), json.dumps(record['case'], sort_keys=True), json.dumps(record.get('devices'), sort_keys=True)
+
+    @staticmethod
+    def _commit():
+        try:
+            return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                                  cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+        except OSError:
+            return None
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Benchmark of the acquisition hot path on simulated devices')
+    parser.add_argument('--exposures', type=int, nargs='+', default=[1000, 20000])
+    parser.add_argument('--roi-sizes', type=int, nargs='+', default=[128, 512])
+    parser.add_argument('--sensors', nargs='+', choices=['monochrome', 'bayer'], default=['monochrome', 'bayer'])
+    parser.add_argument('--wavelength-counts', type=int, nargs='+', default=[10, 50])
+    parser.add_argument('--repeats', type=int, default=1)
+    parser.add_argument('--warmup-repeats', type=int, default=1)
+    parser.add_argument('--history', default='benchmark_history.jsonl')
+    parser.add_argument('--tuning-time', type=float, default=0.0)
+    arguments = parser.parse_args()
+
+    benchmark = AcquisitionBenchmark(exposures=arguments.exposures, roi_sizes=arguments.roi_sizes,
+                                     sensor_types=[SENSOR_TYPE[sensor.upper()] for sensor in arguments.sensors],
+                                     wavelength_counts=arguments.wavelength_counts, repeats=arguments.repeats,
+                                     history_path=arguments.history,
+                                     device_options={'tuning_time': arguments.tuning_time},
+                                     warmup_repeats=arguments.warmup_repeats)
+    benchmark.run()
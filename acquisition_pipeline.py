@@ -0,0 +1,120 @@
+import queue
+import threading
+import time
+from span_tracer import TRACER
+
+
+# Marks the end of the item stream passed between the pipeline stages.
+_END_OF_STREAM = object()
+
+
+# The `AcquisitionPipeline` class runs a chain of processing stages in worker threads, which are connected by bounded
+# queues. The acquisition loop submits captured frames and continues with the next wavelength while the previous
+# frames are processed and written.
+class AcquisitionPipeline:
+
+    def __init__(self, stages: list, queue_size: int = 2) -> None:
+        """
+        The function initializes the pipeline with a list of stages. Each stage is a tuple of a name and a callable,
+        which takes the item of the previous stage and returns the item for the next stage. A stage returning None
+        drops the item.
+
+        @param stages List of `(name, callable)` tuples, executed in order, each in its own thread.
+        @param queue_size The maximum number of items waiting in front of each stage. If the queue in front of the
+        first stage is full, `submit` blocks, so the memory held by the pipeline stays bounded.
+        """
+        self._stages = stages
+        self._queues = [queue.Queue(maxsize=queue_size) for _ in stages]
+        self._threads = []
+        self._error = None
+        self._error_lock = threading.Lock()
+        self.failed = threading.Event()
+        self.stage_times = dict((name, 0.0) for name, _ in stages)
+        self.submit_wait_time = 0.0
+        self.item_count = 0
+
+    def start(self):
+        """
+        The function starts one worker thread per stage.
+
+        @return the pipeline itself.
+        """
+        for index, (name, function) in enumerate(self._stages):
+            output_queue = self._queues[index + 1] if index + 1 < len(self._queues) else None
+            thread = threading.Thread(target=self._run_stage,
+                                      args=(name, function, self._queues[index], output_queue),
+                                      name=f'pipeline-{name}', daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        return self
+
+    def _run_stage(self, name, function, input_queue, output_queue):
+        while True:
+            item = input_queue.get()
+            if item is _END_OF_STREAM:
+                break
+            if self.failed.is_set():
+                # keep draining, so that the upstream stages never block on a full queue
+                continue
+            try:
+                with TRACER.span(name, self.stage_times):
+                    result = function(item)
+            except BaseException as exception:
+                # later errors are usually consequences of the first one
+                with self._error_lock:
+                    if self._error is None:
+                        self._error = exception
+                self.failed.set()
+                continue
+            if output_queue is not None and result is not None:
+                output_queue.put(result)
+        if output_queue is not None:
+            output_queue.put(_END_OF_STREAM)
+
+    def submit(self, item):
+        """
+        The function hands an item to the first stage. It blocks while the first queue is full.
+
+        @param item The item passed to the first stage.
+        """
+        self.raise_if_failed()
+        start = time.perf_counter()
+        with TRACER.span('pipeline_submit'):
+            self._queues[0].put(item)
+        self.submit_wait_time += time.perf_counter() - start
+        self.item_count += 1
+
+    def close(self):
+        """
+        The function signals the end of the stream, waits until all submitted items passed the last stage and
+        re-raises the first error raised in any stage.
+        """
+        if not self._threads:
+            return
+        self._queues[0].put(_END_OF_STREAM)
+        for thread in self._threads:
+            thread.join()
+        self._threads = []
+        self.raise_if_failed()
+
+    def raise_if_failed(self):
+        """
+        The function re-raises the first error raised in any stage as `RuntimeError`, if a stage failed.
+        """
+        if self.failed.is_set():
+            raise RuntimeError(f'Acquisition pipeline stage failed: {self._error}') from self._error
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exception_type, exception_value, exception_traceback):
+        if exception_type is None:
+            self.close()
+        else:
+            # stop the workers without masking the original exception
+            self.failed.set()
+            try:
+                self.close()
+            except RuntimeError:
+                pass
+        return False
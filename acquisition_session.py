@@ -0,0 +1,368 @@
+import time
+import numpy as np
+from filter_settle import FilterSettler
+from bayer_demosaic import cfa_pattern
+try:
+    from Sensor_lib import KURIOS_COMMAND_LIB
+except OSError as ex:
+    print("Warning:",ex)
+    KURIOS_COMMAND_LIB = None
+
+try:
+    # if on Windows, use the provided setup script to add the DLLs folder to the PATH
+    from windows_setup import configure_path
+    configure_path()
+except ImportError:
+    configure_path = None
+
+try:
+    from thorlabs_tsi_sdk.tl_camera import TLCameraSDK
+    from thorlabs_tsi_sdk.tl_mono_to_color_processor import MonoToColorProcessorSDK
+    from thorlabs_tsi_sdk.tl_camera_enums import SENSOR_TYPE, OPERATION_MODE
+except ImportError as ex:
+    print("Warning:",ex)
+    TLCameraSDK = None
+    MonoToColorProcessorSDK = None
+    SENSOR_TYPE = None
+    OPERATION_MODE = None
+
+
+# The `AcquisitionSession` class keeps the camera SDK, the camera, the mono to color processor and the Kurios handle
+# open and the camera armed, so that any number of scans can be run without reconnecting to the devices.
+class AcquisitionSession:
+
+    def __init__(self, camera_sdk_factory=None, mono_to_color_sdk_factory=None, kurios=None, sensor_types=None,
+                 operation_modes=None, image_poll_timeout_ms: int = 20000, arm_settle_time: float = 1.0,
+                 kurios_serial: str = None, camera_serial: str = None, min_settle_time: float = 0.1,
+                 seed_settle_time: float = 0.3) -> None:
+        """
+        The function initializes an acquisition session. The devices are not accessed before `open` is called or
+        the session is entered as a context manager.
+
+        @param camera_sdk_factory Callable returning the camera SDK, defaults to `TLCameraSDK`.
+        @param mono_to_color_sdk_factory Callable returning the mono to color SDK, defaults to
+        `MonoToColorProcessorSDK`.
+        @param kurios Object providing the functions of `Sensor_lib.KURIOS_COMMAND_LIB`, defaults to that module.
+        @param sensor_types The `SENSOR_TYPE` enum belonging to the camera SDK.
+        @param operation_modes The `OPERATION_MODE` enum belonging to the camera SDK.
+        @param image_poll_timeout_ms The time in milliseconds the camera waits for a frame before timing out.
+        @param arm_settle_time The time in seconds to wait after arming and triggering the camera.
+        @param kurios_serial The serial number of the Kurios to connect to, the first listed device if None.
+        @param camera_serial The serial number of the camera to connect to, the first discovered camera if None.
+        @param min_settle_time The shortest time in seconds waited after tuning the filter, see `FilterSettler`.
+        @param seed_settle_time The settle time in seconds expected for jump sizes not measured yet, see
+        `FilterSettler`.
+        """
+        self._camera_sdk_factory = camera_sdk_factory if camera_sdk_factory is not None else TLCameraSDK
+        self._mono_to_color_sdk_factory = (mono_to_color_sdk_factory if mono_to_color_sdk_factory is not None
+                                           else MonoToColorProcessorSDK)
+        self.kurios = kurios if kurios is not None else KURIOS_COMMAND_LIB
+        self._sensor_types = sensor_types if sensor_types is not None else SENSOR_TYPE
+        self._operation_modes = operation_modes if operation_modes is not None else OPERATION_MODE
+        self._image_poll_timeout_ms = image_poll_timeout_ms
+        self._arm_settle_time = arm_settle_time
+        self.kurios_serial = kurios_serial
+        self.camera_serial = camera_serial
+        self._min_settle_time = min_settle_time
+        self._seed_settle_time = seed_settle_time
+
+        self.sdk = None
+        self.camera = None
+        self.mono_to_color_sdk = None
+        self.mono_to_color_processor = None
+        self.hdl = None
+        self.settler = None
+        self.image_width = 0
+        self.image_height = 0
+        self.bit_depth = 0
+        self.is_color_camera = False
+        # color filter array phase at the sensor origin and color matrices of a color camera
+        self.color_filter_array_phase = None
+        self.color_correction_matrix = None
+        self.white_balance_matrix = None
+        self.exposure = None
+        self.bandwidth_mode = None
+        # region of interest as read back from the camera, None while the full sensor is read out
+        self.roi = None
+        self.binning = (1, 1)
+        self._full_roi = None
+        self._requested_roi = None
+        self.is_hardware_triggered = False
+        self.is_open = False
+        self.open_time = 0.0
+        self.scan_setup_times = []
+        # mean time per wavelength step spent besides the exposure, for software driven scans
+        self.software_step_overhead = None
+
+    def open(self):
+        """
+        The function connects to the Kurios device and the camera with the serial numbers of the session, or the
+        first ones found if no serial numbers are given, creates a mono to color processor for color cameras and
+        arms the camera for continuous acquisition. Calling it on an open session does nothing.
+
+        @return the session itself.
+        """
+        if self.is_open:
+            return self
+        start = time.perf_counter()
+
+        #try to access Kurios
+        devs = self.kurios.KuriosListDevices()
+        print(devs)
+        if(len(devs) <= 0):
+            raise RuntimeError('No Kurios device is connected')
+        if self.kurios_serial is None:
+            Kurios = devs[0] #get serial number
+        else:
+            matching = [dev for dev in devs if str(dev[0]) == str(self.kurios_serial)]
+            if not matching:
+                raise RuntimeError(f'Kurios {self.kurios_serial} is not connected, found '
+                                   f'{", ".join(str(dev[0]) for dev in devs)}')
+            Kurios = matching[0]
+        self.hdl = self.kurios.KuriosOpen(Kurios[0],115200,3)
+        # a reopened session connects to the same devices
+        self.kurios_serial = str(Kurios[0])
+        if self.settler is None:
+            # the settle model is kept when the session is reopened
+            self.settler = FilterSettler(self.kurios, self.hdl, min_settle_time=self._min_settle_time,
+                                         seed_settle_time=self._seed_settle_time)
+        else:
+            self.settler.reconnect(self.hdl)
+
+        #try to access camera
+        self.sdk = self._camera_sdk_factory()
+        cameras = self.sdk.discover_available_cameras()
+        if len(cameras) == 0:
+            self.kurios.KuriosClose(self.hdl)
+            self.sdk.dispose()
+            raise RuntimeError('No camera is connected')
+        if self.camera_serial is None:
+            camera_serial = cameras[0]
+        elif str(self.camera_serial) in [str(camera) for camera in cameras]:
+            camera_serial = str(self.camera_serial)
+        else:
+            self.kurios.KuriosClose(self.hdl)
+            self.sdk.dispose()
+            raise RuntimeError(f'Camera {self.camera_serial} is not connected, found {", ".join(cameras)}')
+        camera = self.sdk.open_camera(camera_serial)
+        self.camera = camera
+        self.camera_serial = str(camera_serial)
+
+        #  setup the camera for continuous acquisition
+        camera.operation_mode = self._operation_modes.SOFTWARE_TRIGGERED
+        camera.frames_per_trigger_zero_for_unlimited = 0
+        camera.image_poll_timeout_ms = self._image_poll_timeout_ms
+
+        # a region set in an earlier session is dropped
+        if self._full_roi is None:
+            self._full_roi = camera.roi
+        camera.roi = self._full_roi
+        camera.binx = 1
+        camera.biny = 1
+        self._requested_roi = self._full_roi
+        self.roi = None
+        self.binning = (1, 1)
+
+        # need to save the image width and height for color processing
+        self.image_width = camera.image_width_pixels
+        self.image_height = camera.image_height_pixels
+        self.bit_depth = camera.bit_depth
+
+        # initialize a mono to color processor if this is a color camera
+        self.is_color_camera = (camera.camera_sensor_type == self._sensor_types.BAYER)
+        if self.is_color_camera:
+            self.color_filter_array_phase = int(camera.color_filter_array_phase)
+            self.color_correction_matrix = camera.get_color_correction_matrix()
+            self.white_balance_matrix = camera.get_default_white_balance_matrix()
+            self.mono_to_color_sdk = self._mono_to_color_sdk_factory()
+            self.mono_to_color_processor = self.mono_to_color_sdk.create_mono_to_color_processor(
+                camera.camera_sensor_type,
+                self.color_filter_array_phase,
+                self.color_correction_matrix,
+                self.white_balance_matrix,
+                camera.bit_depth
+            )
+
+        camera.arm(2)
+        camera.issue_software_trigger()
+        time.sleep(self._arm_settle_time)
+        self.is_hardware_triggered = False
+        self.is_open = True
+        self.open_time = time.perf_counter() - start
+        return self
+
+    def begin_scan(self, exposure: int, roi: tuple = None, binning=1) -> float:
+        """
+        The function prepares the open session for a new scan by setting the exposure time and the readout region,
+        if they changed since the last scan. The time needed for the preparation is appended to `scan_setup_times`.
+
+        @param exposure The exposure time in microseconds.
+        @param roi The region of interest of the scan, see `set_region`. None reads out the full sensor.
+        @param binning The binning of the scan, see `set_region`.
+
+        @return the setup time of the scan in seconds.
+        """
+        start = time.perf_counter()
+        if not self.is_open:
+            self.open()
+        self.set_region(roi, binning)
+        self.set_exposure(exposure)
+        setup_time = time.perf_counter() - start
+        self.scan_setup_times.append(setup_time)
+        return setup_time
+
+    def set_exposure(self, exposure: int):
+        """
+        The function sets the exposure time of the camera, if it differs from the current one.
+
+        @param exposure The exposure time in microseconds.
+        """
+        if self.exposure != exposure:
+            self.camera.exposure_time_us = int(exposure)
+            self.exposure = exposure
+
+    @property
+    def readout_time(self) -> float:
+        """
+        The time in seconds the camera needs to read out a frame at the current region and binning, None if the
+        camera reports neither its readout time nor its frame time.
+        """
+        readout_time_ns = getattr(self.camera, 'sensor_readout_time_ns', None)
+        if readout_time_ns is not None:
+            return readout_time_ns*1e-9
+        frame_time_us = getattr(self.camera, 'frame_time_us', None)
+        if frame_time_us is not None and self.exposure is not None:
+            return max(frame_time_us - self.exposure, 0)*1e-6
+        return None
+
+    @property
+    def sensor_temperature(self) -> float:
+        """
+        The sensor temperature in degC as reported by the camera, None if the camera has no temperature sensor.
+        """
+        try:
+            temperature = getattr(self.camera, 'sensor_temperature', None)
+        except Exception as exception:
+            print("Warning: cannot read the sensor temperature:", exception)
+            return None
+        return None if temperature is None else float(temperature)
+
+    def set_bandwidth_mode(self, bandwidth_mode: int):
+        """
+        The function sets the bandwidth mode of the Kurios, if it differs from the current one.
+
+        @param bandwidth_mode The bandwidth mode (2 = WIDE, 4 = MEDIUM, 8 = NARROW), see `kurios_sequencer`.
+        """
+        if self.bandwidth_mode != bandwidth_mode:
+            self.kurios.KuriosSetBandwidthMode(self.hdl, bandwidth_mode)
+            self.bandwidth_mode = bandwidth_mode
+
+    def set_region(self, roi: tuple = None, binning=1):
+        """
+        The function sets the region of interest and the binning of the camera, so that only a part of the sensor
+        is read out. The camera is rearmed for the change and the image size of the session is updated. The camera
+        may round the region to its pixel grid, the region as read back from the camera is stored in `roi`.
+
+        @param roi The region of interest as (upper left x, upper left y, lower right x, lower right y) in sensor
+        pixels, like the `roi` of the camera. None reads out the full sensor.
+        @param binning The number of sensor pixels combined into one image pixel, either one number for both
+        directions or a tuple (binx, biny).
+        """
+        binning = (binning, binning) if isinstance(binning, int) else tuple(int(b) for b in binning)
+        if binning != (1, 1) and self.is_color_camera:
+            raise ValueError('Binning would mix the color filter array of a color camera')
+        requested_roi = self._full_roi if roi is None else tuple(roi)
+        if requested_roi == self._requested_roi and binning == self.binning:
+            return
+        camera = self.camera
+        camera.disarm()
+        camera.roi = requested_roi
+        camera.binx, camera.biny = binning
+        camera.arm(2)
+        if not self.is_hardware_triggered:
+            camera.issue_software_trigger()
+        self._requested_roi = requested_roi
+        self.roi = None if roi is None else tuple(camera.roi)
+        self.binning = binning
+        self.image_width = camera.image_width_pixels
+        self.image_height = camera.image_height_pixels
+
+    @property
+    def region_metadata(self) -> dict:
+        """
+        The readout region as page metadata, empty while the full sensor is read out without binning.
+        """
+        if self.roi is None and self.binning == (1, 1):
+            return {}
+        roi = self._full_roi if self.roi is None else self.roi
+        return {'roi': [int(value) for value in roi], 'binning': list(self.binning)}
+
+    @property
+    def raw_bayer_metadata(self) -> dict:
+        """
+        The color information needed to develop raw frames of a color camera as page metadata: the color filter
+        pattern of the readout region, the color correction and white balance matrices and the bit depth.
+        """
+        x_offset, y_offset = (self.roi if self.roi is not None else self._full_roi)[:2]
+        return {'cfa_pattern': cfa_pattern(self.color_filter_array_phase, x_offset, y_offset),
+                'color_correction_matrix': [float(value) for value in np.ravel(self.color_correction_matrix)],
+                'white_balance_matrix': [float(value) for value in np.ravel(self.white_balance_matrix)],
+                'bit_depth': int(self.bit_depth)}
+
+    def set_hardware_triggered(self, hardware_triggered: bool):
+        """
+        The function switches the camera between continuous software triggered acquisition and hardware triggered
+        acquisition of one frame per trigger pulse. The camera is rearmed for the switch.
+
+        @param hardware_triggered True to expose one frame per pulse at the trigger input of the camera.
+        """
+        if hardware_triggered == self.is_hardware_triggered:
+            return
+        camera = self.camera
+        camera.disarm()
+        if hardware_triggered:
+            camera.operation_mode = self._operation_modes.HARDWARE_TRIGGERED
+            camera.frames_per_trigger_zero_for_unlimited = 1
+            camera.arm(2)
+        else:
+            camera.operation_mode = self._operation_modes.SOFTWARE_TRIGGERED
+            camera.frames_per_trigger_zero_for_unlimited = 0
+            camera.arm(2)
+            camera.issue_software_trigger()
+        self.is_hardware_triggered = hardware_triggered
+
+    def close(self):
+        """
+        The function disarms and releases the camera, disposes the color processing resources and closes the
+        Kurios handle.
+        """
+        if not self.is_open:
+            return
+        if self.is_color_camera:
+            try:
+                self.mono_to_color_processor.dispose()
+            except Exception as exception:
+                print("Unable to dispose mono to color processor: " + str(exception))
+            try:
+                self.mono_to_color_sdk.dispose()
+            except Exception as exception:
+                print("Unable to dispose mono to color sdk: " + str(exception))
+        try:
+            self.camera.disarm()
+            self.camera.dispose()
+        except Exception as exception:
+            print("Unable to release camera: " + str(exception))
+        try:
+            self.sdk.dispose()
+        except Exception as exception:
+            print("Unable to dispose camera sdk: " + str(exception))
+        if self.hdl:
+            self.kurios.KuriosClose(self.hdl)
+        self.is_open = False
+
+    def __enter__(self):
+        return self.open()
+
+    def __exit__(self, exception_type, exception_value, exception_traceback):
+        self.close()
+        return False
@@ -0,0 +1,69 @@
+import numpy as np
+
+
+# The `AdaptiveSampler` class decides which wavelengths an adaptive scan takes. A coarse grid is scanned first, then
+# wavelengths are added in the middle of the intervals, where the image-wide spectrum changes faster or bends more
+# than the thresholds, until the intervals reach the minimum step. Smooth spectra are thereby covered with a
+# fraction of the frames of a scan at every nanometre.
+class AdaptiveSampler:
+
+    def __init__(self, coarse_step: int = 10, min_step: int = 1, derivative_threshold: float = 0.01,
+                 curvature_threshold: float = 5e-4) -> None:
+        """
+        The function initializes the sampler. Both thresholds are relative to the largest absolute value of the
+        spectrum, so they do not depend on the brightness of the sample.
+
+        @param coarse_step The step in nm of the coarse pass.
+        @param min_step The smallest step in nm the spectrum is refined to.
+        @param derivative_threshold The relative change per nm of an interval, above which it is refined.
+        @param curvature_threshold The relative second derivative per nm^2 at a wavelength, above which the
+        intervals on both of its sides are refined.
+        """
+        if min_step < 1 or coarse_step < min_step:
+            raise ValueError('The steps have to fulfill 1 <= min_step <= coarse_step')
+        self.coarse_step = int(coarse_step)
+        self.min_step = int(min_step)
+        self.derivative_threshold = derivative_threshold
+        self.curvature_threshold = curvature_threshold
+
+    def coarse(self, min_wavelength: int, max_wavelength: int) -> list:
+        """
+        The function returns the wavelengths of the coarse pass, including both ends of the range.
+
+        @param min_wavelength The shortest wavelength in nm.
+        @param max_wavelength The longest wavelength in nm.
+        """
+        wavelengths = list(range(int(min_wavelength), int(max_wavelength) + 1, self.coarse_step))
+        if wavelengths[-1] != int(max_wavelength):
+            wavelengths.append(int(max_wavelength))
+        return wavelengths
+
+    def refine(self, wavelengths: list, values: list) -> list:
+        """
+        The function returns the wavelengths to add to the sampled spectrum.
+
+        @param wavelengths The sampled wavelengths in nm in ascending order.
+        @param values The image-wide value of the spectrum at every sampled wavelength.
+
+        @return the new wavelengths in ascending order, empty if the spectrum is resolved.
+        """
+        wavelengths = np.asarray(wavelengths, dtype=float)
+        values = np.asarray(values, dtype=float)
+        if len(wavelengths) < 2:
+            return []
+        scale = np.abs(values).max()
+        if scale == 0:
+            return []
+        steps = np.diff(wavelengths)
+        derivative = np.diff(values)/steps/scale
+        refine = np.abs(derivative) > self.derivative_threshold
+        if len(wavelengths) > 2:
+            # second divided differences of the unevenly spaced samples
+            curvature = 2*np.diff(derivative)/(wavelengths[2:] - wavelengths[:-2])
+            bent = np.abs(curvature) > self.curvature_threshold
+            refine[:-1] |= bent
+            refine[1:] |= bent
+        refine &= steps > self.min_step
+        new = sorted(set(int(round(wavelength)) for wavelength in (wavelengths[:-1] + steps/2)[refine]))
+        sampled = set(int(wavelength) for wavelength in wavelengths)
+        return [wavelength for wavelength in new if wavelength not in sampled]
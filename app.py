@@ -56,6 +56,9 @@ from tkinter import ttk, filedialog
 from PIL import Image, ImageTk 
 import subprocess
 from show_tiff_matplotlib import TifStackViewer_matplot
+from show_live_preview import LivePreviewWindow
+from live_preview import LivePreview
+import threading
 from automization import CameraFilterSyncronizer
 import os
 from datetime import datetime
@@ -100,6 +103,13 @@ class CFsyncApp:
         exposure_time_entry.insert(0, 5)
         self.exposure_time_entry = exposure_time_entry
 
+        # scans a coarse grid first and refines it where the spectrum changes
+        self.adaptive_sampling = tk.BooleanVar(value=False)
+        adaptive_checkbutton = tk.Checkbutton(root, text="Adaptive sampling", variable=self.adaptive_sampling)
+        # shows the frames while they are captured, the scan then runs in the background
+        self.live_preview = tk.BooleanVar(value=False)
+        live_preview_checkbutton = tk.Checkbutton(root, text="Live preview", variable=self.live_preview)
+
         label5 = tk.Label(root, text="Filename:")
         filename_entry = tk.Entry(root)
         self.filename_entry = filename_entry
@@ -121,7 +131,7 @@ class CFsyncApp:
         header_label = tk.Label(root, text="Load existing Image Files:", font=("Helvetica", 10))
 
         tif_view_Button = tk.Button(root, text = "Show Images", command= self.open_window_tif_view)
-        run_button = tk.Button(root, text="Collect Images", command=self.run_script)
+        self.run_button = tk.Button(root, text="Collect Images", command=self.run_script)
 
 
         self.output_text = tk.Text(root, state=tk.DISABLED, wrap=tk.WORD, width=40, height=10)
@@ -140,13 +150,15 @@ class CFsyncApp:
         exposure_time_entry.grid(row=3, column=1)
         self.error_message_exposure_time.grid(row=3, column=2)
 
+        adaptive_checkbutton.grid(row=4, column=0)
+        live_preview_checkbutton.grid(row=4, column=1)
         label5.grid(row = 5, column= 0)
         filename_entry.grid(row = 5, column= 1)
         open_folder_button.grid(row = 6, column= 0)
         
         label6.grid(row = 7, column= 0, columnspan= 2)
 
-        run_button.grid(row=8, column=0, columnspan=2)
+        self.run_button.grid(row=8, column=0, columnspan=2)
 
 
         header_label.grid(row=9, column=0, pady=20)  
@@ -181,18 +193,59 @@ class CFsyncApp:
                 self.output_text.delete(1.0, tk.END)
                 self.output_text.insert(tk.END, output)
                 self.output_text.config(state=tk.DISABLED)
-                syncroniser = CameraFilterSyncronizer(wavelengths=[ int(min_wavelength) + i for i in range(int(max_wavelength)-int(min_wavelength)+1)],
-                                            exposure= int(exposure_time)
-                                            )
                 current_datetime = datetime.now()
                 date_format = "%Y-%m-%d_%H-%M-%S"
-                syncroniser.gatherImages(
-                    output_dir = os.path.abspath(r'.'),
-                    filename = f"{filename}_wl_{min_wavelength}-{max_wavelength}nm_{current_datetime.strftime(date_format)}.tif",
-                    calib_filepath= os.path.join(calibfolder,calibfile),
-                    is_calib= False
-                    )
-                syncroniser.cleanup()
+                preview = LivePreview() if self.live_preview.get() else None
+
+                def scan():
+                    syncroniser = None
+                    try:
+                        syncroniser = CameraFilterSyncronizer(wavelengths=[ int(min_wavelength) + i for i in range(int(max_wavelength)-int(min_wavelength)+1)],
+                                                    exposure= int(exposure_time)
+                                                    )
+                        if self.adaptive_sampling.get():
+                            syncroniser.gatherAdaptive(
+                                output_dir = os.path.abspath(r'.'),
+                                filename = f"{filename}_wl_{min_wavelength}-{max_wavelength}nm_adaptive_{current_datetime.strftime(date_format)}.tif",
+                                calib_filepath= os.path.join(calibfolder,calibfile),
+                                preview = preview
+                                )
+                        else:
+                            syncroniser.gatherImages(
+                                output_dir = os.path.abspath(r'.'),
+                                filename = f"{filename}_wl_{min_wavelength}-{max_wavelength}nm_{current_datetime.strftime(date_format)}.tif",
+                                calib_filepath= os.path.join(calibfolder,calibfile),
+                                is_calib= False,
+                                preview = preview
+                                )
+                    except Exception as exception:
+                        # widgets are only touched from the Tk event loop
+                        self.root.after(0, self.report_scan_error, exception)
+                    finally:
+                        if syncroniser is not None:
+                            syncroniser.cleanup()
+                        self.root.after(0, lambda: self.run_button.config(state=tk.NORMAL))
+
+                # a second scan would open the devices of the running one
+                self.run_button.config(state=tk.DISABLED)
+                if preview is not None:
+                    # the window polls the preview, while the scan runs in its own thread
+                    LivePreviewWindow(tk.Toplevel(self.root), preview)
+                    threading.Thread(target=scan, name='scan', daemon=True).start()
+                else:
+                    scan()
+
+    def report_scan_error(self, exception):
+        """
+        The function shows the error which stopped a scan in the output text.
+
+        @param exception The exception raised by the scan.
+        """
+        print("Scan failed:", exception)
+        self.output_text.config(state=tk.NORMAL)
+        self.output_text.insert(tk.END, f"\n Scan failed: {exception}")
+        self.output_text.config(state=tk.DISABLED)
+
     #display error messages
     def display_error_message(self, label, message):
         """
@@ -0,0 +1,204 @@
+import asyncio
+import functools
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from automization import CameraFilterSyncronizer, ScanCancelledError
+
+
+# Marks the end of the event stream of a closed synchronizer.
+_END_OF_EVENTS = object()
+
+
+# The `AsyncCameraFilterSyncronizer` class is the asyncio counterpart of `CameraFilterSyncronizer`. The blocking
+# device calls run in a single worker thread, so scans are awaitable and other instruments can be served by the same
+# event loop meanwhile. Progress is published as events, which any number of consumers can iterate over.
+class AsyncCameraFilterSyncronizer:
+
+    def __init__(self, wavelengths: list, exposure: int, session=None, **syncroniser_options) -> None:
+        """
+        The function initializes the asynchronous synchronizer. The devices are connected by `open` or when the
+        synchronizer is entered with `async with`.
+
+        @param wavelengths The wavelengths in nm of the scans.
+        @param exposure The exposure time in microseconds.
+        @param session An `AcquisitionSession` to reuse, see `CameraFilterSyncronizer`.
+        @param syncroniser_options Further keyword arguments of `CameraFilterSyncronizer`.
+        """
+        self._wavelengths = wavelengths
+        self._exposure = exposure
+        self._session = session
+        self._syncroniser_options = syncroniser_options
+        self._syncroniser = None
+        # one thread, the devices are never accessed concurrently, created by `open`
+        self._executor = None
+        self._subscribers = []
+        self._loop = None
+
+    async def open(self):
+        """
+        The function connects the devices in the worker thread. A closed synchronizer can be opened again.
+
+        @return the synchronizer itself.
+        """
+        self._loop = asyncio.get_running_loop()
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='async-acquisition')
+        if self._syncroniser is None:
+            self._syncroniser = await self._run(CameraFilterSyncronizer, self._wavelengths, self._exposure,
+                                                session=self._session, **self._syncroniser_options)
+        return self
+
+    async def close(self):
+        """
+        The function releases the devices, see `CameraFilterSyncronizer.cleanup`, and ends all event streams. A
+        device call still running in the worker thread is finished first, as the cleanup queues up behind it.
+        """
+        if self._executor is not None:
+            if self._syncroniser is not None:
+                await self._run(self._syncroniser.cleanup)
+                self._syncroniser = None
+            else:
+                await self._run(lambda: None)
+            # the worker is idle, so waiting for it does not block the event loop
+            self._executor.shutdown(wait=True)
+            self._executor = None
+        for queue in self._subscribers:
+            queue.put_nowait(_END_OF_EVENTS)
+        self._subscribers = []
+
+    async def scan(self, output_dir: str, filename: str, calib_filepath: str, **scan_options) -> str:
+        """
+        The function runs a normalized scan, see `CameraFilterSyncronizer.gatherImages`. Cancelling the awaiting
+        task stops the scan before the next frame, the completed wavelengths stay in the journal of the scan.
+
+        @param output_dir The output directory.
+        @param filename The name of the output file.
+        @param calib_filepath The path of the calibration file.
+        @param scan_options Further keyword arguments of `gatherImages`.
+
+        @return the path of the written stack.
+        """
+        return await self._gather(output_dir, filename, calib_filepath, False, scan_options)
+
+    async def calibrate(self, output_dir: str, filename: str, **scan_options) -> str:
+        """
+        The function runs the calibration routine, see `CameraFilterSyncronizer.gatherImages`, and can be cancelled
+        like `scan`.
+
+        @param output_dir The output directory.
+        @param filename The name of the calibration file.
+        @param scan_options Further keyword arguments of `gatherImages`.
+
+        @return the path of the written calibration file.
+        """
+        return await self._gather(output_dir, filename, None, True, scan_options)
+
+    def events(self):
+        """
+        The function subscribes to the progress events of all following scans and returns an async iterator over
+        them. The events are dictionaries with an 'event' key: 'scan_started', 'frame', 'wavelength_written',
+        'scan_finished', 'scan_failed' and 'scan_cancelled'. The stream ends when the synchronizer is closed.
+        """
+        queue = asyncio.Queue()
+        self._subscribers.append(queue)
+        return self._iterate_events(queue)
+
+    async def _iterate_events(self, queue):
+        try:
+            while True:
+                event = await queue.get()
+                if event is _END_OF_EVENTS:
+                    return
+                yield event
+        finally:
+            if queue in self._subscribers:
+                self._subscribers.remove(queue)
+
+    async def _gather(self, output_dir, filename, calib_filepath, is_calib, scan_options):
+        await self.open()
+        # `close` may drop the synchronizer while the scan finishes
+        syncroniser = self._syncroniser
+        output_path = output_dir + os.sep + filename
+        cancel = threading.Event()
+        self._publish({'event': 'scan_started', 'path': output_path, 'is_calib': is_calib})
+        start = time.perf_counter()
+        future = self._loop.run_in_executor(
+            self._executor, functools.partial(syncroniser.gatherImages, output_dir, filename, calib_filepath,
+                                              is_calib, progress=self._publish_threadsafe, cancel=cancel,
+                                              **scan_options))
+        try:
+            # shielded, so a cancelled task still waits until the worker thread stopped using the devices
+            await asyncio.shield(future)
+        except asyncio.CancelledError:
+            cancel.set()
+            try:
+                await future
+            except ScanCancelledError:
+                pass
+            self._publish({'event': 'scan_cancelled', 'path': output_path})
+            raise
+        except Exception as exception:
+            self._publish({'event': 'scan_failed', 'path': output_path, 'error': repr(exception)})
+            raise
+        self._publish({'event': 'scan_finished', 'path': output_path, 'duration': time.perf_counter() - start,
+                       'stage_times': syncroniser.last_scan_stage_times})
+        return output_path
+
+    async def _run(self, function, *args, **kwargs):
+        return await asyncio.get_running_loop().run_in_executor(self._executor,
+                                                                functools.partial(function, *args, **kwargs))
+
+    def _publish(self, event):
+        for queue in self._subscribers:
+            queue.put_nowait(event)
+
+    def _publish_threadsafe(self, event):
+        self._loop.call_soon_threadsafe(self._publish, event)
+
+    async def __aenter__(self):
+        return await self.open()
+
+    async def __aexit__(self, exception_type, exception_value, exception_traceback):
+        await self.close()
+        return False
+
+
+if __name__ == "__main__":
+    # runs a simulated scan next to a second coroutine standing in for another instrument, then cancels a scan
+    import tempfile
+    from simulated_devices import create_simulated_session
+
+    async def log_power(stop):
+        while not stop.is_set():
+            print(f'{time.strftime("%H:%M:%S")} power meter reading')
+            await asyncio.sleep(0.5)
+
+    async def show_progress(events):
+        async for event in events:
+            if event['event'] != 'frame':
+                print(event)
+
+    async def main():
+        output_dir = tempfile.mkdtemp()
+        session = create_simulated_session(width=640, height=480, time_scale=0.2, tuning_time=0.02)
+        async with AsyncCameraFilterSyncronizer(list(range(430, 461)), 20000, session=session) as syncroniser:
+            progress = asyncio.create_task(show_progress(syncroniser.events()))
+            stop = asyncio.Event()
+            logger = asyncio.create_task(log_power(stop))
+            calibration = await syncroniser.calibrate(output_dir, 'async_calib.tif')
+            await syncroniser.scan(output_dir, 'async_scan.tif', calibration)
+            scan = asyncio.create_task(syncroniser.scan(output_dir, 'async_scan.tif', calibration, resume=False))
+            await asyncio.sleep(0.5)
+            scan.cancel()
+            try:
+                await scan
+            except asyncio.CancelledError:
+                print('scan cancelled, the journal allows resuming it')
+            stop.set()
+            await logger
+        await progress
+        session.close()
+
+    asyncio.run(main())
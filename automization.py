@@ -1,4 +1,5 @@
 import re
+import json
 import time
 import numpy as np
 import os
@@ -6,95 +7,110 @@ import tifffile
 import typing
 import scipy
 from image_normalizer import ImageNormalizer
-try:
-    from Sensor_lib.KURIOS_COMMAND_LIB import *
-except OSError as ex:
-    print("Warning:",ex)
+from acquisition_session import AcquisitionSession
+from acquisition_pipeline import AcquisitionPipeline
+from kurios_sequencer import KuriosSequencer, BANDWIDTH_WIDE
+from tiff_stream_writer import StreamingTiffWriter, read_page_metadata
+from frame_buffer_pool import FrameBufferPool
+from exposure_schedule import ExposureSchedule
+from frame_averager import FrameAverager
+from scan_journal import ScanJournal
+from sweep_order import SweepOrder, SERPENTINE
+from span_tracer import TRACER
+from page_compressor import PageCompressor
+from dark_frame_library import DarkFrameLibrary, subtract_dark
+from adaptive_sampling import AdaptiveSampler
+from live_preview import LivePreview
+from memory_budget import MemoryBudget
 
 
 
-from thorlabs_tsi_sdk.tl_camera import TLCameraSDK
-from thorlabs_tsi_sdk.tl_mono_to_color_processor import MonoToColorProcessorSDK
-from thorlabs_tsi_sdk.tl_camera_enums import SENSOR_TYPE
-
-try:
-    # if on Windows, use the provided setup script to add the DLLs folder to the PATH
-    from windows_setup import configure_path
-    configure_path()
-except ImportError:
-    configure_path = None
-
 
 
+# Raised by `gatherImages` when the scan is cancelled. The completed wavelengths stay in the journal of the scan, so
+# it can be resumed later.
+class ScanCancelledError(RuntimeError):
+    pass
 
 
 # The `CameraFilterSynronizer` class initializes the Xiralux Camera the Kurios Polarization filter, and provides
 # methods for capturing and processing images.
 class CameraFilterSyncronizer:
     
-    def __init__(self, wavelengths: list, exposure: int) -> None:
+    def __init__(self, wavelengths: list, exposure: int, session: AcquisitionSession = None,
+                 pipeline_queue_size: int = 2) -> None:
         """
         The above function initializes a class instance of the CamerFilterSyncronizer with a list of wavelengths and an exposure time, and
-        attempts to access a Kurios device and a camera.
+        opens an acquisition session, which keeps the Kurios device and the camera connected until `cleanup` is called.
         
         @param wavelengths The `wavelengths` parameter is a list that contains the wavelengths of light that
         you want to capture using the camera. It is used to specify the specific wavelengths at which you
         want to capture images.
         @param exposure The `exposure` parameter is an integer that represents the exposure time for the
-        camera in milliseconds. It determines how long the camera's sensor is exposed to light when
+        camera in microseconds. It determines how long the camera's sensor is exposed to light when
         capturing an image.
+        @param session An `AcquisitionSession` to reuse. If it is None, a session on the connected hardware is opened.
+        Sessions passed in stay open after `cleanup`, so they can be shared between several synchronizers.
+        @param pipeline_queue_size The number of frames allowed to wait for normalization and for writing. It bounds
+        the memory used while processing lags behind the acquisition.
         """
         self._wavelengths = wavelengths
-        
-        #try to access Kurios
-        devs = KuriosListDevices()
-        print(devs)
-        if(len(devs) <= 0):
-            print('There is no devices connected')
-            exit()
-        Kurios = devs[0] #get serial number
-        hdl = KuriosOpen(Kurios[0],115200,3)
-        self._hdl = hdl
-        #try to access camera
-        with TLCameraSDK() as sdk:
-            cameras = sdk.discover_available_cameras()
-            if len(cameras) == 0:
-                print("Error: no cameras detected!")
-
-            with sdk.open_camera(cameras[0]) as camera:
-                #  setup the camera for continuous acquisition
-                camera.frames_per_trigger_zero_for_unlimited = 0
-                camera.image_poll_timeout_ms = 2000  # 2 second timeout
-
-                # save exposure time
-                self._exposure = exposure
-
-                # need to save the image width and height for color processing
-                self._image_width= camera.image_width_pixels
-                self._image_height = camera.image_height_pixels
-
-                # initialize a mono to color processor if this is a color camera
-                is_color_camera = (camera.camera_sensor_type == SENSOR_TYPE.BAYER)
-                self._is_color_camera = is_color_camera
-                mono_to_color_sdk = None
-                mono_to_color_processor = None
-                if is_color_camera:
-                    mono_to_color_sdk = MonoToColorProcessorSDK()
-                    mono_to_color_processor = mono_to_color_sdk.create_mono_to_color_processor(
-                        camera.camera_sensor_type,
-                        camera.color_filter_array_phase,
-                        camera.get_color_correction_matrix(),
-                        camera.get_default_white_balance_matrix(),
-                        camera.bit_depth
-                    )
-                self._mono_to_color_sdk = mono_to_color_sdk
-                self._mono_to_color_processor = mono_to_color_processor
+        # save exposure time
+        self._exposure = exposure
+
+        self._owns_session = session is None
+        if session is None:
+            session = AcquisitionSession()
+        self._session = session.open()
+        self._kurios = session.kurios
+        self._hdl = session.hdl
+        self._settler = session.settler
+        self._image_width = session.image_width
+        self._image_height = session.image_height
+        self._is_color_camera = session.is_color_camera
+        self._mono_to_color_sdk = session.mono_to_color_sdk
+        self._mono_to_color_processor = session.mono_to_color_processor
+        self._pipeline_queue_size = pipeline_queue_size
+        self.last_scan_setup_time = None
+        self.last_scan_stage_times = None
+        self.last_time_lapse_stats = None
+        self.last_adaptive_stats = None
+        self.last_memory_stats = None
+        # progress callback, cancel event and stage timings of the running scan
+        self._progress = None
+        self._cancel = None
+        self._timings = None
+        # the normalizer of the last calibration file is kept with its cropped regions for the next scans
+        self._image_normalizer = None
+        self._image_normalizer_key = None
  
         
-    def gatherImages(self, output_dir: str, filename: str, calib_filepath:str, is_calib: bool):
+    def configure(self, wavelengths: list, exposure: int):
+        """
+        The function changes the wavelengths and the exposure time of the following scans. The session and the
+        calibration loaded by the previous scan are kept.
+
+        @param wavelengths The wavelengths in nm of the following scans.
+        @param exposure The exposure time in microseconds of the following scans.
         """
-        The function `gatherImages` captures images from a camera and saves them as TIFF files, either
-        with or without applying image normalization.
+        self._wavelengths = wavelengths
+        self._exposure = exposure
+
+    def gatherImages(self, output_dir: str, filename: str, calib_filepath:str, is_calib: bool,
+                     hardware_sequence: bool = False, exposure_schedule: ExposureSchedule = None,
+                     frames_per_wavelength: int = 1, write_std: bool = False, roi: tuple = None, binning=1,
+                     resume: bool = True, sweep_order=None, pass_index: int = 0, progress=None, cancel=None,
+                     raw_bayer: bool = False, compression=None, dark_frames: DarkFrameLibrary = None,
+                     append: bool = False, preview: LivePreview = None, memory_budget=None):
+        """
+        The function `gatherImages` captures images from a camera and saves them as one BigTIFF stack, either
+        with or without applying image normalization. The wavelength and exposure time of every page are stored as
+        JSON in its image description. Color processing, normalization and writing run in
+        worker threads, while the next wavelength is tuned and exposed. The busy time of each stage is stored in
+        `last_scan_stage_times`, next to the summed time per step of the hot path: 'tune' (sending the wavelength),
+        'settle', 'exposure', 'readout' (waiting for the frame), 'copy', 'transform_to_48', 'average',
+        'normalization', 'tiff_write' and 'journal', and the time of the scan setup as 'setup'. While
+        `span_tracer.TRACER` is enabled, every step is recorded as span of the trace as well.
         
         @param output_dir The output directory where the gathered images will be saved.
         @param filename The `filename` parameter is a string that specifies the name of the output file
@@ -105,98 +121,680 @@ class CameraFilterSyncronizer:
         being gathered are for calibration purposes or not. If `is_calib` is `True`, the function will
         perform camera calibration routine and save the images without any normalization. If `is_calib`
         is `False`, the normal image processing using the normalization is applied
+        @param hardware_sequence If True, the wavelengths are uploaded as sequence to the Kurios, whose trigger
+        output has to be connected to the trigger input of the camera. The Kurios then steps through the
+        wavelengths on its internal clock and triggers one exposure per step, so no host round trip is needed per
+        wavelength. The step interval is derived from the exposure and the learned settle times, jump sizes not
+        measured yet take the seed settle time of the `FilterSettler`. If False, every wavelength is tuned and read
+        out by the computer.
+        @param exposure_schedule Optional `ExposureSchedule` with an exposure time per wavelength, replacing the
+        exposure time of the synchronizer. The normalizer rescales every frame to the exposure time of the
+        calibration. It cannot be combined with `hardware_sequence`.
+        @param frames_per_wavelength The number of frames averaged per wavelength. The frames are accumulated into
+        a running mean and variance, so only one frame is held in memory at a time. This applies to the
+        calibration routine as well, to reduce the noise of the flat fields.
+        @param write_std If True and more than one frame is averaged, a page with the standard deviation follows
+        every mean page, marked by `"statistic": "std"` in its metadata and scaled like the mean page.
+        @param roi The region of interest (upper left x, upper left y, lower right x, lower right y) in sensor
+        pixels. Only this part of the sensor is read out, normalized and stored, the matching part of the
+        calibration is cropped automatically. None reads out the full sensor. The region is stored in the page
+        metadata, so a calibration taken with a region can normalize scans of any region inside it.
+        @param binning The number of sensor pixels the camera combines into one image pixel, one number or a tuple
+        (binx, biny). Only monochrome cameras support binning.
+        @param resume If True and a journal `<filename>.journal` of an interrupted scan with the same settings
+        exists, the partial file is validated and the scan continues after the last complete wavelength. The
+        journal records every completed wavelength and is deleted when the scan finishes. If False, an existing
+        file is always replaced.
+        @param sweep_order The order the wavelengths are scanned in, a `SweepOrder` or one of its strategies, e.g.
+        'serpentine', 'nearest_neighbor' or a list of wavelengths. None keeps the order of the synchronizer. The
+        pages are written in scan order, `tiff_stream_writer.read_sorted_stack` sorts them by wavelength.
+        @param pass_index The number of the pass of repeated sweeps, a serpentine order reverses every second pass.
+        @param progress Optional callable receiving a dictionary per event: `{'event': 'frame', ...}` for every
+        captured frame and `{'event': 'wavelength_written', ...}` with the image-wide mean of the (mean) page once
+        all pages of a wavelength are written. It is called from the acquisition and the writer thread, so it has to
+        be thread safe.
+        @param cancel Optional `threading.Event`, which stops the scan before the next frame by raising
+        `ScanCancelledError`. The completed wavelengths stay in the journal.
+        @param raw_bayer If True, a color camera stores the raw mosaic frames instead of running `transform_to_48`,
+        with the color filter pattern and the color matrices in the page metadata. This writes a third of the data
+        and takes the color processing off the acquisition. The frames are normalized by a calibration stored as
+        raw frames as well, and developed to RGB when they are read, see `bayer_demosaic.RawBayerStack`.
+        @param compression None to store the pages uncompressed, 'deflate', 'zstd' or 'lzw', or a `PageCompressor`
+        for other levels and worker counts. The pages are compressed by a pool of worker threads while the next
+        frames are exposed, pages arriving while the workers are busy are stored uncompressed.
+        @param dark_frames Optional `DarkFrameLibrary`. The library is checked for the darks of all exposure times
+        and the readout region at the sensor temperature reported by the camera before the scan starts, a missing
+        dark raises a `ValueError`. The dark of a frame is looked up when it is processed and subtracted in place
+        from the raw frame, before the color processing and the normalization. Calibrations taken with dark subtraction are
+        marked in their metadata, scans normalized with them should subtract the darks as well.
+        @param append If True, the pages are appended to the existing stack of a finished scan instead of replacing
+        it, e.g. to add wavelengths to it. An interrupted append is resumed, or the stack is cut back to the pages it
+        had before.
+        @param preview Optional `LivePreview`, which receives a decimated copy of every raw frame, or of its RGB image
+        for color cameras, for a live view. It runs in the processing thread and never waits for the view.
+        @param memory_budget Optional limit of the memory allocated by the acquisition path, in bytes, as string like
+        '2G' or as `MemoryBudget`. The calibration and the working arrays of the stages are booked first, the frame
+        buffers between the stages get the depth of the pipeline in memory and as many more as fit into the rest.
+        Buffers beyond the budget are spilled to memory-mapped scratch files in the temporary directory, unless a
+        `MemoryBudget` with `spill=False` is given, which lets the capture wait for free buffers instead. A budget
+        too small for the depth of the pipeline raises a `MemoryError` before the image is touched. The use of the budget is stored in `last_memory_stats`.
         """
+        if exposure_schedule is not None and hardware_sequence:
+            raise ValueError('A per wavelength exposure schedule needs software driven scans')
         
-        # delete image if it exists
-        if os.path.exists(output_dir + os.sep + filename):
-            os.remove(output_dir + os.sep + filename)
-            
-                #try to access camera
-        with TLCameraSDK() as sdk:
-            cameras = sdk.discover_available_cameras()
-            if len(cameras) == 0:
-                print("Error: no cameras detected!")
-
-            with sdk.open_camera(cameras[0]) as camera:
-                #  setup the camera for continuous acquisition
-                camera.frames_per_trigger_zero_for_unlimited = 0
-                camera.image_poll_timeout_ms = 20000  # 20 second timeout
-                camera.arm(2)
-                camera.issue_software_trigger()
-                time.sleep(1)
-                #set exposure time
-                camera.exposure_time_us = self._exposure
-                
-                if not is_calib:
-                    image_normalizer = ImageNormalizer(calib_filepath)
-                    for wl in self._wavelengths:
-                        time.sleep(self._exposure*(10e-7)+0.3)
-                        KuriosSetWavelength(self._hdl, wl)
-                        frame = camera.get_pending_frame_or_null()
-                        if frame is None:
-                            raise TimeoutError("Timeout was reached while polling for a frame, program will now exit")
-                        image_data = frame.image_buffer
-                        if self._is_color_camera:
-                            # transform the raw image data into RGB color data
-                            image_data= self._mono_to_color_processor.transform_to_48(image_data, self._image_width, self._image_height).reshape(self._image_height, self._image_width, 3)
-
-                        #gathering images
-                        try:
-                            normalized_image = image_normalizer.normalize_image(wavelength= wl, input_image= image_data)
-                            with tifffile.TiffWriter(output_dir + os.sep + filename, append=True) as tiff:
-                                tiff.save(data= normalized_image, 
-                                        # np.ushort image data array from the camera
-                                        #compression = 'deflate'# amount of compression (0-9), by default it is uncompressed (0)
-                                        )
-                        except Exception as exception:
-                            print(f'Maybe no calibration exists for given exposure time: {exception}')
+        with TRACER.span('begin_scan'):
+            setup_time = self._session.begin_scan(self._exposure, roi, binning)
+        self.last_scan_setup_time = setup_time
+
+        camera = self._session.camera
+        output_path = output_dir + os.sep + filename
+        self._image_width = self._session.image_width
+        self._image_height = self._session.image_height
+        region_metadata = self._session.region_metadata
+        raw_bayer = raw_bayer and self._is_color_camera
+        if raw_bayer:
+            region_metadata = dict(region_metadata, **self._session.raw_bayer_metadata)
+
+        if not is_calib:
+            image_normalizer = self._normalizer(calib_filepath)
+            if self._is_color_camera and raw_bayer != (image_normalizer.cfa_pattern is not None):
+                raise ValueError('Raw Bayer scans need a calibration stored as raw Bayer frames and RGB scans an RGB calibration')
+            image_normalizer.set_region(self._session.roi, self._session.binning,
+                                        shape=(self._image_height, self._image_width))
+            if raw_bayer:
+                # the pages are developed without the color matrices, see `bayer_demosaic.develop`
+                region_metadata = dict(region_metadata, normalized=True)
+            wavelengths = self._wavelengths
+        else:
+            #camera calibration routine
+            image_normalizer = None
+            if self._image_normalizer is not None and os.path.abspath(self._image_normalizer_key[0]) == os.path.abspath(output_path):
+                # the memory-mapped calibration would keep the file from being overwritten
+                self._image_normalizer.close()
+                self._image_normalizer = None
+            wavelengths = np.arange(430, 730 + 1)
+        start_wavelength = self._settler.wavelength
+        if sweep_order is not None:
+            if not isinstance(sweep_order, SweepOrder):
+                sweep_order = SweepOrder(sweep_order, settler=self._settler)
+            wavelengths = sweep_order.order(wavelengths, pass_index, start_wavelength)
+        if exposure_schedule is not None:
+            exposures = [exposure_schedule.exposure(wl) for wl in wavelengths]
+        else:
+            exposures = [self._exposure]*len(wavelengths)
+
+        dark_temperature = self._check_darks(dark_frames, exposures, region_metadata)
+        darks = dark_frames is not None
+        if darks:
+            region_metadata = dict(region_metadata, dark_subtracted=True)
+        if not is_calib and bool(darks) != image_normalizer.dark_subtracted:
+            print(f'Warning: the calibration was taken {"without" if darks else "with"} dark subtraction, unlike this scan')
+
+        compressor = PageCompressor(compression) if isinstance(compression, str) else compression
+
+        # frames are copied once into preallocated buffers and normalized in place, buffers return to their
+        # pool after their last stage
+        frame_shape = (self._image_height, self._image_width, 3) if self._is_color_camera and not raw_bayer else (self._image_height, self._image_width)
+        pages_per_wavelength = 2 if write_std and frames_per_wavelength > 1 else 1
+        buffer_count = self._pipeline_queue_size + 2
+        if compressor is not None:
+            # pages waiting in front of and inside the compressor keep their buffers
+            buffer_count += self._pipeline_queue_size + compressor.max_pending
+        budget = memory_budget
+        if budget is not None and not isinstance(budget, MemoryBudget):
+            budget = MemoryBudget(budget)
+        needs_output_pool = image_normalizer is not None or frames_per_wavelength > 1
+        if budget is None:
+            raw_pool = FrameBufferPool((self._image_height, self._image_width), np.uint16, buffer_count)
+            output_pool = None
+            if needs_output_pool:
+                output_pool = FrameBufferPool(frame_shape, np.uint16, buffer_count*pages_per_wavelength)
+        else:
+            frame_values = int(np.prod(frame_shape))
+            if image_normalizer is not None:
+                budget.reserve('calibration', image_normalizer.nbytes)
+                budget.reserve('normalization_scratch', frame_values*4)
+            if darks:
+                # the masters are memory-mapped, only the scratch and the interpolated darks are held in memory
+                raw_values = self._image_height*self._image_width
+                budget.reserve('dark_frames', raw_values*4*(1 + min(dark_frames.cache_size, len(set(exposures)))))
+            if frames_per_wavelength > 1:
+                budget.reserve('averager', frame_values*4*4)
+            if frame_shape != (self._image_height, self._image_width):
+                # the color processor returns a new RGB array per frame, held until the page is written
+                budget.reserve('rgb_frames', frame_values*2*(1 if needs_output_pool else buffer_count))
+            # the buffers of the queue and the frames in work of every stage stay in memory, scratch files only take
+            # the backlog of the compressor
+            depth = self._pipeline_queue_size + 2
+            requests = [('raw', (self._image_height, self._image_width), np.uint16, buffer_count, 1, depth)]
+            if needs_output_pool:
+                requests.append(('output', frame_shape, np.uint16, buffer_count*pages_per_wavelength,
+                                 pages_per_wavelength, depth*pages_per_wavelength))
+            try:
+                pools = budget.pools_for(requests)
+            except MemoryError:
+                budget.close()
+                if compressor is not None and compressor is not compression:
+                    compressor.close()
+                raise
+            raw_pool = pools['raw']
+            output_pool = pools.get('output')
+        # the journal replaces an existing image, unless an interrupted scan with these settings is continued, the
+        # order may differ after a restart, as it depends on the wavelength the filter starts from
+        journal = ScanJournal(output_path, {'exposures': sorted((int(wl), int(exposure)) for wl, exposure in zip(wavelengths, exposures)),
+                                            'frames_per_wavelength': frames_per_wavelength, 'write_std': write_std,
+                                            'is_calib': is_calib, 'calibration': calib_filepath,
+                                            'region': region_metadata, 'append': append})
+        if append:
+            completed = set(journal.append())
+        elif resume:
+            completed = set(journal.resume())
+        else:
+            journal.reset()
+            completed = set()
+        remaining = [i for i, wl in enumerate(wavelengths) if int(wl) not in completed]
+        wavelengths = [wavelengths[i] for i in remaining]
+        exposures = [exposures[i] for i in remaining]
+
+        scratch = np.empty(frame_shape, dtype=np.float32) if image_normalizer is not None else None
+        dark_scratch = np.empty((self._image_height, self._image_width), dtype=np.float32) if darks else None
+        averager = FrameAverager(frame_shape) if frames_per_wavelength > 1 else None
+        # every key is only updated by one thread
+        timings = dict.fromkeys(('tune', 'settle', 'exposure', 'readout', 'copy', 'transform_to_48', 'average',
+                                 'dark_subtraction', 'normalization', 'compression_wait', 'tiff_write', 'journal'), 0.0)
+
+        def process(item):
+            wl, raw_image, exposure, frame_index = item
+            if darks:
+                with TRACER.span('dark_subtraction', timings, wavelength=int(wl)):
+                    dark = dark_frames.lookup(exposure, raw_image.shape, region_metadata.get('roi'),
+                                              self._session.binning, dark_temperature)
+                    subtract_dark(raw_image, dark, dark_scratch)
+            image_data = raw_image
+            if self._is_color_camera and not raw_bayer:
+                # transform the raw image data into RGB color data
+                with TRACER.span('transform_to_48', timings, wavelength=int(wl)):
+                    image_data= self._mono_to_color_processor.transform_to_48(raw_image, self._image_width, self._image_height).reshape(self._image_height, self._image_width, 3)
+                raw_pool.release(raw_image)
+                raw_image = None
+            if preview is not None:
+                with TRACER.span('preview', wavelength=int(wl)):
+                    preview.publish(image_data, wl, exposure, frame_index, bayer=raw_bayer)
+            if averager is None and image_normalizer is None:
+                # calibration frames are written as they are
+                return wl, exposure, [(image_data, raw_pool if raw_image is not None else None, None)]
+            if averager is not None:
+                with TRACER.span('average', timings, wavelength=int(wl)):
+                    if frame_index == 0:
+                        averager.reset()
+                    averager.add(image_data)
+                if raw_image is not None:
+                    raw_pool.release(raw_image)
+                    raw_image = None
+                if frame_index < frames_per_wavelength - 1:
+                    return None
+                images = [(averager.mean, 'mean')]
+                if write_std:
+                    images.append((averager.std(), 'std'))
+            else:
+                images = [(image_data, None)]
+
+            pages = []
+            try:
+                for image, statistic in images:
+                    output_buffer = output_pool.acquire(pipeline.failed)
+                    if output_buffer is None:
+                        return None
+                    pages.append((output_buffer, output_pool, statistic))
+                    if image_normalizer is None:
+                        with TRACER.span('average', timings, wavelength=int(wl)):
+                            np.rint(image, out=image)
+                            np.copyto(output_buffer, image, casting='unsafe')
+                        continue
+                    try:
+                        with TRACER.span('normalization', timings, wavelength=int(wl)):
+                            normalized_image = image_normalizer.normalize_image(wavelength= wl, input_image= image,
+                                                                                out= output_buffer, scratch= scratch,
+                                                                                exposure= exposure)
+                    except Exception as exception:
+                        print(f'Maybe no calibration exists for given exposure time: {exception}')
+                        normalized_image = None
+                    if normalized_image is None:
+                        for page, pool, _ in pages:
+                            pool.release(page)
+                        return None
+            finally:
+                if raw_image is not None:
+                    raw_pool.release(raw_image)
+            return wl, exposure, pages
+
+        def compress(item):
+            # only hands the pages to the workers, so the write stage receives them as early as possible
+            wl, exposure, pages = item
+            return wl, exposure, pages, [compressor.submit(image_data) for image_data, _, _ in pages]
+
+        def write(item):
+            wl, exposure, pages = item[:3]
+            compressed_pages = item[3] if len(item) > 3 else [None]*len(pages)
+            for (image_data, pool, statistic), compressed in zip(pages, compressed_pages):
+                metadata = {'wavelength': int(wl), 'exposure_us': int(exposure), **region_metadata}
+                if frames_per_wavelength > 1:
+                    metadata['frames'] = frames_per_wavelength
+                    metadata['statistic'] = statistic
+                if compressed is not None:
+                    with TRACER.span('compression_wait', timings, wavelength=int(wl)):
+                        compressed.result()
+                with TRACER.span('tiff_write', timings, wavelength=int(wl)):
+                    writer.write_page(image_data, metadata, compressed=compressed)
+                if progress is not None and statistic != 'std':
+                    page_mean = float(image_data.mean())
+                if pool is not None:
+                    pool.release(image_data)
+            with TRACER.span('journal', timings, wavelength=int(wl)):
+                file_size = writer.file_size
+                journal.record(wl, len(pages), file_size)
+            if progress is not None:
+                progress({'event': 'wavelength_written', 'wavelength': int(wl), 'pages': len(pages),
+                          'bytes_written': file_size, 'completed': len(journal.completed), 'mean': page_mean})
+
+        # normalizing and writing of a frame overlaps with tuning and exposure of the next wavelength
+        scan_start = time.perf_counter()
+        self._progress = progress
+        self._cancel = cancel
+        self._timings = timings
+        stages = [('process', process)] + ([('compress', compress)] if compressor is not None else []) + [('write', write)]
+        try:
+            with StreamingTiffWriter(output_path, append=append or bool(completed)) as writer, \
+                    AcquisitionPipeline(stages, queue_size=self._pipeline_queue_size) as pipeline:
+                if hardware_sequence and len(wavelengths) > 0:
+                    self._capture_hardware_sequence(wavelengths, frames_per_wavelength, pipeline, raw_pool)
                 else:
-                    #camera calibration routine
-                    for wl in np.arange(430, 730 + 1):
-                        time.sleep(self._exposure*(10e-7)+0.3)
-                        KuriosSetWavelength(self._hdl, wl)
-                        frame = camera.get_pending_frame_or_null()
-                        if frame is None:
-                            raise TimeoutError("Timeout was reached while polling for a frame, program will now exit")
-                        image_data = frame.image_buffer
-                        if self._is_color_camera:
-                            # transform the raw image data into RGB color data
-                            image_data= self._mono_to_color_processor.transform_to_48(image_data, self._image_width, self._image_height).reshape(self._image_height, self._image_width, 3)
-
-                        with tifffile.TiffWriter(output_dir + os.sep + filename, append=True) as tiff:
-                                tiff.save(data= image_data,  # np.ushort image data array from the camera
-                                        #compression = 'deflate'# amount of compression (0-9), by default it is uncompressed (0)
-                                        )
-                        
-                        
-                        
-
-              
-                    
+                    self._capture_software(wavelengths, exposures, frames_per_wavelength, pipeline, raw_pool)
+        finally:
+            journal.close()
+            self._progress = None
+            self._cancel = None
+            self._timings = None
+            if compressor is not None and compressor is not compression:
+                compressor.close()
+            if budget is not None:
+                self.last_memory_stats = budget.report()
+                budget.close()
+        journal.finish()
+        self.last_scan_stage_times = dict(self.last_scan_stage_times, **pipeline.stage_times, **timings,
+                                          filter_travel=SweepOrder.travel(wavelengths, start_wavelength),
+                                          setup=setup_time, total=time.perf_counter() - scan_start)
+        if compressor is not None:
+            self.last_scan_stage_times.update(compression=compressor.compress_time, compression_ratio=compressor.ratio,
+                                              uncompressed_pages=compressor.uncompressed_pages)
+
+    def gatherTimeLapse(self, output_dir: str, filename: str, calib_filepath: str, passes: int,
+                        interval: float = 0.0, sweep_order=SERPENTINE, **scan_options) -> list:
+        """
+        The function repeats the sweep over the wavelengths of the synchronizer and writes one stack per pass,
+        named `<filename>_pass_<number>.tif`. With the default serpentine order every second pass runs backwards,
+        so the filter never jumps back over the whole range between two passes. The filter travel, the predicted
+        settle time and the duration of every pass are stored in `last_time_lapse_stats`.
+
+        @param output_dir The output directory of the stacks.
+        @param filename The name of the stacks, a `.tif` ending is replaced by the pass number.
+        @param calib_filepath The path of the calibration file used for normalization.
+        @param passes The number of sweeps.
+        @param interval The time in seconds between the starts of two passes. Passes taking longer start at once.
+        @param sweep_order The order of the wavelengths within the passes, see `gatherImages`.
+        @param scan_options Further keyword arguments passed to `gatherImages`.
+
+        @return the list of the paths of the written stacks.
+        """
+        if not isinstance(sweep_order, SweepOrder):
+            sweep_order = SweepOrder(sweep_order, settler=self._settler)
+        stem = filename[:-4] if filename.endswith('.tif') else filename
+        paths = []
+        self.last_time_lapse_stats = []
+        for pass_index in range(passes):
+            pass_start = time.perf_counter()
+            start_wavelength = self._settler.wavelength
+            ordered = sweep_order.order(self._wavelengths, pass_index, start_wavelength)
+            pass_filename = f'{stem}_pass_{pass_index:04d}.tif'
+            self.gatherImages(output_dir, pass_filename, calib_filepath, is_calib=False, sweep_order=ordered,
+                              pass_index=pass_index, **scan_options)
+            paths.append(output_dir + os.sep + pass_filename)
+            self.last_time_lapse_stats.append({'filter_travel': SweepOrder.travel(ordered, start_wavelength),
+                                               'predicted_settle_time': sweep_order.predicted_settle_time(ordered, start_wavelength),
+                                               'duration': time.perf_counter() - pass_start})
+            if pass_index + 1 < passes:
+                time.sleep(max(interval - (time.perf_counter() - pass_start), 0.0))
+        return paths
+
+    def gatherAdaptive(self, output_dir: str, filename: str, calib_filepath: str, sampler: AdaptiveSampler = None,
+                       max_passes: int = 8, sweep_order=SERPENTINE, **scan_options) -> list:
+        """
+        The function scans the wavelength range of the synchronizer adaptively into one stack: a coarse pass first,
+        then passes adding wavelengths only where the image-wide mean spectrum changes or bends more than the
+        thresholds of the sampler. Every page carries its wavelength in its metadata, `read_sorted_stack` returns
+        the pages sorted. The number of frames and the duration of every pass are stored in
+        `last_adaptive_stats`. The index and the wavelengths of the current pass are saved in
+        `<filename>.adaptive` before every pass, so a rerun of an interrupted scan with the same range and sampler
+        continues with that pass, resuming its pages like `gatherImages`, unless `resume=False` is passed.
+
+        @param output_dir The output directory.
+        @param filename The name of the output file.
+        @param calib_filepath The path of the calibration file used for normalization.
+        @param sampler The `AdaptiveSampler` with the steps and thresholds, the defaults if None.
+        @param max_passes The maximum number of passes, including the coarse one.
+        @param sweep_order The order of the wavelengths within the passes, see `gatherImages`.
+        @param scan_options Further keyword arguments passed to `gatherImages`.
+
+        @return the list of the scanned wavelengths in nm in ascending order.
+        """
+        if sampler is None:
+            sampler = AdaptiveSampler()
+        if not isinstance(sweep_order, SweepOrder):
+            sweep_order = SweepOrder(sweep_order, settler=self._settler)
+        user_progress = scan_options.pop('progress', None)
+        means = {}
+
+        def progress(event):
+            if event['event'] == 'wavelength_written':
+                means[event['wavelength']] = event['mean']
+            if user_progress is not None:
+                user_progress(event)
+
+        output_path = output_dir + os.sep + filename
+        state_path = output_path + '.adaptive'
+        all_wavelengths = self._wavelengths
+        settings = json.loads(json.dumps({'range': [int(min(all_wavelengths)), int(max(all_wavelengths))],
+                                          'sampler': vars(sampler)}))
+        state = None
+        if scan_options.get('resume', True) and os.path.exists(state_path) and os.path.exists(output_path):
+            with open(state_path) as file:
+                state = json.load(file)
+            if state.get('settings') != settings:
+                print('Adaptive scan state belongs to other settings, starting over')
+                state = None
+        if state is not None:
+            first_pass, wavelengths = state['pass'], state['wavelengths']
+            means.update(self._page_means(output_path))
+            print(f'Resuming adaptive scan at pass {first_pass}')
+        else:
+            first_pass, wavelengths = 0, sampler.coarse(min(all_wavelengths), max(all_wavelengths))
+        self.last_adaptive_stats = []
+        try:
+            for pass_index in range(first_pass, max_passes):
+                if not wavelengths:
+                    break
+                pass_start = time.perf_counter()
+                temporary_path = f'{state_path}.{os.getpid()}.tmp'
+                with open(temporary_path, 'w') as file:
+                    json.dump({'settings': settings, 'pass': pass_index,
+                               'wavelengths': [int(wl) for wl in wavelengths]}, file)
+                os.replace(temporary_path, state_path)
+                # a pass which finished before the state of the next one was saved is not repeated
+                finished = (state is not None and pass_index == first_pass and all(wl in means for wl in wavelengths)
+                            and not os.path.exists(output_path + '.journal'))
+                if not finished:
+                    self._wavelengths = wavelengths
+                    self.gatherImages(output_dir, filename, calib_filepath, is_calib=False, append=pass_index > 0,
+                                      sweep_order=sweep_order, pass_index=pass_index, progress=progress,
+                                      **scan_options)
+                missing = [wl for wl in wavelengths if wl not in means]
+                if missing:
+                    # pages of a resumed pass were written before this call
+                    means.update(self._page_means(output_path, missing))
+                self.last_adaptive_stats.append({'pass': pass_index, 'frames': len(wavelengths),
+                                                 'duration': time.perf_counter() - pass_start})
+                sampled = sorted(means)
+                wavelengths = sampler.refine(sampled, [means[wl] for wl in sampled])
+        finally:
+            self._wavelengths = all_wavelengths
+        os.remove(state_path)
+        print(f'Adaptive scan took {len(means)} of {max(all_wavelengths) - min(all_wavelengths) + 1} wavelengths '
+              f'in {len(self.last_adaptive_stats)} passes')
+        return sorted(means)
+
+    @staticmethod
+    def _page_means(path, wavelengths=None):
+        """
+        The function reads the image-wide means of the (mean) pages of some wavelengths of a stack.
+
+        @param path The path of the stack.
+        @param wavelengths The wavelengths in nm, all wavelengths of the stack if None.
+
+        @return a dictionary of the means keyed by the wavelength.
+        """
+        means = {}
+        metadata = read_page_metadata(path)
+        with tifffile.TiffFile(path) as file:
+            for index, page_metadata in enumerate(metadata):
+                wavelength = page_metadata.get('wavelength')
+                wanted = wavelength in wavelengths if wavelengths is not None else wavelength is not None
+                if wanted and page_metadata.get('statistic', 'mean') != 'std':
+                    means[wavelength] = float(file.pages[index].asarray().mean())
+        return means
+
+    def _check_darks(self, dark_frames, exposures, region_metadata):
+        """
+        The function checks that the library has the darks of all exposure times of a scan at the current sensor
+        temperature. The darks are not read yet, each one is looked up when its first frame is processed.
+
+        @param dark_frames The `DarkFrameLibrary`, or None for scans without dark subtraction.
+        @param exposures The exposure times in microseconds of the scan.
+        @param region_metadata The readout region as stored in the page metadata.
+
+        @return the sensor temperature in degC the darks are looked up for, None if the camera reports none and
+        the `temperature` of the library is used.
+        """
+        if dark_frames is None:
+            return None
+        temperature = self._session.sensor_temperature
+        missing = [exposure for exposure in sorted(set(exposures))
+                   if not dark_frames.has_dark(exposure, (self._image_height, self._image_width),
+                                               region_metadata.get('roi'), self._session.binning, temperature)]
+        if missing:
+            raise ValueError(f'No dark frames for the exposure times {missing} us at this readout region and '
+                             f'temperature, take them with `DarkFrameLibrary.acquire`')
+        return temperature
+
+    def _normalizer(self, calib_filepath):
+        """
+        The function returns the image normalizer of a calibration file, loading the file only if it differs from
+        the one of the previous scan or was rewritten since.
+
+        @param calib_filepath The path of the calibration file.
+
+        @return the `ImageNormalizer`.
+        """
+        key = (calib_filepath, os.path.getmtime(calib_filepath) if os.path.exists(calib_filepath) else None)
+        if self._image_normalizer is None or self._image_normalizer_key != key:
+            self._image_normalizer = None
+            self._image_normalizer = ImageNormalizer(calib_filepath)
+            self._image_normalizer_key = key
+        return self._image_normalizer
+
+    def _capture_software(self, wavelengths, exposures, frames_per_wavelength, pipeline, raw_pool):
+        """
+        The function tunes the filter to every wavelength from the computer and submits the frames of every
+        wavelength to the pipeline. The mean time per step spent besides the exposure is stored in the session.
+
+        @param wavelengths The wavelengths in nm.
+        @param exposures The exposure times in microseconds, one per wavelength.
+        @param frames_per_wavelength The number of frames taken per wavelength.
+        @param pipeline The started `AcquisitionPipeline`.
+        @param raw_pool The `FrameBufferPool` the frames are copied into.
+        """
+        camera = self._session.camera
+        capture_start = time.perf_counter()
+        for wl, exposure in zip(wavelengths, exposures):
+            # the new exposure time takes effect while the filter settles
+            self._session.set_exposure(exposure)
+            # wait until the filter reports the new wavelength, then expose at least one full frame
+            settle_time = self._settler.tune(wl)
+            self._timings['tune'] += self._settler.last_command_time
+            self._timings['settle'] += settle_time - self._settler.last_command_time
+            with TRACER.span('exposure', self._timings, exposure_us=int(exposure)):
+                time.sleep(exposure*(10e-7))
+            for frame_index in range(frames_per_wavelength):
+                with TRACER.span('get_pending_frame_or_null', self._timings, 'readout', wavelength=int(wl)):
+                    frame = camera.get_pending_frame_or_null()
+                if frame is None:
+                    raise TimeoutError("Timeout was reached while polling for a frame, program will now exit")
+                self._submit_frame(wl, frame, exposure, frame_index, pipeline, raw_pool)
+        # per frame, so that the overhead compares to the steps of a hardware sequence
+        step_time = (time.perf_counter() - capture_start)/max(len(wavelengths)*frames_per_wavelength, 1)
+        self._session.software_step_overhead = step_time - sum(exposures)*1e-6/max(len(wavelengths), 1)
+        self._session.set_exposure(self._exposure)
+        self.last_scan_stage_times = {'step': step_time}
+
+    def _capture_hardware_sequence(self, wavelengths, frames_per_wavelength, pipeline, raw_pool):
+        """
+        The function uploads the wavelengths as Kurios sequence, switches the camera to hardware triggering and
+        submits the triggered frames to the pipeline. Every wavelength is repeated in the sequence for each of its
+        frames. The step interval covers the settle time, the exposure and the readout time reported by the camera.
+        Every frame is checked against the sequence step it should belong to, a missed trigger raises an error
+        instead of shifting the later frames onto the wrong wavelengths. The host latency per step removed compared
+        to the last software driven scan of the session is stored in `last_scan_stage_times`.
+
+        @param wavelengths The wavelengths in nm.
+        @param frames_per_wavelength The number of frames taken per wavelength.
+        @param pipeline The started `AcquisitionPipeline`.
+        @param raw_pool The `FrameBufferPool` the frames are copied into.
+        """
+        camera = self._session.camera
+        jumps = [abs(int(b) - int(a)) for a, b in zip(wavelengths[:-1], wavelengths[1:])] or [0]
+        # jump sizes not measured yet are expected to take the seed settle time of the settler
+        settle_time = max(self._settler.predict(jump) for jump in jumps)
+        readout_time = self._session.readout_time
+        if readout_time is None:
+            readout_time = 0.03
+            print(f'Warning: the camera reports no readout time, assuming {readout_time*1e3:.0f} ms')
+        interval_ms = KuriosSequencer.step_interval(self._exposure, settle_time, readout_time)
+        # the sequence steps keep the bandwidth chosen for the session
+        bandwidth_mode = self._session.bandwidth_mode if self._session.bandwidth_mode is not None else BANDWIDTH_WIDE
+        sequencer = KuriosSequencer(self._kurios, self._hdl, bandwidth_mode=bandwidth_mode)
+        steps = [(wl, frame_index) for wl in wavelengths for frame_index in range(frames_per_wavelength)]
+        with TRACER.span('KuriosSequenceUpload', steps=len(steps), interval_ms=interval_ms):
+            sequencer.upload([wl for wl, _ in steps], interval_ms)
+        self._session.set_hardware_triggered(True)
+        try:
+            capture_start = sequencer.start()
+            first_frame = None
+            # the sequence loops, so exactly one frame per step is taken before it is stopped
+            for step, (wl, frame_index) in enumerate(steps):
+                # the filter is tuned by the sequence, waiting for the frame includes settling and exposure
+                with TRACER.span('get_pending_frame_or_null', self._timings, 'readout', wavelength=int(wl)):
+                    frame = camera.get_pending_frame_or_null()
+                if frame is None:
+                    raise TimeoutError("Timeout was reached while waiting for a triggered frame, check the trigger connection")
+                if first_frame is None:
+                    first_frame = (frame.frame_count, frame.time_stamp_relative_ns_or_null)
+                frame_step = self._sequence_step_of(frame, first_frame, interval_ms)
+                if frame_step != step:
+                    TRACER.instant('missed_trigger', step=step, frame_step=frame_step)
+                    raise RuntimeError(f'The frame of sequence step {step + 1} ({wl} nm) belongs to step '
+                                       f'{frame_step + 1}, the camera missed a trigger or dropped a frame. The step '
+                                       f'interval of {interval_ms} ms is too short for the frame time of the camera')
+                self._submit_frame(wl, frame, self._exposure, frame_index, pipeline, raw_pool)
+            step_time = (time.perf_counter() - capture_start)/max(len(steps), 1)
+        finally:
+            sequencer.stop()
+            self._session.set_hardware_triggered(False)
+
+        stage_times = {'step': step_time, 'step_interval': interval_ms*1e-3}
+        software_step_overhead = self._session.software_step_overhead
+        if software_step_overhead is not None:
+            removed = software_step_overhead - (step_time - self._exposure*1e-6)
+            if removed > 0:
+                stage_times['host_latency_removed_per_step'] = removed
+                print(f'Hardware sequence removed {removed*1e3:.1f} ms host latency per wavelength')
+            else:
+                # the step interval needed by the filter and the camera is longer than a software step
+                stage_times['host_latency_removed_per_step'] = 0.0
+                print(f'Hardware sequence was {-removed*1e3:.1f} ms per wavelength slower than the software driven '
+                      f'scan, the step interval is limited by settling, exposure and readout')
+        self.last_scan_stage_times = stage_times
+
+    @staticmethod
+    def _sequence_step_of(frame, first_frame, interval_ms):
+        """
+        The function determines the sequence step a triggered frame was exposed at, counted from the first frame of
+        the sequence. The time stamp of the frame is used if the camera provides one, as the frame count does not
+        advance on a missed trigger. The frame count reveals frames dropped by the driver.
+
+        @param frame The frame returned by the camera.
+        @param first_frame The frame count and time stamp in nanoseconds of the first frame of the sequence.
+        @param interval_ms The step interval of the sequence in milliseconds.
+
+        @return the index of the sequence step.
+        """
+        first_count, first_time_stamp = first_frame
+        step = frame.frame_count - first_count
+        time_stamp = getattr(frame, 'time_stamp_relative_ns_or_null', None)
+        if time_stamp is not None and first_time_stamp is not None:
+            # the trigger is delayed by the settling within a step, which differs less than half a step
+            step = max(step, int(round((time_stamp - first_time_stamp)*1e-6/interval_ms)))
+        return step
+
+    def _submit_frame(self, wl, frame, exposure, frame_index, pipeline, raw_pool):
+        """
+        The function copies the image of a frame into a buffer of the pool and submits it to the pipeline. The SDK
+        reuses the frame buffer for the next frame, so the worker threads cannot work on it directly.
+
+        @param wl The wavelength in nm the frame was taken at.
+        @param frame The frame returned by the camera.
+        @param exposure The exposure time in microseconds of the frame.
+        @param frame_index The number of the frame among the frames taken at this wavelength.
+        @param pipeline The started `AcquisitionPipeline`.
+        @param raw_pool The `FrameBufferPool` the frame is copied into.
+        """
+        if self._cancel is not None and self._cancel.is_set():
+            TRACER.instant('scan_cancelled')
+            raise ScanCancelledError('Scan was cancelled')
+        if self._progress is not None:
+            self._progress({'event': 'frame', 'wavelength': int(wl), 'frame_index': frame_index,
+                            'exposure_us': int(exposure), 'frame_count': frame.frame_count,
+                            'timestamp': time.perf_counter()})
+        with TRACER.span('copy', self._timings, wavelength=int(wl)):
+            image_data = raw_pool.copy_in(frame.image_buffer, pipeline.failed)
+        if image_data is None:
+            # the buffers are not released anymore, because a stage failed
+            pipeline.raise_if_failed()
+        pipeline.submit((wl, image_data, exposure, frame_index))
+
+    def preview_exposure_schedule(self, preview_exposure: int, target_fraction: float = 0.8,
+                                  percentile: float = 99.9) -> ExposureSchedule:
+        """
+        The function runs a quick preview pass over the wavelengths of the synchronizer and derives an exposure
+        schedule, which brings the brightest pixels of every wavelength to the same fraction of the sensor range.
+        The exposure time of the synchronizer is used as upper limit.
+
+        @param preview_exposure The exposure time in microseconds of the preview frames, short enough not to
+        saturate any wavelength.
+        @param target_fraction The fraction of the sensor range the brightest pixels should reach.
+        @param percentile The percentile of the preview frame taken as brightest pixel value, to ignore hot pixels.
+
+        @return an `ExposureSchedule` for the wavelengths of the synchronizer.
+        """
+        camera = self._session.camera
+        self._session.begin_scan(preview_exposure)
+        levels = {}
+        for wl in self._wavelengths:
+            self._settler.tune(wl)
+            time.sleep(preview_exposure*(10e-7))
+            frame = camera.get_pending_frame_or_null()
+            if frame is None:
+                raise TimeoutError("Timeout was reached while polling for a frame, program will now exit")
+            levels[wl] = np.percentile(frame.image_buffer, percentile)
+        self._session.set_exposure(self._exposure)
+        return ExposureSchedule.from_preview(levels, preview_exposure, full_scale=2**self._session.bit_depth - 1,
+                                             target_fraction=target_fraction, max_exposure=self._exposure)
+
     def cleanup(self):
         """
-        The function `cleanup` disposes of resources related to a color camera and closes the camera
-        connection.
+        The function `cleanup` disarms the camera, disposes the color processing resources and closes the Kurios
+        handle by closing the acquisition session. Sessions passed in by the caller are left open.
         """
-        if self._is_color_camera:
-            try:
-                self._mono_to_color_processor.dispose()
-            except Exception as exception:
-                print("Unable to dispose mono to color processor: " + str(exception))
-            try:
-                self._mono_to_color_sdk.dispose()
-            except Exception as exception:
-                print("Unable to dispose mono to color sdk: " + str(exception))
-        with TLCameraSDK() as sdk:
-            cameras = sdk.discover_available_cameras()
-            if len(cameras) == 0:
-                print("Error: no cameras detected!")
-
-            with sdk.open_camera(cameras[0]) as camera:
-                if camera:
-                    camera.disarm()  
-                if self._hdl:
-                    KuriosClose(self._hdl) 
+        if self._owns_session:
+            self._session.close()
 
                 
 
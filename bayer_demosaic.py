@@ -0,0 +1,209 @@
+import functools
+import json
+from collections import OrderedDict
+import numpy as np
+import tifffile
+
+
+# Mirrors `thorlabs_tsi_sdk.tl_color_enums.FILTER_ARRAY_PHASE`, the color of the upper left sensor pixel, as the color
+# filter pattern of the 2x2 cell in reading order.
+CFA_PATTERNS = {0: 'RGGB', 1: 'BGGR', 2: 'GRBG', 3: 'GBRG'}
+
+# metadata keys of raw Bayer pages, which do not apply to the demosaiced pages anymore
+RAW_BAYER_KEYS = ('cfa_pattern', 'color_correction_matrix', 'white_balance_matrix', 'bit_depth')
+
+# bilinear interpolation kernels, green has twice as many samples as red and blue
+_KERNELS = {'R': np.array([[1, 2, 1], [2, 4, 2], [1, 2, 1]], dtype=np.float32)/4,
+            'G': np.array([[0, 1, 0], [1, 4, 1], [0, 1, 0]], dtype=np.float32)/4}
+_KERNELS['B'] = _KERNELS['R']
+
+
+def cfa_pattern(color_filter_array_phase: int, x_offset: int = 0, y_offset: int = 0) -> str:
+    """
+    The function returns the color filter pattern of an image read out from a region of the sensor. An odd offset
+    of the region shifts the pattern by one pixel.
+
+    @param color_filter_array_phase The color filter array phase of the camera at the sensor origin.
+    @param x_offset The upper left x of the region in sensor pixels.
+    @param y_offset The upper left y of the region in sensor pixels.
+
+    @return the pattern of the upper left 2x2 cell in reading order, e.g. 'RGGB'.
+    """
+    pattern = CFA_PATTERNS[int(color_filter_array_phase)]
+    if x_offset % 2:
+        pattern = pattern[1] + pattern[0] + pattern[3] + pattern[2]
+    if y_offset % 2:
+        pattern = pattern[2:] + pattern[:2]
+    return pattern
+
+
+@functools.lru_cache(maxsize=8)
+def _channel_weights(pattern, height, width):
+    # per color the sample mask and the summed kernel weights of the samples around every pixel
+    weights = []
+    for color in 'RGB':
+        mask = np.zeros((height, width), dtype=bool)
+        for position, cell_color in enumerate(pattern):
+            if cell_color == color:
+                mask[position // 2::2, position % 2::2] = True
+        weights.append((mask, _convolve3x3(mask.astype(np.float32), _KERNELS[color])))
+    return weights
+
+
+def _convolve3x3(image, kernel):
+    # zero padded, so the border pixels are interpolated from the samples inside the image
+    height, width = image.shape
+    padded = np.pad(image, 1)
+    result = np.zeros((height, width), dtype=np.float32)
+    for dy in range(3):
+        for dx in range(3):
+            if kernel[dy, dx]:
+                result += kernel[dy, dx]*padded[dy:dy + height, dx:dx + width]
+    return result
+
+
+def demosaic(raw: np.ndarray, pattern: str = 'RGGB') -> np.ndarray:
+    """
+    The function interpolates the missing colors of a raw Bayer image bilinearly. The measured samples are kept.
+
+    @param raw The raw image of shape (height, width).
+    @param pattern The color filter pattern of the upper left 2x2 cell, see `cfa_pattern`.
+
+    @return the float32 RGB image of shape (height, width, 3).
+    """
+    raw = np.asarray(raw, dtype=np.float32)
+    height, width = raw.shape
+    rgb = np.empty((height, width, 3), dtype=np.float32)
+    for channel, (mask, weight) in enumerate(_channel_weights(pattern, height, width)):
+        samples = np.where(mask, raw, 0)
+        np.divide(_convolve3x3(samples, _KERNELS['RGB'[channel]]), weight, out=rgb[..., channel])
+        rgb[..., channel][mask] = raw[mask]
+    return rgb
+
+
+def color_correct(rgb: np.ndarray, color_correction_matrix=None, white_balance_matrix=None) -> np.ndarray:
+    """
+    The function applies the white balance and then the color correction matrix of the camera in place, like the
+    mono to color processor of the camera SDK.
+
+    @param rgb The float32 RGB image of shape (height, width, 3).
+    @param color_correction_matrix The 3x3 color correction matrix, flat or nested, None for the identity.
+    @param white_balance_matrix The 3x3 white balance matrix, flat or nested, None for the identity.
+
+    @return the corrected image, the same array as `rgb`.
+    """
+    matrix = np.eye(3, dtype=np.float32)
+    for factor in (white_balance_matrix, color_correction_matrix):
+        if factor is not None:
+            matrix = np.asarray(factor, dtype=np.float32).reshape(3, 3) @ matrix
+    if not np.array_equal(matrix, np.eye(3)):
+        rgb[...] = rgb @ matrix.T
+    return rgb
+
+
+def develop(raw: np.ndarray, metadata: dict) -> np.ndarray:
+    """
+    The function demosaics and color corrects a raw Bayer page with the color information of its metadata. Pages
+    normalized by a calibration, marked by `"normalized": true`, are only demosaiced: the flat field division already
+    balanced every pixel against the white reference, which an RGB scan gets by dividing corrected sample and
+    reference, so the white balance and the color correction must not be applied again.
+
+    @param raw The raw image of shape (height, width).
+    @param metadata The page metadata written by `gatherImages` with `raw_bayer=True`.
+
+    @return the uint16 RGB image of shape (height, width, 3), like the output of `transform_to_48`.
+    """
+    rgb = demosaic(raw, metadata.get('cfa_pattern', 'RGGB'))
+    if not metadata.get('normalized', False):
+        color_correct(rgb, metadata.get('color_correction_matrix'), metadata.get('white_balance_matrix'))
+    np.clip(rgb, 0, 2**16 - 1, out=rgb)
+    return np.rint(rgb, out=rgb).astype(np.uint16)
+
+
+# The `RawBayerStack` class reads a stack of raw Bayer pages, written by `gatherImages` with `raw_bayer=True`, and
+# develops the pages to RGB only when they are accessed. The developed pages are cached, so browsing back and forth
+# through the wavelengths develops every page once.
+class RawBayerStack:
+
+    def __init__(self, file_path: str, cache_size: int = 16) -> None:
+        """
+        The function opens the stack and reads the metadata of its pages.
+
+        @param file_path The path of the TIFF stack.
+        @param cache_size The number of developed pages kept in memory.
+        """
+        self.file_path = file_path
+        self._file = tifffile.TiffFile(file_path)
+        self.metadata = []
+        for page in self._file.pages:
+            try:
+                self.metadata.append(json.loads(page.description))
+            except (ValueError, TypeError):
+                self.metadata.append({})
+        self._cache_size = cache_size
+        self._cache = OrderedDict()
+
+    def __len__(self):
+        return len(self.metadata)
+
+    def __getitem__(self, index: int) -> np.ndarray:
+        return self.page(index)
+
+    def page(self, index: int) -> np.ndarray:
+        """
+        The function returns a page as RGB image. Pages without raw Bayer metadata are returned as stored.
+
+        @param index The index of the page in the stack.
+        """
+        if index in self._cache:
+            self._cache.move_to_end(index)
+            return self._cache[index]
+        image = self._file.pages[index].asarray()
+        if 'cfa_pattern' in self.metadata[index]:
+            image = develop(image, self.metadata[index])
+        self._cache[index] = image
+        if len(self._cache) > self._cache_size:
+            self._cache.popitem(last=False)
+        return image
+
+    def wavelength(self, wavelength: int, statistic: str = 'mean') -> np.ndarray:
+        """
+        The function returns the RGB image of a wavelength.
+
+        @param wavelength The wavelength in nm.
+        @param statistic For stacks of averaged frames, 'mean' or 'std' selects the page.
+        """
+        for index, metadata in enumerate(self.metadata):
+            if metadata.get('wavelength') == wavelength and metadata.get('statistic', 'mean') == statistic:
+                return self.page(index)
+        raise KeyError(f'{self.file_path} has no {statistic} page at {wavelength} nm')
+
+    def export(self, file_path: str) -> str:
+        """
+        The function writes all pages developed to RGB into a new stack, keeping the page order and metadata apart
+        from the raw Bayer information.
+
+        @param file_path The path of the RGB stack.
+
+        @return the path of the written stack.
+        """
+        from tiff_stream_writer import StreamingTiffWriter
+        with StreamingTiffWriter(file_path) as writer:
+            for index, metadata in enumerate(self.metadata):
+                writer.write_page(self.page(index), dict((key, value) for key, value in metadata.items()
+                                                         if key not in RAW_BAYER_KEYS))
+        return file_path
+
+    def close(self):
+        """
+        The function closes the stack file and drops the cached pages.
+        """
+        self._file.close()
+        self._cache.clear()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exception_type, exception_value, exception_traceback):
+        self.close()
+        return False
@@ -0,0 +1,190 @@
+import json
+import os
+import time
+from collections import OrderedDict
+import numpy as np
+from frame_averager import FrameAverager
+
+
+# The `DarkFrameLibrary` class keeps master dark frames on disk, one .npy file per exposure time, sensor temperature
+# and readout region, listed in an index file. The masters are streamed averages of frames taken with the lens
+# covered and are memory-mapped when used, so a library of many large darks costs no memory until it is read.
+# Exposure times between two masters of the same temperature and region are interpolated linearly, as the dark
+# signal is an offset plus a dark current growing with the exposure time. Only the last few interpolated darks are
+# kept in memory.
+class DarkFrameLibrary:
+
+    INDEX_NAME = 'dark_frames.json'
+
+    def __init__(self, directory: str, temperature: float = None, temperature_tolerance: float = 2.0,
+                 cache_size: int = 2) -> None:
+        """
+        The function opens the library in a directory, which is created if it does not exist.
+
+        @param directory The directory of the master darks and the index.
+        @param temperature The sensor temperature in degC used by `acquire` and `lookup` if neither a temperature is
+        given nor the camera reports one. None matches masters of any temperature.
+        @param temperature_tolerance The largest temperature difference in K between the requested temperature and
+        a master used for it.
+        @param cache_size The number of interpolated darks kept in memory.
+        """
+        self.directory = directory
+        self.temperature = temperature
+        self.temperature_tolerance = temperature_tolerance
+        os.makedirs(directory, exist_ok=True)
+        self._index_path = os.path.join(directory, self.INDEX_NAME)
+        self.entries = []
+        if os.path.exists(self._index_path):
+            with open(self._index_path) as file:
+                self.entries = json.load(file)
+        self.cache_size = cache_size
+        # memory maps of the masters keyed by their file, interpolated darks keyed like the lookups
+        self._masters = {}
+        self._cache = OrderedDict()
+
+    def acquire(self, session, exposure: int, frame_count: int = 16, temperature: float = None, roi: tuple = None,
+                binning=1) -> np.ndarray:
+        """
+        The function takes a master dark with the open session and adds it to the library, replacing a master with
+        the same settings. The lens has to be covered. The frames are averaged as they arrive, so only one of them
+        is held in memory.
+
+        @param session The open `AcquisitionSession`.
+        @param exposure The exposure time in microseconds.
+        @param frame_count The number of frames averaged.
+        @param temperature The sensor temperature in degC. If None, the temperature reported by the session is used,
+        or the `temperature` of the library if the camera reports none.
+        @param roi The readout region, see `CameraFilterSyncronizer.gatherImages`.
+        @param binning The binning, see `CameraFilterSyncronizer.gatherImages`.
+
+        @return the memory-mapped master dark, float32 counts.
+        """
+        session.begin_scan(exposure, roi, binning)
+        if temperature is None:
+            temperature = session.sensor_temperature
+        if temperature is None:
+            temperature = self.temperature
+        camera = session.camera
+        averager = FrameAverager((session.image_height, session.image_width))
+        # the first frame may have been exposed before the exposure time changed
+        time.sleep(exposure*1e-6)
+        camera.get_pending_frame_or_null()
+        for _ in range(frame_count):
+            frame = camera.get_pending_frame_or_null()
+            if frame is None:
+                raise TimeoutError("Timeout was reached while polling for a dark frame")
+            averager.add(frame.image_buffer)
+        region = session.region_metadata
+        entry = {'exposure_us': int(exposure), 'temperature': temperature, 'roi': region.get('roi'),
+                 'binning': region.get('binning', [1, 1]), 'shape': list(averager.shape), 'frames': frame_count,
+                 'mean': float(averager.mean.mean()), 'noise': float(averager.std().mean()),
+                 'created': time.strftime('%Y-%m-%dT%H:%M:%S')}
+        roi_name = 'full' if entry['roi'] is None else '_'.join(str(value) for value in entry['roi'])
+        temperature_name = 'any' if temperature is None else f'{temperature:.1f}C'
+        entry['file'] = (f'dark_{exposure}us_{temperature_name}_{roi_name}_'
+                         f'bin{entry["binning"][0]}x{entry["binning"][1]}.npy')
+        np.save(os.path.join(self.directory, entry['file']), averager.mean)
+        self.entries = [other for other in self.entries if other['file'] != entry['file']] + [entry]
+        self._write_index()
+        self._masters = {}
+        self._cache = OrderedDict()
+        return self._load(entry)
+
+    def lookup(self, exposure: int, shape: tuple, roi: tuple = None, binning=1, temperature: float = None):
+        """
+        The function finds the dark of an exposure time for a readout region: the master of the exposure time with
+        the closest temperature, or an interpolation between the masters of the neighbouring exposure times.
+
+        @param exposure The exposure time in microseconds.
+        @param shape The (height, width) of the frames.
+        @param roi The readout region as stored in the page metadata, None for the full sensor.
+        @param binning The binning, one number or a tuple (binx, biny).
+        @param temperature The sensor temperature in degC, `temperature` of the library if None.
+
+        @return the float32 dark in counts, memory-mapped for masters, or None if the library has no matching dark.
+        """
+        temperature = self.temperature if temperature is None else temperature
+        key = (int(exposure), tuple(shape[:2]), None if roi is None else tuple(int(value) for value in roi),
+               (binning, binning) if isinstance(binning, int) else tuple(int(b) for b in binning), temperature)
+        if key in self._cache:
+            self._cache.move_to_end(key)
+            return self._cache[key]
+        masters = self._select(exposure, shape, roi, binning, temperature)
+        if masters is None:
+            return None
+        if len(masters) == 1:
+            return self._load(masters[0][0])
+        (low, low_weight), (high, high_weight) = masters
+        dark = self._load(low)*np.float32(low_weight)
+        dark += self._load(high)*np.float32(high_weight)
+        self._cache[key] = dark
+        if len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+        return dark
+
+    def has_dark(self, exposure: int, shape: tuple, roi: tuple = None, binning=1, temperature: float = None) -> bool:
+        """
+        The function checks whether `lookup` finds a dark, without reading or interpolating it.
+
+        @param exposure The exposure time in microseconds.
+        @param shape The (height, width) of the frames.
+        @param roi The readout region as stored in the page metadata, None for the full sensor.
+        @param binning The binning, one number or a tuple (binx, biny).
+        @param temperature The sensor temperature in degC, `temperature` of the library if None.
+        """
+        temperature = self.temperature if temperature is None else temperature
+        return self._select(exposure, shape, roi, binning, temperature) is not None
+
+    def _select(self, exposure, shape, roi, binning, temperature):
+        # the masters a dark is made of with their weights, None if the library has no matching dark
+        binning = [binning, binning] if isinstance(binning, int) else [int(b) for b in binning]
+        roi = None if roi is None else [int(value) for value in roi]
+        candidates = [entry for entry in self.entries
+                      if entry['roi'] == roi and entry['binning'] == binning and tuple(entry['shape']) == tuple(shape[:2])
+                      and (temperature is None or entry['temperature'] is None
+                           or abs(entry['temperature'] - temperature) <= self.temperature_tolerance)]
+        # per exposure time the master with the closest temperature
+        closest = {}
+        for entry in candidates:
+            distance = 0.0 if temperature is None or entry['temperature'] is None else abs(entry['temperature'] - temperature)
+            if entry['exposure_us'] not in closest or distance < closest[entry['exposure_us']][0]:
+                closest[entry['exposure_us']] = (distance, entry)
+        if int(exposure) in closest:
+            return [(closest[int(exposure)][1], 1.0)]
+        shorter = [value for value in closest if value < exposure]
+        longer = [value for value in closest if value > exposure]
+        if not shorter or not longer:
+            return None
+        low, high = closest[max(shorter)][1], closest[min(longer)][1]
+        weight = (exposure - low['exposure_us'])/(high['exposure_us'] - low['exposure_us'])
+        return [(low, 1 - weight), (high, weight)]
+
+    def _load(self, entry):
+        if entry['file'] not in self._masters:
+            self._masters[entry['file']] = np.load(os.path.join(self.directory, entry['file']), mmap_mode='r')
+        return self._masters[entry['file']]
+
+    def _write_index(self):
+        # written to a temporary file first, so an interrupted write keeps the previous index
+        temporary_path = self._index_path + '.tmp'
+        with open(temporary_path, 'w') as file:
+            json.dump(self.entries, file, indent=1)
+        os.replace(temporary_path, self._index_path)
+
+
+def subtract_dark(frame: np.ndarray, dark: np.ndarray, scratch: np.ndarray) -> np.ndarray:
+    """
+    The function subtracts a dark from a raw frame in place, rounding to counts and clipping at 0 instead of
+    wrapping around. The dark is read directly, so memory-mapped masters are not copied.
+
+    @param frame The uint16 raw frame.
+    @param dark The float32 dark in counts, of the shape of the frame, as returned by `DarkFrameLibrary.lookup`.
+    @param scratch A float32 array of the shape of the frame for the intermediate result.
+
+    @return the frame.
+    """
+    np.subtract(frame, dark, out=scratch)
+    np.maximum(scratch, 0, out=scratch)
+    np.rint(scratch, out=scratch)
+    np.copyto(frame, scratch, casting='unsafe')
+    return frame
@@ -0,0 +1,80 @@
+import numpy as np
+import pandas as pd
+
+
+# The `ExposureSchedule` class assigns an exposure time to every wavelength of a scan, so that bright bands of the
+# Kurios range are exposed shorter than the dim ones instead of all bands using the exposure of the dimmest band.
+class ExposureSchedule:
+
+    def __init__(self, exposures: dict) -> None:
+        """
+        The function initializes the schedule from a dictionary.
+
+        @param exposures Dictionary mapping the wavelength in nm to the exposure time in microseconds.
+        """
+        self._exposures = dict((int(wl), int(exposure)) for wl, exposure in exposures.items())
+
+    def exposure(self, wavelength: int) -> int:
+        """
+        The function returns the exposure time of a wavelength.
+
+        @param wavelength The wavelength in nm.
+
+        @return the exposure time in microseconds.
+        """
+        return self._exposures[int(wavelength)]
+
+    def total_exposure(self, wavelengths: list) -> float:
+        """
+        The function returns the summed exposure time of a scan over the given wavelengths in seconds.
+        """
+        return sum(self.exposure(wl) for wl in wavelengths)*1e-6
+
+    def as_dict(self) -> dict:
+        return dict(self._exposures)
+
+    @classmethod
+    def from_power_calibration(cls, csv_path: str, wavelengths: list, reference_exposure: int,
+                               min_exposure: int = 1000):
+        """
+        The function derives a schedule from a power calibration file written by `PowerCalibrator.calibrate`. The
+        reference exposure is used for the wavelength with the lowest power, all other wavelengths are exposed
+        shorter in proportion to their power.
+
+        @param csv_path The path of the calibration file, e.g. `PowerCalibrationFiles/Calib_x10.csv`.
+        @param wavelengths The wavelengths in nm of the scan.
+        @param reference_exposure The exposure time in microseconds for the dimmest wavelength.
+        @param min_exposure The shortest exposure time in microseconds used.
+
+        @return an `ExposureSchedule`.
+        """
+        calibration = pd.read_csv(csv_path)
+        power = np.interp(np.asarray(wavelengths, dtype=float), calibration["wavelengths"],
+                          calibration["power_meas"])
+        exposures = reference_exposure*power.min()/power
+        exposures = np.clip(exposures, min_exposure, reference_exposure)
+        return cls(dict(zip(wavelengths, exposures)))
+
+    @classmethod
+    def from_preview(cls, preview_levels: dict, preview_exposure: int, full_scale: int,
+                     target_fraction: float = 0.8, min_exposure: int = 1000, max_exposure: int = None):
+        """
+        The function derives a schedule from a quick preview pass, so that the brightest pixels of every wavelength
+        reach the same fraction of the full scale of the sensor.
+
+        @param preview_levels Dictionary mapping the wavelength in nm to a high percentile of the preview frame.
+        @param preview_exposure The exposure time in microseconds of the preview frames.
+        @param full_scale The largest pixel value of the sensor, e.g. 2**bit_depth - 1.
+        @param target_fraction The fraction of the full scale the brightest pixels should reach.
+        @param min_exposure The shortest exposure time in microseconds used.
+        @param max_exposure The longest exposure time in microseconds used, unlimited if None.
+
+        @return an `ExposureSchedule`.
+        """
+        exposures = {}
+        for wl, level in preview_levels.items():
+            exposure = preview_exposure*target_fraction*full_scale/max(float(level), 1.0)
+            if max_exposure is not None:
+                exposure = min(exposure, max_exposure)
+            exposures[wl] = max(exposure, min_exposure)
+        return cls(exposures)
@@ -0,0 +1,146 @@
+import time
+from span_tracer import TRACER
+
+
+# The `FilterSettler` class tunes the Kurios filter and waits until the filter reports the new wavelength, instead of
+# sleeping for a fixed time. The status only tells that the controller is ready and the wavelength query echoes the
+# set point, so the report can come before the liquid crystals settled. Every tuning therefore waits at least a
+# minimum settle time and the expected settle time of the jump. Only settle times the filter was seen taking, by
+# reporting the old wavelength or being busy first, are collected per jump size, so that the expected settle time of
+# the next jump can be slept in one piece. Jump sizes without such a measurement wait the former fixed settle time.
+class FilterSettler:
+
+    def __init__(self, kurios, hdl, poll_interval: float = 0.005, timeout: float = 5.0, bucket_size: int = 10,
+                 margin: float = 0.0, min_settle_time: float = 0.1, seed_settle_time: float = 0.3) -> None:
+        """
+        The function initializes the settler for an opened Kurios device.
+
+        @param kurios Object providing the functions of `Sensor_lib.KURIOS_COMMAND_LIB`.
+        @param hdl The handle of the opened Kurios device.
+        @param poll_interval The time in seconds between two status requests.
+        @param timeout The time in seconds after which waiting for the filter raises a `TimeoutError`.
+        @param bucket_size The width in nm of the jump size classes of the settle model.
+        @param margin Additional time in seconds waited after the filter reported to be tuned.
+        @param min_settle_time The shortest time in seconds waited after setting a wavelength, the former fixed
+        wait, however early the filter reports to be tuned.
+        @param seed_settle_time The settle time in seconds expected for jump sizes which were not measured yet, the
+        former fixed wait.
+        """
+        self._kurios = kurios
+        self._hdl = hdl
+        self._poll_interval = poll_interval
+        self._timeout = timeout
+        self._bucket_size = bucket_size
+        self._margin = margin
+        self.min_settle_time = min_settle_time
+        self.seed_settle_time = seed_settle_time
+        self._wavelength = None
+        # jump size class -> [number of measurements, mean settle time in seconds]
+        self.settle_model = {}
+        self.last_settle_time = 0.0
+        self.last_command_time = 0.0
+
+    def reconnect(self, hdl):
+        """
+        The function uses a new handle of the Kurios device, keeping the learned settle model.
+
+        @param hdl The handle of the reopened Kurios device.
+        """
+        self._hdl = hdl
+        self._wavelength = None
+
+    @property
+    def wavelength(self) -> int:
+        """
+        The wavelength in nm the filter was last tuned to, None before the first tuning.
+        """
+        return self._wavelength
+
+    def predict(self, jump: int) -> float:
+        """
+        The function returns the expected settle time for a wavelength jump, based on the measurements of the same
+        jump size class. Unknown classes are expected to take the seed settle time, or as long as the slowest smaller
+        class, so the expectation does not drop for larger jumps.
+
+        @param jump The absolute wavelength difference in nm.
+
+        @return the expected settle time in seconds.
+        """
+        if jump == 0:
+            return 0.0
+        bucket = jump // self._bucket_size
+        if bucket in self.settle_model:
+            return self.settle_model[bucket][1]
+        return max([self.seed_settle_time] + [mean for b, (_, mean) in self.settle_model.items() if b < bucket])
+
+    def learn(self, jump: int, settle_time: float):
+        """
+        The function adds a measured settle time to the settle model, replacing the seed settle time of its jump
+        size class. Times found otherwise, e.g. from the stability of consecutive frames, can be added as well.
+
+        @param jump The absolute wavelength difference in nm.
+        @param settle_time The time in seconds the filter took to settle.
+        """
+        bucket = jump // self._bucket_size
+        count, mean = self.settle_model.get(bucket, [0, 0.0])
+        self.settle_model[bucket] = [count + 1, mean + (settle_time - mean)/(count + 1)]
+
+    def is_tuned(self, wavelength: int) -> bool:
+        """
+        The function asks the filter whether it is ready and tuned to the given wavelength.
+
+        @param wavelength The wavelength in nm the filter should be tuned to.
+
+        @return True if the filter reports the status ready (2) and the given wavelength.
+        """
+        status = [0]
+        current = [0]
+        self._kurios.KuriosGetStatus(self._hdl, status)
+        self._kurios.KuriosGetWavelength(self._hdl, current)
+        return status[0] == 2 and current[0] == int(wavelength)
+
+    def tune(self, wavelength: int) -> float:
+        """
+        The function sets the filter to the given wavelength and blocks until it reports to be tuned, but at least for
+        the minimum settle time and the expected settle time of the jump. The time until the filter reported to be
+        tuned is added to the settle model if the filter was seen settling, i.e. at least one poll failed, otherwise
+        the time only bounds the settle time from above and the lower bounds waited would feed back into the model.
+        The part of the settle time spent sending the command is kept in `last_command_time`.
+
+        @param wavelength The wavelength in nm.
+
+        @return the settle time in seconds.
+        """
+        if self._wavelength is None:
+            current = [0]
+            self._kurios.KuriosGetWavelength(self._hdl, current)
+            self._wavelength = current[0]
+        jump = abs(int(wavelength) - int(self._wavelength))
+
+        start = time.perf_counter()
+        with TRACER.span('KuriosSetWavelength', wavelength=int(wavelength)):
+            self._kurios.KuriosSetWavelength(self._hdl, int(wavelength))
+        self.last_command_time = time.perf_counter() - start
+        expected = self.predict(jump)
+        measured = jump // self._bucket_size in self.settle_model
+        with TRACER.span('settle', jump=jump):
+            if measured:
+                # most of the expected time is slept at once, to keep the serial line free
+                time.sleep(0.8*expected)
+            failed_polls = 0
+            while not self.is_tuned(wavelength):
+                if time.perf_counter() - start > self._timeout:
+                    raise TimeoutError(f'Kurios did not settle at {wavelength} nm within {self._timeout} s')
+                failed_polls += 1
+                time.sleep(self._poll_interval)
+            reported_time = time.perf_counter() - start
+            # the poll alone is not trusted, the minimum and the expected settle time are lower bounds
+            time.sleep(max(max(expected, self.min_settle_time) - (time.perf_counter() - start), 0.0))
+        settle_time = time.perf_counter() - start
+        time.sleep(self._margin)
+
+        if jump and failed_polls:
+            self.learn(jump, reported_time)
+        self._wavelength = int(wavelength)
+        self.last_settle_time = settle_time
+        return settle_time
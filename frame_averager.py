@@ -0,0 +1,62 @@
+import numpy as np
+
+
+# The `FrameAverager` class accumulates the frames taken at one wavelength into a running mean and variance
+# (Welford's algorithm) in preallocated float32 buffers, so averaging many frames never holds more than one of them.
+class FrameAverager:
+
+    def __init__(self, shape: tuple) -> None:
+        """
+        The function allocates the accumulation buffers.
+
+        @param shape The shape of the frames, (height, width) for mono and (height, width, 3) for color frames.
+        """
+        self.shape = tuple(shape)
+        self._mean = np.zeros(self.shape, dtype=np.float32)
+        self._m2 = np.zeros(self.shape, dtype=np.float32)
+        self._delta = np.empty(self.shape, dtype=np.float32)
+        self._delta2 = np.empty(self.shape, dtype=np.float32)
+        self.count = 0
+
+    def reset(self):
+        """
+        The function starts a new average.
+        """
+        self._mean.fill(0)
+        self._m2.fill(0)
+        self.count = 0
+
+    def add(self, frame: np.ndarray):
+        """
+        The function adds a frame to the running mean and variance.
+
+        @param frame The frame of the shape given at construction.
+        """
+        self.count += 1
+        np.subtract(frame, self._mean, out=self._delta)
+        np.multiply(self._delta, 1.0/self.count, out=self._delta2)
+        np.add(self._mean, self._delta2, out=self._mean)
+        np.subtract(frame, self._mean, out=self._delta2)
+        np.multiply(self._delta, self._delta2, out=self._delta)
+        np.add(self._m2, self._delta, out=self._m2)
+
+    @property
+    def mean(self) -> np.ndarray:
+        """
+        The running mean. The array is overwritten by the next `add` or `reset`.
+        """
+        return self._mean
+
+    def std(self, out: np.ndarray = None) -> np.ndarray:
+        """
+        The function returns the sample standard deviation of the added frames, 0 for a single frame.
+
+        @param out Optional float32 array receiving the result, the internal scratch buffer is used otherwise, which
+        is overwritten by the next `add`.
+
+        @return the standard deviation per pixel.
+        """
+        if out is None:
+            out = self._delta
+        np.divide(self._m2, max(self.count - 1, 1), out=out)
+        return np.sqrt(out, out=out)
@@ -0,0 +1,143 @@
+import atexit
+import os
+import queue
+import tempfile
+import threading
+import time
+import numpy as np
+
+
+# The `FrameBufferPool` class holds a fixed number of preallocated image buffers of one shape and data type. Frames are
+# copied into a buffer of the pool once and processed in place, so a running acquisition does not allocate memory per
+# frame. A buffer is handed back with `release` once its last stage is done with it. Buffers beyond the memory share
+# of the pool can be spilled to a memory-mapped scratch file, they are only handed out while all buffers in memory
+# are in use.
+class FrameBufferPool:
+
+    def __init__(self, shape: tuple, dtype, count: int, spill_count: int = 0, spill_dir: str = None) -> None:
+        """
+        The function allocates the buffers of the pool.
+
+        @param shape The shape of every buffer.
+        @param dtype The numpy data type of every buffer.
+        @param count The number of buffers. If all buffers are in use, `acquire` blocks until one is released.
+        @param spill_count The number of the buffers kept in a memory-mapped scratch file instead of memory.
+        @param spill_dir The directory of the scratch file, the temporary directory if None.
+        """
+        self.shape = tuple(shape)
+        self.dtype = np.dtype(dtype)
+        self.count = count
+        self.spill_count = min(spill_count, count)
+        self.spill_path = None
+        self._spill = None
+        self._free = queue.PriorityQueue()
+        # buffer id -> index, the buffers in memory have the lowest indices and are taken first
+        self._index = {}
+        for index in range(count - self.spill_count):
+            self._add(index, np.empty(self.shape, dtype=self.dtype))
+        if self.spill_count:
+            file_descriptor, self.spill_path = tempfile.mkstemp(prefix='frame_spill_', suffix='.bin', dir=spill_dir)
+            os.close(file_descriptor)
+            self._spill = np.memmap(self.spill_path, dtype=self.dtype, mode='w+', shape=(self.spill_count,) + self.shape)
+            for index in range(self.spill_count):
+                self._add(count - self.spill_count + index, self._spill[index])
+        self._lock = threading.Lock()
+        self.in_use = 0
+        self.peak_in_use = 0
+        self.spilled_frames = 0
+        self.wait_time = 0.0
+
+    def _add(self, index, buffer):
+        self._index[id(buffer)] = index
+        self._free.put((index, buffer))
+
+    @property
+    def buffer_nbytes(self) -> int:
+        """
+        The size of one buffer in bytes.
+        """
+        return int(np.prod(self.shape))*self.dtype.itemsize
+
+    @property
+    def nbytes(self) -> int:
+        """
+        The memory held by the buffers of the pool in bytes, without the spilled buffers.
+        """
+        return (self.count - self.spill_count)*self.buffer_nbytes
+
+    def acquire(self, abort: threading.Event = None) -> np.ndarray:
+        """
+        The function takes a free buffer from the pool, waiting until one is released if necessary.
+
+        @param abort Event which stops the waiting, e.g. when the stage which should release the buffers failed.
+
+        @return a buffer with undefined content, or None if the waiting was aborted.
+        """
+        try:
+            index, buffer = self._free.get_nowait()
+        except queue.Empty:
+            start = time.perf_counter()
+            while True:
+                try:
+                    index, buffer = self._free.get(timeout=0.1)
+                    break
+                except queue.Empty:
+                    if abort is not None and abort.is_set():
+                        self.wait_time += time.perf_counter() - start
+                        return None
+            self.wait_time += time.perf_counter() - start
+        with self._lock:
+            self.in_use += 1
+            self.peak_in_use = max(self.peak_in_use, self.in_use)
+            if index >= self.count - self.spill_count:
+                self.spilled_frames += 1
+        return buffer
+
+    def release(self, buffer: np.ndarray):
+        """
+        The function returns a buffer of the pool for reuse.
+
+        @param buffer The buffer obtained by `acquire`.
+        """
+        with self._lock:
+            self.in_use -= 1
+        self._free.put((self._index[id(buffer)], buffer))
+
+    def copy_in(self, image, abort: threading.Event = None) -> np.ndarray:
+        """
+        The function acquires a buffer and copies the image into it.
+
+        @param image Array like image of the shape of the pool, e.g. the temporary `image_buffer` of a frame.
+        @param abort Event which stops the waiting for a free buffer.
+
+        @return the filled buffer, or None if the waiting was aborted.
+        """
+        buffer = self.acquire(abort)
+        if buffer is not None:
+            np.copyto(buffer, np.asarray(image).reshape(self.shape), casting='unsafe')
+        return buffer
+
+    def close(self):
+        """
+        The function deletes the scratch file of the spilled buffers. The pool must not be used afterwards. The
+        file is unmapped when the last buffer referencing it is dropped, Windows refuses to delete it before. If a
+        caller still holds a spilled buffer, the file is deleted when the program exits instead.
+        """
+        if self._spill is None:
+            return
+        # drop the references of the pool to the mapping, so it is closed if no buffer is used anymore
+        while not self._free.empty():
+            self._free.get_nowait()
+        self._index = {}
+        self._spill = None
+        try:
+            os.remove(self.spill_path)
+        except OSError:
+            atexit.register(_remove_scratch_file, self.spill_path)
+
+
+def _remove_scratch_file(path):
+    try:
+        os.remove(path)
+    except OSError as exception:
+        print(f'Unable to remove scratch file {path}: {exception}')
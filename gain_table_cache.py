@@ -0,0 +1,90 @@
+import os
+import numpy as np
+
+
+# gain stored for calibration pixels of 0 counts, large enough that every lit pixel saturates instead of producing
+# NaN, small enough that the product stays finite
+_MAX_GAIN = np.float32(2**16)
+
+
+def compute_gain(calib_image: np.ndarray, scale: float = 2**8) -> np.ndarray:
+    """
+    The function computes the gain table of a calibration image, the factor normalizing a frame pixel by pixel.
+
+    @param calib_image The calibration image of one wavelength.
+    @param scale The value a pixel as bright as the calibration is normalized to.
+
+    @return the float32 gain `scale/calib_image`, with 65536 where the calibration is 0.
+    """
+    calib_image = np.asarray(calib_image, dtype=np.float32)
+    gain = np.full(calib_image.shape, _MAX_GAIN, dtype=np.float32)
+    np.divide(np.float32(scale), calib_image, out=gain, where=calib_image > 0)
+    return gain
+
+
+# The `GainTableCache` class keeps the gain tables of a calibration file as .npy files in a directory next to it,
+# `<calibration file>.gains`, one file per wavelength named after the size and the modification time of the
+# calibration file. Hashing the content instead would read a calibration of several GB before the first frame of a
+# scan is normalized. The tables are computed when a wavelength is normalized for the first time and memory-mapped
+# afterwards, also by later sessions. Rewriting the calibration file changes its key, the tables of the old content
+# are deleted when the first new table is stored.
+class GainTableCache:
+
+    def __init__(self, calibration_file_path: str, directory: str = None) -> None:
+        """
+        The function initializes the cache and reads the key of the calibration file.
+
+        @param calibration_file_path The path of the calibration file.
+        @param directory The directory of the tables, `<calibration file>.gains` if None.
+        """
+        self.calibration_file_path = calibration_file_path
+        self.directory = directory if directory is not None else calibration_file_path + '.gains'
+        stat = os.stat(calibration_file_path)
+        self.file_key = f'{stat.st_size:x}-{stat.st_mtime_ns:x}'
+        self._stale_removed = False
+        # tables kept in memory if the directory is not writable
+        self._memory = {}
+        self.hits = 0
+        self.misses = 0
+
+    def _remove_stale_tables(self):
+        self._stale_removed = True
+        try:
+            for name in os.listdir(self.directory):
+                # tables of a previous content of the calibration file
+                if name.endswith('.npy') and not name.startswith(self.file_key + '_'):
+                    os.remove(os.path.join(self.directory, name))
+        except OSError as exception:
+            print(f'Warning: old gain tables of {self.calibration_file_path} are not deleted: {exception}')
+
+    def gain(self, wavelength: int, load_calibration, scale: float = 2**8) -> np.ndarray:
+        """
+        The function returns the gain table of a wavelength, computing and storing it if it is not cached yet.
+
+        @param wavelength The wavelength in nm.
+        @param load_calibration Callable returning the calibration image of the wavelength.
+        @param scale The value a pixel as bright as the calibration is normalized to.
+
+        @return the read-only float32 gain table, memory-mapped unless the directory is not writable.
+        """
+        if wavelength in self._memory:
+            self.hits += 1
+            return self._memory[wavelength]
+        path = os.path.join(self.directory, f'{self.file_key}_{int(wavelength)}nm_{scale:g}.npy')
+        if os.path.exists(path):
+            self.hits += 1
+            return np.load(path, mmap_mode='r')
+        self.misses += 1
+        gain = compute_gain(load_calibration(), scale)
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            if not self._stale_removed:
+                self._remove_stale_tables()
+            temporary_path = f'{path[:-4]}_{os.getpid()}.tmp.npy'
+            np.save(temporary_path, gain)
+            os.replace(temporary_path, path)
+        except OSError as exception:
+            print(f'Warning: gain table of {wavelength} nm is not stored: {exception}')
+            self._memory[wavelength] = gain
+            return gain
+        return np.load(path, mmap_mode='r')
@@ -1,30 +1,195 @@
-import pandas as pd
+import json
 import numpy as np
 import tifffile as tif
+from gain_table_cache import GainTableCache, compute_gain
 
 
 class ImageNormalizer:
-    def __init__(self, calibration_file_path):
+    def __init__(self, calibration_file_path, calibration_exposure=None, roi=None, binning=1, cache_gains=True):
         """
-        The function initializes an Image Normalizer using a calibration file path, which is then stored as
-        a dictionary.
+        The function initializes an Image Normalizer using a calibration file path. Only the page headers are read,
+        the gain table `256/calibration` of a wavelength is computed from the memory-mapped calibration image, or the
+        decoded one if the page is compressed, when the wavelength is normalized for the first time.
         
         @param calibration_file_path The `calibration_file_path` parameter is a string that represents the
         file path of the calibration file. This file is expected to contain data for the whole spectrum
         covered by Kurios, which ranges from 430nm to 730nm.
+        @param calibration_exposure The exposure time in microseconds the calibration was taken with. It is only
+        used for pages without the exposure time in their metadata, which calibrations written before per page
+        metadata existed lack.
+        @param roi The region of interest of the images to normalize, see `set_region`. None uses the calibration
+        as it was taken.
+        @param binning The binning of the images to normalize, see `set_region`.
+        @param cache_gains If True, the gain tables of the full calibration are stored next to the calibration file
+        by a `GainTableCache` and memory-mapped from there, also by later sessions. Otherwise they are computed in
+        memory.
         """
+        self._calibration_file_path = calibration_file_path
+        self._calib_exposures = {}
+        # wavelength -> (page index, data offset or None for compressed pages, shape, dtype) of the calibration
+        self._calib_pages = {}
+        self._calib_shape = None
+        self._gain_cache = GainTableCache(calibration_file_path) if cache_gains else None
+        # gain tables of the full calibration loaded so far, keyed by the wavelength
+        self._full_gain = {}
+        # the selected region and the gain tables of the regions loaded so far, keyed by the region
+        self._region = None
+        self._region_cache = {}
+        # origin in sensor pixels and binning the calibration was taken with
+        self._calib_origin = (0, 0)
+        self._calib_binning = (1, 1)
+        # color filter pattern of calibrations stored as raw Bayer frames, None otherwise
+        self.cfa_pattern = None
+        # True if the darks were subtracted from the calibration frames
+        self.dark_subtracted = False
         try:
             with tif.TiffFile(calibration_file_path) as file:
-                # Lesen aller Seiten (Bilder) des TIFFs
-                calib_raw = [page.asarray() for page in file.pages]
+                # Lesen aller Seitenköpfe des TIFFs, standard deviation pages of averaged calibrations are skipped
+                pages = [(index, page) for index, page in enumerate(file.pages)
+                         if self._page_metadata(page).get('statistic') != 'std']
+                calib_layout = [(index, page.dataoffsets[0] if page.is_memmappable else None, page.shape,
+                                 np.dtype(file.byteorder + page.dtype.char)) for index, page in pages]
+                calib_exposures = [self._page_exposure(page, calibration_exposure) for _, page in pages]
+                calib_wavelengths = [self._page_metadata(page).get('wavelength') for _, page in pages]
+                region = self._page_metadata(pages[0][1])
+            self._calib_origin = tuple(region.get('roi', [0, 0])[:2])
+            self._calib_binning = tuple(region.get('binning', [1, 1]))
+            self.cfa_pattern = region.get('cfa_pattern')
+            self.dark_subtracted = bool(region.get('dark_subtracted', False))
             #calib_raw = tif.imread(calibration_file_path)
-            #assume calib file always contains whole spectrum covered by Kurios
-            calib = dict([(x+430, calib_raw[x]) for x in range(301)])
-            self._calib = calib
+            #assume calib file always contains whole spectrum covered by Kurios, pages with the wavelength in their
+            #metadata may be in any order
+            if None in calib_wavelengths and len(calib_layout) >= 301:
+                calib_wavelengths = [x+430 for x in range(301)]
+            if sorted(calib_wavelengths)[:301] != list(range(430, 731)):
+                raise ValueError('calibration does not cover 430nm-730nm')
+            self._calib_pages = dict(zip(calib_wavelengths, calib_layout))
+            self._calib_shape = calib_layout[0][2]
+            self._calib_exposures = dict(zip(calib_wavelengths, calib_exposures))
         except Exception:
             print('Calibration File not found does not match expected wavelengths (430nm-730nm)!')
+        if roi is not None or binning != 1:
+            self.set_region(roi, binning)
+
+    def set_region(self, roi=None, binning=1, shape=None):
+        """
+        The function selects the part of the calibration matching images read out from a region of interest of the
+        sensor, optionally binned. The gain tables are cropped to the region, or computed from the calibration images
+        summed like the binning of the camera sums them, when a wavelength is normalized for the first time. The
+        tables of the regions are cached, so switching between them is free.
+
+        @param roi The region of interest as (upper left x, upper left y, lower right x, lower right y) in sensor
+        pixels, as returned by the `roi` of the camera. None selects the calibration as it was taken.
+        @param binning The number of sensor pixels combined into one image pixel, either one number for both
+        directions or a tuple (binx, biny). It has to be a multiple of the binning of the calibration.
+        @param shape The (height, width) of the images read out from the region. If None, it is derived from the
+        region, with the lower right corner being exclusive.
+        """
+        binning = (binning, binning) if isinstance(binning, int) else tuple(int(b) for b in binning)
+        if roi is None and binning == self._calib_binning:
+            self._region = None
+            return
+        if roi is None:
+            roi = self._calib_origin + self._calib_extent()
+        roi = tuple(int(value) for value in roi)
+        if shape is None:
+            shape = ((roi[3] - roi[1])//binning[1], (roi[2] - roi[0])//binning[0])
+        key = (roi[:2], binning, tuple(shape[:2]))
+        if key not in self._region_cache:
+            # the region has to fit the calibration, which is checked before the first frame arrives
+            self._crop_and_bin(np.empty(self._calib_shape[:2] + (0,), dtype=np.float32), roi, binning, shape)
+            self._region_cache[key] = {}
+        self._region = (key, roi, binning, shape)
+
+    def _calibration(self, wavelength):
+        # the full calibration image of a wavelength, memory-mapped if the page is not compressed
+        page_index, offset, shape, dtype = self._calib_pages[wavelength]
+        if offset is not None:
+            return np.memmap(self._calibration_file_path, dtype=dtype, mode='r', offset=offset, shape=shape)
+        with tif.TiffFile(self._calibration_file_path) as file:
+            return file.pages[page_index].asarray()
+
+    def _full_gain_table(self, wavelength):
+        if wavelength not in self._full_gain:
+            if self._gain_cache is not None:
+                self._full_gain[wavelength] = self._gain_cache.gain(wavelength, lambda: self._calibration(wavelength))
+            else:
+                self._full_gain[wavelength] = compute_gain(self._calibration(wavelength))
+        return self._full_gain[wavelength]
+
+    def _gain(self, wavelength):
+        # the gain table of a wavelength for the selected region, loaded on first use
+        if self._region is None:
+            return self._full_gain_table(wavelength)
+        key, roi, binning, shape = self._region
+        region = self._region_cache[key]
+        if wavelength not in region:
+            if binning == self._calib_binning:
+                # a view of the gain table of the full calibration
+                region[wavelength] = self._crop_and_bin(self._full_gain_table(wavelength), roi, binning, shape)
+            else:
+                region[wavelength] = compute_gain(self._crop_and_bin(self._calibration(wavelength), roi, binning,
+                                                                     shape))
+        return region[wavelength]
+
+    def close(self):
+        """
+        The function drops the loaded gain tables, which unmaps the gain table files, so they can be replaced.
+        Further normalizations load the tables again.
+        """
+        self._full_gain = {}
+        self._region_cache = dict((key, {}) for key in self._region_cache)
+
+    @property
+    def nbytes(self) -> int:
+        """
+        The memory held by the gain tables in bytes. Memory-mapped tables are not counted, their pages belong to
+        the file cache of the operating system.
+        """
+        images = list(self._full_gain.values()) + [image for region in self._region_cache.values()
+                                                   for image in region.values()]
+        # memory maps, crops and views of other images have a base
+        return sum(image.nbytes for image in images if image.base is None)
+
+    def _calib_extent(self):
+        # lower right corner of the calibration in sensor pixels
+        height, width = self._calib_shape[:2]
+        return (self._calib_origin[0] + width*self._calib_binning[0],
+                self._calib_origin[1] + height*self._calib_binning[1])
+
+    def _crop_and_bin(self, image, roi, binning, shape):
+        factors = []
+        offsets = []
+        for axis in range(2):
+            offset = roi[axis] - self._calib_origin[axis]
+            calib_binning = self._calib_binning[axis]
+            if offset < 0 or offset % calib_binning or binning[axis] % calib_binning:
+                raise ValueError(f'Region {roi} with binning {binning} does not fit the pixel grid of the calibration')
+            factors.append(binning[axis]//calib_binning)
+            offsets.append(offset//calib_binning)
+        height, width = shape[:2]
+        crop = image[offsets[1]:offsets[1] + height*factors[1], offsets[0]:offsets[0] + width*factors[0]]
+        if crop.shape[0] != height*factors[1] or crop.shape[1] != width*factors[0]:
+            raise ValueError(f'Region {roi} exceeds the calibration')
+        if factors == [1, 1]:
+            # a view, the full calibration is not copied
+            return crop
+        binned = crop.reshape((height, factors[1], width, factors[0]) + crop.shape[2:])
+        return binned.sum(axis=(1, 3), dtype=np.float32)
     
-    def normalize_image(self, wavelength, input_image):
+    @staticmethod
+    def _page_metadata(page):
+        try:
+            metadata = json.loads(page.description)
+        except (ValueError, TypeError):
+            return {}
+        return metadata if isinstance(metadata, dict) else {}
+
+    @classmethod
+    def _page_exposure(cls, page, default):
+        return cls._page_metadata(page).get('exposure_us', default)
+
+    def normalize_image(self, wavelength, input_image, out=None, scratch=None, exposure=None):
         """
         The `normalize_image` function takes a wavelength and an input image, and returns the normalized
         image by dividing the input image by the calibration image for that wavelength.
@@ -32,18 +197,37 @@ class ImageNormalizer:
         @param wavelength The wavelength parameter represents the wavelength of the image being normalized.
         @param input_image The input image is the image that you want to normalize. It is the image that you
         want to divide by the calibration image.
+        @param out Optional uint16 array of the shape of the input image, which receives the normalized image, so
+        that no output array is allocated.
+        @param scratch Optional float32 array of the shape of the input image, used for the intermediate result
+        when `out` is given.
+        @param exposure The exposure time in microseconds of the input image. If it and the exposure time of the
+        calibration are known, the input image is rescaled to the exposure time of the calibration, so that frames
+        taken with a per wavelength exposure schedule stay comparable.
         
-        @return the normalized image, which is obtained by dividing the input image by the calibration image
-        for the given wavelength and then multiplying it by the maximum 8bit value. To allow relative intensity greater than 100%, each pixel is saved as 16bit integer.
+        @return the normalized image, which is obtained by multiplying the input image with the precomputed gain
+        table `256/calibration` of the wavelength, i.e. dividing it by the calibration image and multiplying it by the
+        maximum 8bit value. To allow relative intensity greater than 100%, each pixel is saved as 16bit integer,
+        pixels beyond the 16 bit range saturate at 65535.
         """
-        calib_image = self._calib[wavelength]
+        gain = self._gain(wavelength)
+        factor = 1
+        calib_exposure = self._calib_exposures.get(wavelength)
+        if exposure is not None and calib_exposure is not None:
+            factor = calib_exposure/exposure
         try:
-            output_image = (input_image/calib_image*2**8).astype(np.uint16)
-            
-            if output_image.max() > 2**16:
-                raise OverflowError('Image Input per pixel channel is larger than 16 bit! Check normalization Files!')
+            if out is None:
+                result = np.multiply(input_image, gain, dtype=np.float32)
             else:
-                return output_image
+                result = scratch if scratch is not None else np.empty(out.shape, dtype=np.float32)
+                np.multiply(input_image, gain, out=result)
+            if factor != 1:
+                np.multiply(result, factor, out=result)
+            np.clip(result, 0, 2**16 - 1, out=result)
+            if out is None:
+                return result.astype(np.uint16)
+            np.copyto(out, result, casting='unsafe')
+            return out
         except Exception as e:
             print(f'cannot normalize image, maybe wrong format: {e}')
             
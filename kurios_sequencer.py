@@ -0,0 +1,87 @@
+import math
+import time
+
+
+# output modes of the Kurios, see `KuriosSetOutputMode`
+MANUAL_MODE = 1
+SEQUENCE_INTERNAL_CLOCK_MODE = 2
+# bandwidth modes of the Kurios, see `KuriosSetBandwidthMode`
+BANDWIDTH_WIDE = 2
+BANDWIDTH_MEDIUM = 4
+BANDWIDTH_NARROW = 8
+
+
+# The `KuriosSequencer` class uploads a list of wavelengths as sequence to the Kurios, which then steps through it on
+# its internal clock. With the trigger output of the Kurios connected to the trigger input of the camera, every step
+# exposes one frame without a round trip to the computer. The trigger output is high while the filter switches to
+# the next wavelength, so with the flipped signal mode the rising edge starts the exposure once the filter settled.
+class KuriosSequencer:
+
+    def __init__(self, kurios, hdl, bandwidth_mode: int = BANDWIDTH_WIDE, trigger_out_signal_mode: int = 1) -> None:
+        """
+        The function initializes the sequencer for an opened Kurios device.
+
+        @param kurios Object providing the functions of `Sensor_lib.KURIOS_COMMAND_LIB`.
+        @param hdl The handle of the opened Kurios device.
+        @param bandwidth_mode The bandwidth mode of all sequence steps (2 = WIDE, 4 = MEDIUM, 8 = NARROW).
+        @param trigger_out_signal_mode The polarity of the trigger output (0 = normal, 1 = flipped).
+        """
+        self._kurios = kurios
+        self._hdl = hdl
+        self._bandwidth_mode = bandwidth_mode
+        self._trigger_out_signal_mode = trigger_out_signal_mode
+        self.step_interval_ms = None
+        self.length = 0
+
+    @staticmethod
+    def step_interval(exposure: int, settle_time: float, readout_time: float) -> int:
+        """
+        The function computes the duration of a sequence step, which has to cover the settling of the filter, the
+        exposure and the readout of the frame. A step shorter than that makes the camera miss the next trigger.
+
+        @param exposure The exposure time in microseconds.
+        @param settle_time The expected settle time of the filter in seconds.
+        @param readout_time The time in seconds the camera needs to read out a frame before the next trigger, see
+        `AcquisitionSession.readout_time`.
+
+        @return the step interval in milliseconds, limited to the range of 1 ms to 60000 ms the Kurios accepts.
+        """
+        interval_ms = int(math.ceil((exposure*1e-6 + settle_time + readout_time)*1e3))
+        return min(max(interval_ms, 1), 60000)
+
+    def upload(self, wavelengths: list, interval_ms: int):
+        """
+        The function replaces the sequence stored on the Kurios by the given wavelengths.
+
+        @param wavelengths The wavelengths in nm in the order they are stepped through.
+        @param interval_ms The duration of each step in milliseconds.
+        """
+        if not 1 <= interval_ms <= 60000:
+            raise ValueError(f'Sequence step interval must be between 1 ms and 60000 ms, got {interval_ms} ms')
+        self._kurios.KuriosSetOutputMode(self._hdl, MANUAL_MODE)
+        # index 0 deletes the whole sequence
+        self._kurios.KuriosSetDeleteSequenceStep(self._hdl, 0)
+        for index, wl in enumerate(wavelengths):
+            result = self._kurios.KuriosSetInsertSequenceStep(self._hdl, index + 1, int(wl), interval_ms,
+                                                              self._bandwidth_mode)
+            if result < 0:
+                raise RuntimeError(f'Uploading sequence step {index + 1} ({wl} nm) failed: {result}')
+        self._kurios.KuriosSetTriggerOutSignalMode(self._hdl, self._trigger_out_signal_mode)
+        self.step_interval_ms = interval_ms
+        self.length = len(wavelengths)
+
+    def start(self) -> float:
+        """
+        The function starts the uploaded sequence on the internal clock of the Kurios.
+
+        @return the start time as `time.perf_counter` value.
+        """
+        start = time.perf_counter()
+        self._kurios.KuriosSetOutputMode(self._hdl, SEQUENCE_INTERNAL_CLOCK_MODE)
+        return start
+
+    def stop(self):
+        """
+        The function stops the sequence by switching the Kurios back to manual control.
+        """
+        self._kurios.KuriosSetOutputMode(self._hdl, MANUAL_MODE)
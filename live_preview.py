@@ -0,0 +1,119 @@
+import threading
+import time
+import numpy as np
+
+
+# The `PreviewFrame` class is one preview published by a `LivePreview`: the decimated frame and where it was taken.
+# The stretched 8 bit image is computed when it is first requested, by the consumer instead of the acquisition.
+class PreviewFrame:
+
+    def __init__(self, image: np.ndarray, wavelength: int, exposure: int, frame_index: int, step: int,
+                 percentiles: tuple) -> None:
+        self.image = image
+        self.wavelength = wavelength
+        self.exposure = exposure
+        self.frame_index = frame_index
+        self.step = step
+        self.timestamp = time.perf_counter()
+        self._percentiles = percentiles
+        self._stretched = None
+        self.limits = None
+
+    def stretched(self) -> np.ndarray:
+        """
+        The function maps the frame linearly from its lower to its upper percentile onto 0 to 255, so faint and
+        bright samples are both visible independent of the exposure.
+
+        @return the uint8 image, (height, width) for mono and (height, width, 3) for color frames.
+        """
+        if self._stretched is None:
+            low, high = np.percentile(self.image, self._percentiles)
+            scale = 255.0/(high - low) if high > low else 0.0
+            stretched = (self.image.astype(np.float32) - np.float32(low))*np.float32(scale)
+            np.clip(stretched, 0, 255, out=stretched)
+            self._stretched = stretched.astype(np.uint8)
+            self.limits = (float(low), float(high))
+        return self._stretched
+
+    def to_pnm(self) -> bytes:
+        """
+        The function encodes the stretched image as binary PGM or PPM, which `tk.PhotoImage` reads directly.
+        """
+        image = self.stretched()
+        magic = b'P6' if image.ndim == 3 else b'P5'
+        return magic + f'\n{image.shape[1]} {image.shape[0]}\n255\n'.encode() + image.tobytes()
+
+
+# The `LivePreview` class is the side channel from the acquisition to a live view. The acquisition publishes every
+# frame, of which a decimated copy of at most `max_size` pixels per side is kept, taking every n-th pixel without
+# filtering. Only the latest preview is held: a new one replaces the previous one, if the view has not picked it up
+# yet, so a slow or missing view never blocks the acquisition and never builds up a backlog.
+class LivePreview:
+
+    def __init__(self, max_size: int = 512, percentiles: tuple = (0.5, 99.5), min_interval: float = 0.05) -> None:
+        """
+        The function initializes an empty preview channel.
+
+        @param max_size The longest side in pixels of the decimated frames.
+        @param percentiles The lower and upper percentile mapped to black and white in the stretched preview.
+        @param min_interval The shortest time in seconds between two kept frames, frames published faster are
+        skipped without being copied.
+        """
+        self.max_size = max_size
+        self.percentiles = percentiles
+        self.min_interval = min_interval
+        self._condition = threading.Condition()
+        self._latest = None
+        self._sequence = 0
+        # sequence number of the latest preview taken by a view
+        self._taken = 0
+        self._last_publish = 0.0
+        self.published = 0
+        self.dropped = 0
+
+    def publish(self, image: np.ndarray, wavelength: int, exposure: int = None, frame_index: int = 0,
+                bayer: bool = False):
+        """
+        The function keeps a decimated copy of a frame as latest preview. The frame can be reused right afterwards.
+
+        @param image The frame, 2D for mono or raw Bayer and 3D (height, width, 3) for color frames.
+        @param wavelength The wavelength in nm of the frame.
+        @param exposure The exposure time in microseconds of the frame.
+        @param frame_index The number of the frame at this wavelength.
+        @param bayer If True, the frame is a raw Bayer mosaic, which is decimated by an even step, so all preview
+        pixels show the same color of the filter array instead of a checkerboard.
+        """
+        now = time.perf_counter()
+        if now - self._last_publish < self.min_interval:
+            return
+        self._last_publish = now
+        step = max(-(-max(image.shape[:2]) // self.max_size), 1)
+        if bayer and step % 2:
+            step += 1
+        decimated = np.array(image[::step, ::step])
+        with self._condition:
+            if self._taken < self._sequence:
+                # the previous preview is replaced before a view took it
+                self.dropped += 1
+            self._sequence += 1
+            self._latest = PreviewFrame(decimated, int(wavelength), exposure, frame_index, step, self.percentiles)
+            self.published += 1
+            self._condition.notify_all()
+
+    def latest(self, after: int = 0, timeout: float = None):
+        """
+        The function returns the latest preview.
+
+        @param after The sequence number of the preview the caller already has, only a newer one is returned.
+        @param timeout The time in seconds to wait for a newer preview, 0 to return immediately and None to wait
+        without limit.
+
+        @return a tuple of the sequence number and the `PreviewFrame`, or None if no newer preview arrived in time.
+        """
+        with self._condition:
+            if timeout != 0:
+                self._condition.wait_for(lambda: self._sequence > after, timeout)
+            if self._sequence <= after:
+                return None
+            self._taken = self._sequence
+            return self._sequence, self._latest
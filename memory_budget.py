@@ -0,0 +1,153 @@
+import re
+import numpy as np
+from frame_buffer_pool import FrameBufferPool
+
+
+# multipliers of the size suffixes accepted by `parse_size`
+_SIZE_UNITS = {'': 1, 'K': 2**10, 'M': 2**20, 'G': 2**30, 'T': 2**40}
+
+
+def parse_size(size) -> int:
+    """
+    The function converts a memory size to bytes.
+
+    @param size The size as number of bytes or as string with a binary unit, e.g. '512M' or '1.5 GB'.
+
+    @return the size in bytes.
+    """
+    if isinstance(size, str):
+        match = re.fullmatch(r'\s*([0-9.]+)\s*([KMGT]?)I?B?\s*', size.upper())
+        if match is None:
+            raise ValueError(f'Cannot read the memory size {size!r}, use e.g. 512M or 2GB')
+        return int(float(match.group(1))*_SIZE_UNITS[match.group(2)])
+    return int(size)
+
+
+# The `MemoryBudget` class limits the memory the acquisition path of a scan allocates: the frame buffers in the
+# queues between the pipeline stages and the working arrays of the stages. The working arrays are reserved first,
+# the frame buffer pools then get the buffers covering the depth of the pipeline in memory and as many more as fit
+# into the rest of the budget. Missing buffers are either spilled to memory-mapped scratch files, whose pages the
+# operating system writes back to disk instead of swapping, or left out, so that capturing waits for the writer to
+# release a buffer. A budget which cannot hold the depth of the pipeline is refused.
+class MemoryBudget:
+
+    def __init__(self, limit, spill: bool = True, spill_dir: str = None) -> None:
+        """
+        The function initializes an empty budget.
+
+        @param limit The largest number of bytes allocated, a number or a string like '2G', see `parse_size`.
+        @param spill If True, buffers beyond the budget are kept in scratch files, otherwise the pools get fewer
+        buffers and the capture waits for free ones.
+        @param spill_dir The directory of the scratch files, the temporary directory if None. Files which cannot be
+        deleted after the scan, because a buffer is still mapped, are deleted when the program exits.
+        """
+        self.limit = parse_size(limit)
+        self.spill = spill
+        self.spill_dir = spill_dir
+        self.reservations = {}
+        self.pools = {}
+
+    @property
+    def allocated(self) -> int:
+        """
+        The bytes in memory reserved for working arrays and held by the buffers of the pools.
+        """
+        return sum(self.reservations.values()) + sum(pool.nbytes for pool in self.pools.values())
+
+    @property
+    def available(self) -> int:
+        """
+        The bytes of the budget which are not allocated yet.
+        """
+        return max(self.limit - self.allocated, 0)
+
+    def reserve(self, name: str, nbytes: int):
+        """
+        The function books the memory of a working array, which is allocated besides the pools. Exceeding the
+        budget only prints a warning, once per scan, as the array is needed anyway.
+
+        @param name The name of the array in the report.
+        @param nbytes The size of the array in bytes.
+        """
+        was_within = self.allocated <= self.limit
+        self.reservations[name] = self.reservations.get(name, 0) + int(nbytes)
+        if was_within and self.allocated > self.limit:
+            print(f'Warning: the working arrays of the scan need {self.allocated/2**20:.0f} MiB, more than the memory '
+                  f'budget of {self.limit/2**20:.0f} MiB')
+
+    def pool(self, name: str, shape: tuple, dtype, count: int, minimum: int = 1, depth: int = None) -> FrameBufferPool:
+        """
+        The function creates a frame buffer pool within the rest of the budget, see `pools_for`.
+
+        @param name The name of the pool in the report.
+        @param shape The shape of every buffer.
+        @param dtype The numpy data type of every buffer.
+        @param count The number of buffers the pool should have.
+        @param minimum The number of buffers the pool needs at least.
+        @param depth The number of buffers the pipeline stage fed by the pool holds while it keeps up, which have to
+        fit into the budget. `minimum` if None.
+
+        @return the pool, with up to `count` buffers.
+        """
+        return self.pools_for([(name, shape, dtype, count, minimum, depth)])[name]
+
+    def pools_for(self, requests: list) -> dict:
+        """
+        The function creates several frame buffer pools sharing the rest of the budget. Every pool first gets its
+        depth of buffers in memory, so that frames only go through the scratch files when the stages fall behind.
+        The remaining budget is then handed out in the order of the requests, the buffers which do not fit are
+        spilled or left out. A budget whose rest cannot hold the depth of every pool raises a `MemoryError`.
+
+        @param requests List of tuples (name, shape, dtype, count, minimum, depth), see `pool`.
+
+        @return a dictionary of the pools keyed by their names.
+        """
+        in_memory = {}
+        buffer_nbytes = {}
+        for name, shape, dtype, count, minimum, depth in requests:
+            in_memory[name] = min(minimum if depth is None else max(depth, minimum), count)
+            buffer_nbytes[name] = int(np.prod(shape))*np.dtype(dtype).itemsize
+        needed = self.allocated + sum(buffer_nbytes[name]*in_memory[name] for name in in_memory)
+        if needed > self.limit:
+            raise MemoryError(f'The memory budget of {self.limit/2**20:.1f} MiB cannot hold the depth of the pipeline, '
+                              f'which needs {needed/2**20:.1f} MiB with the working arrays of the scan')
+        available = self.limit - needed
+        for name, _, _, count, _, _ in requests:
+            extra = count - in_memory[name]
+            if buffer_nbytes[name]:
+                extra = min(extra, available//buffer_nbytes[name])
+            in_memory[name] += extra
+            available -= extra*buffer_nbytes[name]
+        pools = {}
+        for name, shape, dtype, count, _, _ in requests:
+            if self.spill:
+                pool = FrameBufferPool(shape, dtype, count, spill_count=count - in_memory[name], spill_dir=self.spill_dir)
+            else:
+                pool = FrameBufferPool(shape, dtype, in_memory[name])
+            self.pools[name] = pool
+            pools[name] = pool
+        return pools
+
+    def close(self):
+        """
+        The function deletes the scratch files of the pools and forgets all allocations, so the budget can be used
+        for the next scan.
+        """
+        for pool in self.pools.values():
+            pool.close()
+        self.pools = {}
+        self.reservations = {}
+
+    def report(self) -> dict:
+        """
+        The function summarizes the use of the budget.
+
+        @return a dictionary with the limit and the allocated bytes, the bytes of the working arrays and per pool
+        the number of buffers in memory and spilled, the peak of the buffers in use, the number of frames which
+        were stored in spilled buffers and the time in seconds spent waiting for a free buffer.
+        """
+        return {'limit': self.limit, 'allocated': self.allocated, 'reservations': dict(self.reservations),
+                'pools': dict((name, {'buffers': pool.count - pool.spill_count, 'spilled_buffers': pool.spill_count,
+                                      'buffer_bytes': pool.buffer_nbytes, 'peak_in_use': pool.peak_in_use,
+                                      'spilled_frames': pool.spilled_frames, 'wait_time': pool.wait_time})
+                              for name, pool in self.pools.items())}
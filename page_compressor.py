@@ -0,0 +1,148 @@
+import os
+import threading
+import time
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+try:
+    import imagecodecs
+except ImportError as ex:
+    print("Warning:",ex)
+    imagecodecs = None
+
+
+# compression method -> TIFF compression name used by tifffile
+COMPRESSION_METHODS = {'deflate': 'zlib', 'zstd': 'zstd', 'lzw': 'lzw'}
+# levels used if none is given, fast ones to keep up with the acquisition, LZW has no level
+DEFAULT_LEVELS = {'deflate': 1, 'zstd': 3, 'lzw': None}
+# largest default number of pages waiting for compression, each one keeps a frame buffer of the scan, the strips of
+# a single page already keep all workers busy
+DEFAULT_MAX_PENDING = 4
+
+
+# The `CompressedPage` class is the handle of a page submitted to a `PageCompressor`. The strips of the page are
+# compressed by the workers, `result` waits for all of them.
+class CompressedPage:
+
+    def __init__(self, futures: list, compression: str, predictor: bool, rows_per_strip: int) -> None:
+        self._futures = futures
+        self.compression = compression
+        self.predictor = predictor
+        self.rows_per_strip = rows_per_strip
+
+    def result(self):
+        """
+        The function waits until all strips of the page are compressed.
+
+        @return the page itself, with the compressed strips in `strips`.
+        """
+        self.strips = [future.result() for future in self._futures]
+        return self
+
+
+# The `PageCompressor` class compresses the pages of a scan strip by strip in a pool of worker threads, while the
+# next frames are exposed. The pages are written in order by the single writer of the scan, which waits for the
+# strips of the next page only. zlib and the codecs of imagecodecs release the GIL, so the workers run in parallel.
+# If the workers fall behind, the following pages are stored uncompressed instead of stalling the scan.
+class PageCompressor:
+
+    def __init__(self, method: str = 'deflate', level: int = None, workers: int = None, rows_per_strip: int = 64,
+                 predictor: bool = True, max_pending: int = None) -> None:
+        """
+        The function starts the worker pool.
+
+        @param method 'deflate', 'zstd' or 'lzw'. zstd and LZW need the imagecodecs package, which tifffile uses to
+        read them as well.
+        @param level The compression level, None for the default of the method. LZW has no level.
+        @param workers The number of worker threads, by default one less than the number of CPUs.
+        @param rows_per_strip The number of image rows compressed as one strip, the unit of work of the workers.
+        @param predictor If True, the horizontal differencing predictor of TIFF is applied before compressing,
+        which compresses smooth images far better.
+        @param max_pending The number of pages allowed to wait for compression, further pages are stored
+        uncompressed. By default twice the number of workers, but at most `DEFAULT_MAX_PENDING`.
+        """
+        if method not in COMPRESSION_METHODS:
+            raise ValueError(f'Unknown compression method {method}, use one of {", ".join(COMPRESSION_METHODS)}')
+        if method != 'deflate' and imagecodecs is None:
+            raise ValueError(f'{method} compression needs the imagecodecs package')
+        self.method = method
+        self.level = DEFAULT_LEVELS[method] if level is None else level
+        self.workers = workers if workers is not None else max((os.cpu_count() or 2) - 1, 1)
+        self.rows_per_strip = rows_per_strip
+        self.predictor = predictor
+        self.max_pending = max_pending if max_pending is not None else min(2*self.workers, DEFAULT_MAX_PENDING)
+        self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='page-compressor')
+        self._lock = threading.Lock()
+        self._pending = 0
+        self.page_count = 0
+        self.uncompressed_pages = 0
+        self.raw_bytes = 0
+        self.compressed_bytes = 0
+        self.compress_time = 0.0
+
+    def submit(self, image: np.ndarray):
+        """
+        The function hands the strips of a page to the workers. The image must not change until the page is
+        written.
+
+        @param image The page, 2D for mono and 3D (height, width, 3) for color images.
+
+        @return a `CompressedPage`, or None if too many pages wait for compression and the page has to be stored
+        uncompressed.
+        """
+        with self._lock:
+            if self._pending >= self.max_pending:
+                self.uncompressed_pages += 1
+                return None
+            self._pending += 1
+        remaining = [len(range(0, image.shape[0], self.rows_per_strip))]
+        futures = [self._executor.submit(self._compress_strip, image[row:row + self.rows_per_strip], remaining)
+                   for row in range(0, image.shape[0], self.rows_per_strip)]
+        return CompressedPage(futures, COMPRESSION_METHODS[self.method], self.predictor, self.rows_per_strip)
+
+    def _compress_strip(self, strip, remaining):
+        start = time.perf_counter()
+        try:
+            if self.predictor:
+                # difference to the previous pixel of the row, per color channel, wrapping like the TIFF predictor
+                delta = strip.copy()
+                np.subtract(strip[:, 1:], strip[:, :-1], out=delta[:, 1:])
+                strip = delta
+            data = np.ascontiguousarray(strip).tobytes()
+            if self.method == 'deflate':
+                compressed = zlib.compress(data, self.level)
+            elif self.method == 'zstd':
+                compressed = imagecodecs.zstd_encode(data, level=self.level)
+            else:
+                compressed = imagecodecs.lzw_encode(data)
+        finally:
+            with self._lock:
+                remaining[0] -= 1
+                if remaining[0] == 0:
+                    self._pending -= 1
+                    self.page_count += 1
+                self.compress_time += time.perf_counter() - start
+        with self._lock:
+            self.raw_bytes += len(data)
+            self.compressed_bytes += len(compressed)
+        return compressed
+
+    @property
+    def ratio(self) -> float:
+        """
+        The ratio of the uncompressed to the compressed size of the pages compressed so far.
+        """
+        return self.raw_bytes/self.compressed_bytes if self.compressed_bytes else 1.0
+
+    def close(self):
+        """
+        The function waits for the submitted strips and stops the workers.
+        """
+        self._executor.shutdown(wait=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exception_type, exception_value, exception_traceback):
+        self.close()
+        return False
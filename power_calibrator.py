@@ -3,50 +3,72 @@ import pandas as pd
 import numpy as np
 import os
 try:
-    from Sensor_lib.KURIOS_COMMAND_LIB import *
+    from Sensor_lib import KURIOS_COMMAND_LIB
 except OSError as ex:
     print("Warning:",ex)
+    KURIOS_COMMAND_LIB = None
 from datetime import datetime
 from ctypes import cdll,c_long, c_ulong, c_uint32,byref,create_string_buffer,c_bool,c_char_p,c_int,c_int16,c_double, sizeof, c_voidp
 from Sensor_lib.TLPM import TLPM
 import time
 from ThorlabsPM100 import ThorlabsPM100, USBTMC
 
-import pyvisa
-from ThorlabsPM100 import ThorlabsPM100
+try:
+    import pyvisa
+except ImportError as ex:
+    print("Warning:",ex)
+    pyvisa = None
+from filter_settle import FilterSettler
+from span_tracer import TRACER
 
 
 class PowerCalibrator:
-    def __init__(self) -> None:
+    def __init__(self, kurios=None, power_meter_instrument=None, min_settle_time: float = 0.1,
+                 seed_settle_time: float = 0.3) -> None:
         """
         The above function initializes the PowerCalibrator and connects to a Kurios device and a power meter, and prints some
         information about the devices.
+
+        @param kurios Object providing the functions of `Sensor_lib.KURIOS_COMMAND_LIB`, defaults to that module, e.g.
+        a `simulated_devices.SimulatedKurios`.
+        @param power_meter_instrument Instrument with the `write` and `query` methods of a VISA resource, which is
+        driven by `ThorlabsPM100`, e.g. a `simulated_devices.SimulatedPowerMeterInstrument`. If None, the first power
+        meter found by the TLPM library is opened with pyvisa.
+        @param min_settle_time The shortest time in seconds waited after tuning the filter before measuring, see
+        `FilterSettler`.
+        @param seed_settle_time The settle time in seconds expected for jump sizes not measured yet, see
+        `FilterSettler`.
         """
+        self._kurios = kurios if kurios is not None else KURIOS_COMMAND_LIB
         #try to access Kurios
-        devs = KuriosListDevices()
+        devs = self._kurios.KuriosListDevices()
         print(devs)
         if(len(devs) <= 0):
             print('There is no devices connected')
             exit()
         Kurios = devs[0] #get serial number
-        hdl = KuriosOpen(Kurios[0],115200,3)
+        hdl = self._kurios.KuriosOpen(Kurios[0],115200,3)
         self._hdl = hdl
-        #try to access powermeter
-        tlPM = TLPM()
-        deviceCount = c_uint32()
-        tlPM.findRsrc(byref(deviceCount))
-        print("devices found: " + str(deviceCount.value))
-        #get device name
-        resourceName = create_string_buffer(1024)
-        for i in range(0, deviceCount.value):
-            tlPM.getRsrcName(c_int(i), resourceName)
-            print(c_char_p(resourceName.raw).value)
-            break
-        resourceName = c_char_p(resourceName.raw).value.decode('utf-8')
-        self._tlPM = tlPM
-        rm = pyvisa.ResourceManager()
-        inst = rm.open_resource(resourceName, timeout=1)
-        power_meter = ThorlabsPM100(inst=inst)
+        self._settler = FilterSettler(self._kurios, hdl, min_settle_time=min_settle_time,
+                                      seed_settle_time=seed_settle_time)
+        self._tlPM = None
+        if power_meter_instrument is None:
+            #try to access powermeter
+            tlPM = TLPM()
+            deviceCount = c_uint32()
+            tlPM.findRsrc(byref(deviceCount))
+            print("devices found: " + str(deviceCount.value))
+            #get device name
+            resourceName = create_string_buffer(1024)
+            for i in range(0, deviceCount.value):
+                tlPM.getRsrcName(c_int(i), resourceName)
+                print(c_char_p(resourceName.raw).value)
+                break
+            resourceName = c_char_p(resourceName.raw).value.decode('utf-8')
+            self._tlPM = tlPM
+            rm = pyvisa.ResourceManager()
+            power_meter_instrument = rm.open_resource(resourceName, timeout=1)
+        power_meter = ThorlabsPM100(inst=power_meter_instrument)
         power_meter.system.beeper.immediate() 
         #set power range to auto to provide maximum accuracy
         power_meter.sense.power.dc.range.auto = "ON"
@@ -55,7 +77,7 @@ class PowerCalibrator:
         print("PM Wavelength       :", power_meter.sense.correction.wavelength)
         self._power_meter = power_meter
                 
-    def calibrate(self, min_wavelength, max_wavelength, csv_name):
+    def calibrate(self, min_wavelength, max_wavelength, csv_name, output_folder='PowerCalibrationFiles', samples=100):
         """
         The `calibrate` function takes in a minimum and maximum wavelength, performs power measurements at
         each wavelength, and saves the measurements to a CSV file.
@@ -64,6 +86,10 @@ class PowerCalibrator:
         @param max_wavelength The maximum wavelength to calibrate the power meter for.
         @param csv_name The `csv_name` parameter is the name of the CSV file that will be created to store
         the calibration measurements.
+        @param output_folder The folder the CSV file is written to.
+        @param samples The number of power readings averaged per wavelength.
+
+        @return the path of the written CSV file.
         """
         
         wavelength_interval =[min_wavelength+i for i in range(max_wavelength-min_wavelength+1)]
@@ -73,28 +99,29 @@ class PowerCalibrator:
             "std_power_meas": np.array([])
         }
         for wl in wavelength_interval:
-            KuriosSetWavelength(self._hdl, wl)
-            time.sleep(0.1)
-            #take mean of 100 measurements
-            mes = np.array([self._power_meter.read for _ in range(100)])
+            self._settler.tune(wl)
+            #take mean of the measurements
+            with TRACER.span('power_meter_read', wavelength=wl, samples=samples):
+                mes = np.array([self._power_meter.read for _ in range(samples)])
             measurements["power_meas"] =np.append(measurements["power_meas"], mes.mean())
             measurements["std_power_meas"]= np.append(measurements["std_power_meas"], mes.std())
             measurements["wavelengths"]= np.append(measurements["wavelengths"], wl)
             print(mes.mean())
         
         df = pd.DataFrame(measurements)
-        output_folder = 'PowerCalibrationFiles' 
         if not os.path.exists(output_folder):
             os.makedirs(output_folder)
 
         df.to_csv(os.path.join(output_folder, csv_name), index=False)
+        return os.path.join(output_folder, csv_name)
 
     def cleanup(self):
         """
         The function `cleanup` closes a Kurios handle and a tlPM object.
         """
-        KuriosClose(self._hdl)
-        self._tlPM.close()
+        self._kurios.KuriosClose(self._hdl)
+        if self._tlPM is not None:
+            self._tlPM.close()
         
 
 if __name__ == "__main__":
@@ -0,0 +1,334 @@
+import multiprocessing
+import os
+import queue
+import threading
+import time
+import traceback
+from threading import BrokenBarrierError
+from acquisition_session import AcquisitionSession
+from kurios_sequencer import BANDWIDTH_WIDE
+from scan_scheduler import ScanJob, ScanScheduler
+
+
+# The `Rig` class pairs a Kurios filter with the camera behind it, given by their serial numbers, and holds the scan
+# jobs the rig runs into its own output directory.
+class Rig:
+
+    def __init__(self, name: str, kurios_serial: str, camera_serial: str, output_dir: str, jobs: list = None,
+                 session_factory=None) -> None:
+        """
+        The function initializes a rig.
+
+        @param name The name of the rig in the monitor.
+        @param kurios_serial The serial number of the Kurios filter.
+        @param camera_serial The serial number of the camera.
+        @param output_dir The directory the rig writes its stacks to, created if it does not exist.
+        @param jobs The `ScanJob`s of the rig, more can be added with `add_job`.
+        @param session_factory Callable building the unopened session of the rig from the rig, an
+        `AcquisitionSession` on the serial numbers if None. It is called in the rig process, so it has to be
+        picklable, e.g. a `simulated_devices.SimulatedSessionFactory`.
+        """
+        self.name = name
+        self.kurios_serial = str(kurios_serial)
+        self.camera_serial = str(camera_serial)
+        self.output_dir = output_dir
+        self.jobs = list(jobs) if jobs is not None else []
+        self.session_factory = session_factory
+
+    def add_job(self, filename: str, wavelengths: list, exposure: int, calib_filepath: str = None,
+                is_calib: bool = False, bandwidth_mode: int = BANDWIDTH_WIDE, **options) -> ScanJob:
+        """
+        The function adds a scan job writing into the output directory of the rig.
+
+        @param filename The name of the output file.
+        @param wavelengths The wavelengths in nm of the scan.
+        @param exposure The exposure time in microseconds.
+        @param calib_filepath The calibration file, relative paths are taken relative to the output directory.
+        @param is_calib True for a calibration job.
+        @param bandwidth_mode The bandwidth mode of the Kurios (2 = WIDE, 4 = MEDIUM, 8 = NARROW).
+        @param options Further keyword arguments of `gatherImages`.
+
+        @return the job.
+        """
+        if calib_filepath is not None and not os.path.isabs(calib_filepath):
+            calib_filepath = os.path.join(self.output_dir, calib_filepath)
+        job = ScanJob(filename, wavelengths, exposure, calib_filepath=calib_filepath, is_calib=is_calib,
+                      output_dir=self.output_dir, bandwidth_mode=bandwidth_mode, options=options)
+        self.jobs.append(job)
+        return job
+
+    def open_session(self) -> AcquisitionSession:
+        """
+        The function builds the unopened session of the rig.
+        """
+        if self.session_factory is not None:
+            return self.session_factory(self)
+        return AcquisitionSession(kurios_serial=self.kurios_serial, camera_serial=self.camera_serial)
+
+    def __repr__(self):
+        return f'Rig({self.name!r}, Kurios {self.kurios_serial}, camera {self.camera_serial}, {len(self.jobs)} jobs)'
+
+
+def _run_rig(rig, events, start_barrier, cancel, start_timeout):
+    # the body of a rig process: connects the devices, waits for the other rigs and runs the jobs one after another
+    def publish(event):
+        event['rig'] = rig.name
+        events.put(event)
+
+    def job_progress(job):
+        def progress(event):
+            event['job'] = job.filename
+            publish(event)
+        return progress
+
+    try:
+        os.makedirs(rig.output_dir, exist_ok=True)
+        session = rig.open_session().open()
+    except BaseException as exception:
+        if start_barrier is not None:
+            # the other rigs must not wait for this one
+            start_barrier.abort()
+        publish({'event': 'rig_failed', 'error': repr(exception), 'traceback': traceback.format_exc()})
+        return
+    try:
+        publish({'event': 'rig_ready', 'pid': os.getpid(), 'open_time': session.open_time})
+        if start_barrier is not None:
+            start_barrier.wait(start_timeout)
+        publish({'event': 'rig_started', 'time': time.time()})
+        scheduler = ScanScheduler(session=session)
+        for job in rig.jobs:
+            job.options = dict(job.options, progress=job_progress(job), cancel=cancel)
+            scheduler.add(job)
+        report = scheduler.run()
+        report['failed_jobs'] = {job.filename: repr(job.error) for job in scheduler.failed}
+        report['cancelled_jobs'] = [job.filename for job in scheduler.cancelled]
+        publish({'event': 'rig_finished', 'report': report})
+    except BrokenBarrierError:
+        publish({'event': 'rig_failed', 'error': 'Synchronized start was aborted, another rig failed to start'})
+    except BaseException as exception:
+        publish({'event': 'rig_failed', 'error': repr(exception), 'traceback': traceback.format_exc()})
+    finally:
+        session.close()
+
+
+# The `RigMonitor` class collects the progress events of all rigs and keeps the state and the throughput of every
+# rig, so the rigs can be watched side by side while they acquire.
+class RigMonitor:
+
+    def __init__(self, rig_names: list) -> None:
+        """
+        The function initializes the monitor with all rigs waiting for their devices.
+
+        @param rig_names The names of the monitored rigs.
+        """
+        self._lock = threading.Lock()
+        self.status = {name: {'state': 'connecting', 'job': None, 'wavelength': None, 'frames': 0,
+                              'wavelengths_written': 0, 'bytes_written': 0, 'start': None, 'start_time': None,
+                              'end': None, 'error': None, 'report': None} for name in rig_names}
+        # bytes written into the running stack, to sum up the throughput over the jobs of a rig
+        self._job_bytes = dict((name, 0) for name in rig_names)
+
+    def handle(self, event: dict):
+        """
+        The function updates the state of a rig with one of its events.
+
+        @param event A progress event of `gatherImages` or a rig event, with the rig name in 'rig'.
+        """
+        now = time.perf_counter()
+        with self._lock:
+            status = self.status[event['rig']]
+            kind = event['event']
+            if 'job' in event and event['job'] != status['job']:
+                status['job'] = event['job']
+                self._job_bytes[event['rig']] = 0
+            if kind == 'rig_ready':
+                status['state'] = 'ready'
+            elif kind == 'rig_started':
+                status['state'] = 'running'
+                status['start'] = now
+                status['start_time'] = event['time']
+            elif kind == 'frame':
+                status['frames'] += 1
+                status['wavelength'] = event['wavelength']
+            elif kind == 'wavelength_written':
+                # the events carry the size of the stack of the running job
+                status['bytes_written'] += max(event['bytes_written'] - self._job_bytes[event['rig']], 0)
+                self._job_bytes[event['rig']] = event['bytes_written']
+                status['wavelengths_written'] += 1
+            elif kind in ('rig_finished', 'rig_failed'):
+                status['state'] = 'finished' if kind == 'rig_finished' else 'failed'
+                if kind == 'rig_finished' and event['report'].get('cancelled'):
+                    status['state'] = 'cancelled'
+                status['end'] = now
+                status['error'] = event.get('error')
+                status['report'] = event.get('report')
+
+    def snapshot(self) -> dict:
+        """
+        The function returns the state of every rig with its throughput in frames and wavelengths per second and
+        megabytes written per second since its start.
+        """
+        now = time.perf_counter()
+        with self._lock:
+            snapshot = {}
+            for name, status in self.status.items():
+                status = dict(status)
+                elapsed = ((status['end'] if status['end'] is not None else now) - status['start']
+                           if status['start'] is not None else 0.0)
+                status['elapsed'] = elapsed
+                status['frames_per_second'] = status['frames']/elapsed if elapsed > 0 else 0.0
+                status['wavelengths_per_second'] = status['wavelengths_written']/elapsed if elapsed > 0 else 0.0
+                status['megabytes_per_second'] = status['bytes_written']/1e6/elapsed if elapsed > 0 else 0.0
+                snapshot[name] = status
+            return snapshot
+
+    def format(self) -> str:
+        """
+        The function returns the snapshot as table, one line per rig.
+        """
+        lines = [f'{"rig":<12} {"state":<10} {"wavelength":>10} {"frames":>7} {"frames/s":>9} {"MB/s":>7}  job']
+        for name, status in self.snapshot().items():
+            wavelength = '' if status['wavelength'] is None else f'{status["wavelength"]} nm'
+            line = (f'{name:<12} {status["state"]:<10} {wavelength:>10} {status["frames"]:>7} '
+                    f'{status["frames_per_second"]:>9.2f} {status["megabytes_per_second"]:>7.2f}  {status["job"] or ""}')
+            if status['error']:
+                line += f'  {status["error"]}'
+            lines.append(line)
+        return '\n'.join(lines)
+
+    @property
+    def start_skew(self) -> float:
+        """
+        The largest difference in seconds between the start times of the rigs, None until all rigs started.
+        """
+        with self._lock:
+            start_times = [status['start_time'] for status in self.status.values()]
+        if None in start_times:
+            return None
+        return max(start_times) - min(start_times)
+
+
+# The `RigCoordinator` class runs several rigs attached to one computer at the same time. Every rig acquires in its
+# own process with its own devices and output directory, so the rigs do not share the GIL and a crashing rig does
+# not stop the others. The progress events of all rigs arrive in one queue and are collected by a `RigMonitor`.
+# With a synchronized start all rigs first connect their devices and then start their jobs together.
+class RigCoordinator:
+
+    def __init__(self, rigs: list, synchronized_start: bool = True, start_timeout: float = 120.0,
+                 monitor_interval: float = None) -> None:
+        """
+        The function initializes the coordinator and checks that no device or output directory is used twice.
+
+        @param rigs The `Rig`s to run.
+        @param synchronized_start If True, the rigs start their jobs when all of them are connected.
+        @param start_timeout The time in seconds the rigs wait for each other at the synchronized start.
+        @param monitor_interval The interval in seconds the monitor table is printed at while the rigs run, None to
+        print nothing.
+        """
+        for attribute in ('name', 'kurios_serial', 'camera_serial', 'output_dir'):
+            values = [os.path.abspath(getattr(rig, attribute)) if attribute == 'output_dir' else getattr(rig, attribute)
+                      for rig in rigs]
+            if len(set(values)) != len(values):
+                raise ValueError(f'Every rig needs its own {attribute.replace("_", " ")}')
+        self.rigs = list(rigs)
+        self.synchronized_start = synchronized_start
+        self.start_timeout = start_timeout
+        self.monitor_interval = monitor_interval
+        self.monitor = RigMonitor([rig.name for rig in rigs])
+        # spawned processes start from a fresh interpreter, the camera SDK does not survive a fork
+        self._context = multiprocessing.get_context('spawn')
+        self._cancel = self._context.Event()
+        self._events = None
+        self._start_barrier = None
+        self._processes = {}
+        self._collector = None
+
+    def start(self):
+        """
+        The function starts one process per rig and the collection of their events.
+
+        @return the coordinator itself.
+        """
+        self._events = self._context.Queue()
+        # kept, the semaphores of the barrier are released when the last reference in this process is dropped
+        self._start_barrier = (self._context.Barrier(len(self.rigs))
+                               if self.synchronized_start and len(self.rigs) > 1 else None)
+        for rig in self.rigs:
+            process = self._context.Process(target=_run_rig, name=f'rig-{rig.name}',
+                                            args=(rig, self._events, self._start_barrier, self._cancel,
+                                                  self.start_timeout))
+            process.start()
+            self._processes[rig.name] = process
+        self._collector = threading.Thread(target=self._collect, name='rig-monitor', daemon=True)
+        self._collector.start()
+        return self
+
+    def _collect(self):
+        last_print = time.perf_counter()
+        while True:
+            try:
+                self.monitor.handle(self._events.get(timeout=0.2))
+            except queue.Empty:
+                if not any(process.is_alive() for process in self._processes.values()):
+                    break
+            if self.monitor_interval is not None and time.perf_counter() - last_print >= self.monitor_interval:
+                print(self.monitor.format())
+                last_print = time.perf_counter()
+        # rigs whose process ended without reporting, e.g. after a crash of a device driver
+        for name, process in self._processes.items():
+            if self.monitor.status[name]['state'] not in ('finished', 'failed', 'cancelled'):
+                self.monitor.handle({'rig': name, 'event': 'rig_failed',
+                                     'error': f'Rig process ended with exit code {process.exitcode}'})
+
+    def cancel(self):
+        """
+        The function cancels the running scans of all rigs before their next frame. The completed wavelengths stay
+        in the journals of the scans.
+        """
+        self._cancel.set()
+
+    def wait(self, timeout: float = None) -> dict:
+        """
+        The function waits until all rigs finished.
+
+        @param timeout The time in seconds to wait at most, None to wait without limit.
+
+        @return the final snapshot of the monitor, see `RigMonitor.snapshot`.
+        """
+        deadline = None if timeout is None else time.perf_counter() + timeout
+        for process in self._processes.values():
+            process.join(None if deadline is None else max(deadline - time.perf_counter(), 0.0))
+        self._collector.join(None if deadline is None else max(deadline - time.perf_counter(), 0.0))
+        return self.monitor.snapshot()
+
+    def run(self) -> dict:
+        """
+        The function runs all rigs and waits until they finished. An interrupt cancels the scans of all rigs.
+
+        @return the final snapshot of the monitor, see `RigMonitor.snapshot`.
+        """
+        self.start()
+        try:
+            return self.wait()
+        except KeyboardInterrupt:
+            self.cancel()
+            return self.wait()
+
+
+if __name__ == "__main__":
+    # three simulated rigs sweeping at the same time
+    import tempfile
+    from simulated_devices import SimulatedSessionFactory
+
+    output_dir = tempfile.mkdtemp()
+    factory = SimulatedSessionFactory(width=640, height=480, time_scale=0.2, tuning_time=0.01, open_time=0.5)
+    rigs = []
+    for index in range(3):
+        rig = Rig(f'rig{index + 1}', f'K{index + 1:04d}', f'CAM{index + 1:04d}', os.path.join(output_dir, f'rig{index + 1}'),
+                  session_factory=factory)
+        rig.add_job('calib.tif', list(range(430, 481)), 20000, is_calib=True)
+        rig.add_job('scan.tif', list(range(430, 481)), 20000, calib_filepath='calib.tif')
+        rigs.append(rig)
+    result = RigCoordinator(rigs, monitor_interval=1.0).run()
+    for name, status in result.items():
+        print(name, status['state'], f'{status["frames_per_second"]:.1f} frames/s', status['report'])
@@ -0,0 +1,193 @@
+import json
+import os
+import tifffile
+
+
+# The `ScanJournal` class records the progress of a scan next to its output stack, one line per completed
+# wavelength with the number of pages and the size of the stack at that point. A scan restarted after a crash
+# validates the partial stack against the journal, cuts off a partly written wavelength and continues after the last
+# complete one instead of starting over.
+class ScanJournal:
+
+    def __init__(self, output_path: str, parameters: dict) -> None:
+        """
+        The function initializes the journal of a scan. The journal is stored as `<output_path>.journal`.
+
+        @param output_path The path of the TIFF stack written by the scan.
+        @param parameters Dictionary of JSON serializable scan settings, e.g. wavelengths and exposure times. A
+        journal is only resumed by a scan with the same settings.
+        """
+        self.output_path = output_path
+        self.journal_path = output_path + '.journal'
+        # compare the settings the way they are read back from the journal
+        self.parameters = json.loads(json.dumps(parameters))
+        self.completed = []
+        self._page_count = 0
+        self._file = None
+        # pages and size of the stack the scan appends to, None for scans writing a new stack
+        self._base = None
+
+    def resume(self) -> list:
+        """
+        The function validates the journal and the partial stack of an interrupted scan with the same settings. The
+        stack is truncated behind the last wavelength, whose pages are all complete and match the journal. If
+        nothing can be resumed, both files are deleted and the scan starts over.
+
+        @return the list of wavelengths already completed, in scan order.
+        """
+        entries = self._read_entries()
+        if entries:
+            entries = self._validate(entries)
+        if not entries:
+            self.reset()
+            return []
+        self._continue(entries)
+        print(f'Resuming scan after {len(entries)} completed wavelengths')
+        return self.completed
+
+    def append(self) -> list:
+        """
+        The function prepares a scan appending pages to a complete stack, e.g. the refinement pass of an adaptive
+        scan. An interrupted append with the same settings is continued like by `resume`, otherwise the pages and
+        size of the stack are recorded as base, which the stack is truncated back to if the append has to start
+        over. Without stack this is `reset`.
+
+        @return the list of wavelengths of the append already completed, in scan order.
+        """
+        entries = self._read_entries()
+        if self._base is None:
+            if not os.path.exists(self.output_path):
+                self.reset()
+                return []
+            with tifffile.TiffFile(self.output_path) as file:
+                page_count = len(file.pages)
+            self._base = {'pages': page_count, 'offset': os.path.getsize(self.output_path)}
+            entries = []
+        elif entries:
+            entries = self._validate(entries)
+        self._continue(entries)
+        if entries:
+            print(f'Resuming appending after {len(entries)} completed wavelengths')
+        return self.completed
+
+    def _continue(self, entries):
+        last_entry = entries[-1] if entries else self._base
+        self._truncate(last_entry)
+        self.completed = [entry['wavelength'] for entry in entries]
+        self._page_count = last_entry['pages']
+        # rewrite the journal without the entries cut off
+        self._file = open(self.journal_path, 'w')
+        self._write_line(self._header())
+        for entry in entries:
+            self._write_line(entry)
+
+    def _header(self):
+        header = {'parameters': self.parameters}
+        if self._base is not None:
+            header['base'] = self._base
+        return header
+
+    def reset(self):
+        """
+        The function deletes the journal and the stack and starts an empty journal.
+        """
+        self.close()
+        for path in (self.output_path, self.journal_path):
+            if os.path.exists(path):
+                os.remove(path)
+        self.completed = []
+        self._page_count = 0
+        self._base = None
+        self._file = open(self.journal_path, 'w')
+        self._write_line(self._header())
+
+    def record(self, wavelength: int, page_count: int, file_size: int):
+        """
+        The function records a wavelength as complete. It has to be called after all pages of the wavelength were
+        written to the stack and flushed.
+
+        @param wavelength The wavelength in nm.
+        @param page_count The number of pages written for the wavelength.
+        @param file_size The size of the stack in bytes after the last page of the wavelength.
+        """
+        self._page_count += page_count
+        self._write_line({'wavelength': int(wavelength), 'pages': self._page_count, 'offset': int(file_size)})
+        self.completed.append(int(wavelength))
+
+    def finish(self):
+        """
+        The function deletes the journal of a completed scan.
+        """
+        self.close()
+        if os.path.exists(self.journal_path):
+            os.remove(self.journal_path)
+
+    def close(self):
+        """
+        The function closes the journal file, keeping it on disk for a later `resume`.
+        """
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def _write_line(self, entry):
+        self._file.write(json.dumps(entry) + '\n')
+        self._file.flush()
+
+    def _read_entries(self):
+        if not os.path.exists(self.journal_path) or not os.path.exists(self.output_path):
+            return []
+        with open(self.journal_path) as file:
+            lines = file.readlines()
+        try:
+            header = json.loads(lines[0])
+        except (IndexError, ValueError):
+            return []
+        if header.get('parameters') != self.parameters:
+            print('Journal belongs to a scan with other settings, starting over')
+            return []
+        self._base = header.get('base')
+        entries = []
+        for line in lines[1:]:
+            try:
+                entries.append(json.loads(line))
+            except ValueError:
+                # the line being written when the scan died
+                break
+        return entries
+
+    def _validate(self, entries):
+        file_size = os.path.getsize(self.output_path)
+        try:
+            with tifffile.TiffFile(self.output_path) as file:
+                wavelengths = []
+                for page in file.pages:
+                    try:
+                        wavelengths.append(json.loads(page.description).get('wavelength'))
+                    except (ValueError, TypeError, AttributeError):
+                        wavelengths.append(None)
+        except Exception as exception:
+            print(f'Partial scan file cannot be read, starting over: {exception}')
+            return []
+        valid = []
+        first_page = self._base['pages'] if self._base is not None else 0
+        for entry in entries:
+            last_page = entry['pages']
+            if entry['offset'] > file_size or last_page > len(wavelengths):
+                break
+            if any(wl != entry['wavelength'] for wl in wavelengths[first_page:last_page]):
+                break
+            valid.append(entry)
+            first_page = last_page
+        return valid
+
+    def _truncate(self, last_entry):
+        # the next IFD offset of the last kept page points to a page written after it, it has to end the chain
+        with tifffile.TiffFile(self.output_path) as file:
+            page = file.pages[last_entry['pages'] - 1]
+            next_offset_position = page.offset + file.tiff.tagnosize + len(page.tags)*file.tiff.tagsize
+            offset_size = file.tiff.offsetsize
+        with open(self.output_path, 'r+b') as file:
+            file.truncate(last_entry['offset'])
+            file.seek(next_offset_position)
+            file.write(b'\0'*offset_size)
@@ -0,0 +1,222 @@
+import os
+import time
+import traceback
+from acquisition_session import AcquisitionSession
+from automization import CameraFilterSyncronizer, ScanCancelledError
+from kurios_sequencer import BANDWIDTH_WIDE
+
+
+# The `ScanJob` class describes one scan of a batch: its wavelengths, exposure time, calibration and output file.
+class ScanJob:
+
+    def __init__(self, filename: str, wavelengths: list, exposure: int, calib_filepath: str = None,
+                 is_calib: bool = False, output_dir: str = '.', bandwidth_mode: int = BANDWIDTH_WIDE,
+                 options: dict = None) -> None:
+        """
+        The function initializes a scan job.
+
+        @param filename The name of the output file.
+        @param wavelengths The wavelengths in nm of the scan.
+        @param exposure The exposure time in microseconds.
+        @param calib_filepath The calibration file used for normalization, None for calibration jobs.
+        @param is_calib True for a calibration job, see `CameraFilterSyncronizer.gatherImages`.
+        @param output_dir The directory of the output file.
+        @param bandwidth_mode The bandwidth mode of the Kurios (2 = WIDE, 4 = MEDIUM, 8 = NARROW).
+        @param options Further keyword arguments passed to `gatherImages`, e.g. `frames_per_wavelength` or `roi`.
+        """
+        self.filename = filename
+        self.wavelengths = list(wavelengths)
+        self.exposure = int(exposure)
+        self.calib_filepath = calib_filepath
+        self.is_calib = is_calib
+        self.output_dir = output_dir
+        self.bandwidth_mode = bandwidth_mode
+        self.options = dict(options) if options is not None else {}
+        self.duration = None
+        self.error = None
+
+    @property
+    def output_path(self) -> str:
+        return os.path.abspath(os.path.join(self.output_dir, self.filename))
+
+    def __repr__(self):
+        return (f'ScanJob({self.filename!r}, {self.wavelengths[0]}-{self.wavelengths[-1]} nm, '
+                f'{self.exposure} us, bandwidth {self.bandwidth_mode})')
+
+
+# The `ScanScheduler` class runs a queue of scan jobs on one acquisition session, so the devices are connected once
+# for the whole batch. The jobs are reordered to change the bandwidth mode of the Kurios and the exposure time of the
+# camera as rarely as possible, while calibration jobs still run before the jobs normalized with their output.
+class ScanScheduler:
+
+    # relative costs of the setting changes between two jobs, a bandwidth change of the liquid crystal filter takes
+    # far longer than setting the exposure time of the camera
+    BANDWIDTH_CHANGE_COST = 10
+    EXPOSURE_CHANGE_COST = 1
+
+    def __init__(self, session: AcquisitionSession = None, reorder: bool = True) -> None:
+        """
+        The function initializes a scheduler with an empty queue.
+
+        @param session An `AcquisitionSession` to run the jobs on. If it is None, a session on the connected
+        hardware is opened by `run` and closed afterwards.
+        @param reorder If False, the jobs run in the order they were added.
+        """
+        self._owns_session = session is None
+        self._session = session
+        self.reorder = reorder
+        self.jobs = []
+        self.completed = []
+        self.failed = []
+        self.cancelled = []
+        self.elapsed = 0.0
+        self.bandwidth_changes = 0
+        self.exposure_changes = 0
+
+    def add(self, job: ScanJob) -> ScanJob:
+        """
+        The function appends a job to the queue.
+
+        @return the job.
+        """
+        self.jobs.append(job)
+        return job
+
+    def order(self, jobs: list, bandwidth_mode: int = None, exposure: int = None) -> list:
+        """
+        The function orders the jobs greedily: starting from the current settings, the next job is always the
+        waiting job with the cheapest setting change, whose calibration file is not produced by another waiting job.
+        Ties keep the order the jobs were added in.
+
+        @param jobs The jobs to order.
+        @param bandwidth_mode The current bandwidth mode of the Kurios, None if unknown.
+        @param exposure The current exposure time of the camera, None if unknown.
+
+        @return the ordered list of jobs.
+        """
+        waiting = list(jobs)
+        ordered = []
+        while waiting:
+            pending_outputs = set(job.output_path for job in waiting if job.is_calib)
+            ready = [job for job in waiting
+                     if job.calib_filepath is None or os.path.abspath(job.calib_filepath) not in pending_outputs]
+            if not ready:
+                # circular dependencies, keep the given order
+                ready = waiting
+            job = min(ready, key=lambda job: self._change_cost(job, bandwidth_mode, exposure))
+            waiting.remove(job)
+            ordered.append(job)
+            bandwidth_mode, exposure = job.bandwidth_mode, job.exposure
+        return ordered
+
+    def _change_cost(self, job, bandwidth_mode, exposure):
+        cost = 0
+        if job.bandwidth_mode != bandwidth_mode:
+            cost += self.BANDWIDTH_CHANGE_COST
+        if job.exposure != exposure:
+            cost += self.EXPOSURE_CHANGE_COST
+        return cost
+
+    def run(self) -> dict:
+        """
+        The function runs all queued jobs on one session. A failing job is reported and the batch continues with the
+        next job. A cancelled job, see the `cancel` option of `gatherImages`, stops the batch, the jobs not run yet
+        are reported as cancelled without creating their output files. Completed jobs are removed from the queue,
+        failed and cancelled ones stay queued.
+
+        @return the report of `report`.
+        """
+        if self._session is None:
+            self._session = AcquisitionSession()
+        session = self._session.open()
+        # one synchronizer for the batch, so consecutive jobs with the same calibration load it once
+        syncroniser = CameraFilterSyncronizer(wavelengths=[], exposure=session.exposure, session=session)
+        jobs = self.order(self.jobs, session.bandwidth_mode, session.exposure) if self.reorder else list(self.jobs)
+        start = time.perf_counter()
+        try:
+            for index, job in enumerate(jobs):
+                if not self._run_job(session, syncroniser, job):
+                    self.cancelled.extend(jobs[index + 1:])
+                    print(f'Scan batch cancelled, {len(jobs) - index} jobs not completed')
+                    break
+        finally:
+            self.elapsed += time.perf_counter() - start
+            if self._owns_session:
+                session.close()
+                self._session = None
+        return self.report()
+
+    def _run_job(self, session, syncroniser, job):
+        # returns False if the job was cancelled
+        cancel = job.options.get('cancel')
+        if cancel is not None and cancel.is_set():
+            self.cancelled.append(job)
+            return False
+        if session.bandwidth_mode != job.bandwidth_mode:
+            self.bandwidth_changes += 1
+        if session.exposure != job.exposure:
+            self.exposure_changes += 1
+        session.set_bandwidth_mode(job.bandwidth_mode)
+        print(f'Running {job}')
+        job_start = time.perf_counter()
+        try:
+            syncroniser.configure(job.wavelengths, job.exposure)
+            syncroniser.gatherImages(output_dir=job.output_dir, filename=job.filename,
+                                     calib_filepath=job.calib_filepath, is_calib=job.is_calib, **job.options)
+        except ScanCancelledError as exception:
+            job.error = exception
+            self.cancelled.append(job)
+            return False
+        except Exception as exception:
+            job.error = exception
+            self.failed.append(job)
+            print(f'Scan job {job.filename} failed: {exception}')
+            traceback.print_exc()
+        else:
+            self.completed.append(job)
+            self.jobs.remove(job)
+        finally:
+            job.duration = time.perf_counter() - job_start
+        return True
+
+    def report(self) -> dict:
+        """
+        The function summarizes the jobs run so far.
+
+        @return a dictionary with the number of completed, failed and cancelled jobs, the elapsed time in seconds, the
+        throughput in jobs per hour and the number of bandwidth and exposure changes.
+        """
+        jobs_per_hour = len(self.completed)/self.elapsed*3600 if self.elapsed > 0 else 0.0
+        return {'completed': len(self.completed), 'failed': len(self.failed), 'cancelled': len(self.cancelled),
+                'elapsed': self.elapsed, 'jobs_per_hour': jobs_per_hour, 'bandwidth_changes': self.bandwidth_changes,
+                'exposure_changes': self.exposure_changes}
+
+
+if __name__ == "__main__":
+    # load test against simulated devices: a shuffled batch of small scans with mixed settings, once in the order
+    # the jobs were added and once reordered
+    import random
+    import tempfile
+    from simulated_devices import create_simulated_session
+    from kurios_sequencer import BANDWIDTH_MEDIUM, BANDWIDTH_NARROW
+
+    random.seed(0)
+    output_dir = tempfile.mkdtemp()
+    settings = [(bandwidth_mode, exposure) for bandwidth_mode in (BANDWIDTH_WIDE, BANDWIDTH_MEDIUM, BANDWIDTH_NARROW)
+                for exposure in (10000, 20000)]
+    batch = []
+    for i in range(24):
+        bandwidth_mode, exposure = random.choice(settings)
+        first = random.randint(430, 700)
+        batch.append((f'job_{i:02d}.tif', list(range(first, first + 10)), exposure, bandwidth_mode))
+
+    for reorder in (False, True):
+        session = create_simulated_session(width=256, height=192, time_scale=0.1, bandwidth_switch_time=0.5)
+        with session:
+            scheduler = ScanScheduler(session=session, reorder=reorder)
+            scheduler.add(ScanJob('calib.tif', [430], 10000, is_calib=True, output_dir=output_dir))
+            for filename, wavelengths, exposure, bandwidth_mode in batch:
+                scheduler.add(ScanJob(filename, wavelengths, exposure, calib_filepath=os.path.join(output_dir, 'calib.tif'),
+                                      output_dir=output_dir, bandwidth_mode=bandwidth_mode))
+            report = scheduler.run()
+        print(f'reorder={reorder}: {report}')
@@ -0,0 +1,54 @@
+import tkinter as tk
+from live_preview import LivePreview
+
+
+# The `LivePreviewWindow` class shows the latest frame of a `LivePreview` while a scan is running. The window polls
+# the preview from the Tk event loop, so the acquisition never waits for the drawing, and draws the stretched 8 bit
+# preview as PGM/PPM image without going through matplotlib.
+class LivePreviewWindow:
+
+    def __init__(self, root, preview: LivePreview, interval_ms: int = 100) -> None:
+        """
+        The function builds the window and starts polling the preview.
+
+        @param root The window the preview is shown in, e.g. a `tk.Toplevel`.
+        @param preview The `LivePreview` passed to `gatherImages`.
+        @param interval_ms The polling interval in milliseconds.
+        """
+        self.root = root
+        self.root.title("Live Preview")
+        self.preview = preview
+        self.interval_ms = interval_ms
+        self._sequence = 0
+        self._photo = None
+        self._polling = None
+
+        self.image_label = tk.Label(self.root)
+        self.image_label.pack(expand=tk.YES, fill=tk.BOTH)
+        self.info_label = tk.Label(self.root, text="Waiting for frames...")
+        self.info_label.pack(side=tk.BOTTOM)
+
+        self.root.protocol("WM_DELETE_WINDOW", self.close)
+        self._poll()
+
+    def _poll(self):
+        latest = self.preview.latest(after=self._sequence, timeout=0)
+        if latest is not None:
+            self._sequence, frame = latest
+            # the photo image has to stay referenced, otherwise Tk shows an empty label
+            self._photo = tk.PhotoImage(data=frame.to_pnm())
+            self.image_label.config(image=self._photo)
+            low, high = frame.limits
+            self.info_label.config(text=f"{frame.wavelength} nm, frame {frame.frame_index + 1}, "
+                                        f"1:{frame.step} decimated, counts {low:.0f}-{high:.0f}, "
+                                        f"{self.preview.dropped} dropped")
+        self._polling = self.root.after(self.interval_ms, self._poll)
+
+    def close(self):
+        """
+        The function stops polling and closes the window. The scan keeps running.
+        """
+        if self._polling is not None:
+            self.root.after_cancel(self._polling)
+            self._polling = None
+        self.root.destroy()
@@ -0,0 +1,808 @@
+import time
+from enum import IntEnum
+import numpy as np
+from bayer_demosaic import cfa_pattern, develop
+
+
+# Mirrors `thorlabs_tsi_sdk.tl_camera_enums.SENSOR_TYPE`, so the simulated camera can be used on machines without
+# the Thorlabs SDK.
+class SENSOR_TYPE(IntEnum):
+    MONOCHROME = 0
+    BAYER = 1
+    MONOCHROME_POLARIZED = 2
+
+
+# Mirrors `thorlabs_tsi_sdk.tl_camera_enums.OPERATION_MODE`.
+class OPERATION_MODE(IntEnum):
+    SOFTWARE_TRIGGERED = 0
+    HARDWARE_TRIGGERED = 1
+    BULB = 2
+
+
+# The `SimulatedKurios` class imitates the function interface of `Sensor_lib.KURIOS_COMMAND_LIB`, so it can be passed
+# wherever the Kurios command library module is expected. Besides manual control it models the sequence mode on the
+# internal clock, including the trigger output at the start of every step.
+class SimulatedKurios:
+
+    def __init__(self, serial_number: str = 'SIM0001', wavelength: int = 550, open_time: float = 0.0,
+                 tuning_time: float = 0.0, tuning_time_per_nm: float = 0.0, bandwidth_switch_time: float = 0.0):
+        """
+        The function initializes a simulated Kurios filter, which keeps track of the currently set wavelength.
+
+        @param serial_number The serial number reported by `KuriosListDevices`.
+        @param wavelength The wavelength in nm the filter is tuned to after opening.
+        @param open_time The time in seconds `KuriosOpen` takes, to model the connection overhead.
+        @param tuning_time The time in seconds every wavelength change takes.
+        @param tuning_time_per_nm The additional tuning time in seconds per nm of the wavelength jump.
+        @param bandwidth_switch_time The time in seconds `KuriosSetBandwidthMode` takes if the mode changes.
+        """
+        self.serial_number = serial_number
+        self.wavelength = wavelength
+        self.open_time = open_time
+        self.tuning_time = tuning_time
+        self.tuning_time_per_nm = tuning_time_per_nm
+        self.bandwidth_switch_time = bandwidth_switch_time
+        self.bandwidth_mode = 2
+        self.bandwidth_switch_count = 0
+        self._previous_wavelength = wavelength
+        self._tuned_at = 0.0
+        self.open_count = 0
+        self._is_open = False
+        self.output_mode = 1
+        self.trigger_out_signal_mode = 0
+        # list of [wavelength, interval in ms, bandwidth mode]
+        self.sequence = []
+        self._sequence_start = None
+
+    def KuriosListDevices(self):
+        return [[self.serial_number, 'KURIOS-WB1']]
+
+    def KuriosOpen(self, serialNo, nBaud, timeout):
+        time.sleep(self.open_time)
+        self.open_count += 1
+        self._is_open = True
+        return 1
+
+    def KuriosIsOpen(self, serialNo):
+        return int(self._is_open)
+
+    def KuriosClose(self, hdl):
+        self._is_open = False
+        return 0
+
+    def _tuning_duration(self, previous_wavelength, wavelength) -> float:
+        return self.tuning_time + self.tuning_time_per_nm*abs(wavelength - previous_wavelength)
+
+    def _sequence_step(self, t: float):
+        """
+        The function returns the index and start time of the sequence step running at time t.
+        """
+        intervals = [step[1]*1e-3 for step in self.sequence]
+        elapsed = (t - self._sequence_start) % sum(intervals)
+        index = 0
+        step_start = t - elapsed
+        while elapsed >= intervals[index]:
+            elapsed -= intervals[index]
+            step_start += intervals[index]
+            index += 1
+        return index, step_start
+
+    def trigger_time(self, index: int) -> float:
+        """
+        The function returns the time of the rising edge of the trigger output for sequence step number `index`,
+        counting the steps since the start of the sequence, or None if no sequence is running. The output is high
+        while the filter switches, so in normal signal mode the edge is at the start of the step and in flipped mode
+        at the end of the transition.
+        """
+        if self._sequence_start is None:
+            return None
+        intervals = [step[1]*1e-3 for step in self.sequence]
+        passes, step = divmod(index, len(intervals))
+        step_start = self._sequence_start + passes*sum(intervals) + sum(intervals[:step])
+        if self.trigger_out_signal_mode == 1:
+            return step_start + self._tuning_duration(self.sequence[step - 1][0], self.sequence[step][0])
+        return step_start
+
+    def wavelength_at(self, t: float) -> int:
+        """
+        The function returns the wavelength the filter transmits at time t, which is the previous wavelength while
+        tuning.
+        """
+        if self._sequence_start is not None:
+            index, step_start = self._sequence_step(t)
+            previous = self.sequence[index - 1][0]
+            current = self.sequence[index][0]
+            if t - step_start < self._tuning_duration(previous, current):
+                return previous
+            return current
+        if t < self._tuned_at:
+            return self._previous_wavelength
+        return self.wavelength
+
+    def actual_wavelength(self) -> int:
+        return self.wavelength_at(time.perf_counter())
+
+    def KuriosSetWavelength(self, hdl, value):
+        self._previous_wavelength = self.actual_wavelength()
+        self.wavelength = int(value)
+        self._tuned_at = time.perf_counter() + self._tuning_duration(self._previous_wavelength, self.wavelength)
+        return 0
+
+    def KuriosGetWavelength(self, hdl, value):
+        value[0] = self.actual_wavelength()
+        return 0
+
+    def KuriosGetStatus(self, hdl, value):
+        value[0] = 2
+        return 0
+
+    def KuriosSetBandwidthMode(self, hdl, value):
+        if value != self.bandwidth_mode:
+            time.sleep(self.bandwidth_switch_time)
+            self.bandwidth_switch_count += 1
+        self.bandwidth_mode = value
+        return 0
+
+    def KuriosGetBandwidthMode(self, hdl, value):
+        value[0] = self.bandwidth_mode
+        return 0
+
+    def KuriosSetOutputMode(self, hdl, value):
+        if self._sequence_start is not None:
+            # the filter stays at the wavelength of the running step
+            self.wavelength = self.actual_wavelength()
+            self._previous_wavelength = self.wavelength
+            self._sequence_start = None
+        if value == 2 and self.sequence:
+            self._sequence_start = time.perf_counter()
+        self.output_mode = value
+        return 0
+
+    def KuriosGetOutputMode(self, hdl, value):
+        value[0] = self.output_mode
+        return 0
+
+    def KuriosSetDeleteSequenceStep(self, hdl, value):
+        if value == 0:
+            self.sequence = []
+        else:
+            del self.sequence[value - 1]
+        return 0
+
+    def KuriosSetInsertSequenceStep(self, hdl, index, wavelength, interval, bandwidthMode):
+        self.sequence.insert(index - 1, [int(wavelength), int(interval), bandwidthMode])
+        return 0
+
+    def KuriosSetSequenceStepData(self, hdl, Index, wavelength, interval, bandwidthMode):
+        self.sequence[Index - 1] = [int(wavelength), int(interval), bandwidthMode]
+        return 0
+
+    def KuriosGetSequenceLength(self, hdl, value):
+        value[0] = len(self.sequence)
+        return 0
+
+    def KuriosSetTriggerOutSignalMode(self, hdl, value):
+        self.trigger_out_signal_mode = value
+        return 0
+
+    def KuriosGetTriggerOutSignalMode(self, hdl, value):
+        value[0] = self.trigger_out_signal_mode
+        return 0
+
+    def KuriosSetForceTrigger(self, hdl):
+        return 0
+
+
+# Simulated frame, carrying the same attributes as the frames returned by the TSI SDK.
+class SimulatedFrame:
+
+    def __init__(self, image_buffer: np.ndarray, frame_count: int, time_stamp_relative_ns_or_null: int = None):
+        self.image_buffer = image_buffer
+        self.frame_count = frame_count
+        self.time_stamp_relative_ns_or_null = time_stamp_relative_ns_or_null
+
+
+# The `SpectralScene` class describes a synthetic scene in front of the camera: the spectrum of the illumination and
+# rectangular patches of different reflectance spectra on a background. The relative irradiance is 1 for the brightest
+# wavelength of the illumination on a fully reflecting surface.
+class SpectralScene:
+
+    def __init__(self, illumination=None, patches: list = None, background=1.0) -> None:
+        """
+        The function initializes the scene.
+
+        @param illumination Callable returning the relative power of the light source at a wavelength in nm, a
+        halogen lamp if None.
+        @param patches List of `((x0, y0, x1, y1), reflectance)` tuples, the rectangle given in fractions of the sensor
+        width and height and the reflectance as callable of the wavelength in nm or constant. Later patches cover
+        earlier ones.
+        @param background The reflectance outside the patches, callable or constant.
+        """
+        self.illumination = illumination if illumination is not None else self.halogen
+        self.patches = list(patches) if patches is not None else []
+        self.background = background
+
+    @staticmethod
+    def halogen(wavelength: float, temperature: float = 3000.0) -> float:
+        """
+        The function returns the black body spectrum of a halogen lamp, relative to its value at 730 nm, which is
+        the maximum within the Kurios range.
+        """
+        def planck(wl):
+            return 1.0/((wl*1e-9)**5*(np.exp(1.4388e-2/(wl*1e-9*temperature)) - 1))
+        return planck(wavelength)/planck(730.0)
+
+    @staticmethod
+    def gaussian(center: float, width: float, amplitude: float = 1.0, offset: float = 0.0):
+        """
+        The function returns a reflectance spectrum with a gaussian band.
+
+        @param center The center of the band in nm.
+        @param width The standard deviation of the band in nm.
+        @param amplitude The reflectance at the center above the offset.
+        @param offset The reflectance outside the band.
+        """
+        return lambda wl: offset + amplitude*np.exp(-0.5*((wl - center)/width)**2)
+
+    @classmethod
+    def color_checker(cls, illumination=None):
+        """
+        The function returns a scene of six patches with reflectance bands from blue to red on a grey background.
+        """
+        patches = []
+        for i, center in enumerate((450, 500, 550, 600, 650, 700)):
+            column, row = i % 3, i // 3
+            rectangle = (0.1 + 0.3*column, 0.15 + 0.4*row, 0.3 + 0.3*column, 0.45 + 0.4*row)
+            patches.append((rectangle, cls.gaussian(center, 25.0, amplitude=0.8, offset=0.05)))
+        return cls(illumination=illumination, patches=patches, background=0.2)
+
+    def illumination_power(self, wavelength: float) -> float:
+        """
+        The function returns the relative power of the illumination at a wavelength.
+        """
+        return float(self.illumination(wavelength))
+
+    def patch_map(self, x0: int, y0: int, width: int, height: int, sensor_width: int, sensor_height: int) -> np.ndarray:
+        """
+        The function returns the index of the patch seen by every pixel of a sensor region, 0 for the background
+        and i for the i-th patch.
+        """
+        y, x = np.ogrid[y0:y0 + height, x0:x0 + width]
+        x = (x + 0.5)/sensor_width
+        y = (y + 0.5)/sensor_height
+        index = np.zeros((height, width), dtype=np.uint8)
+        for i, ((px0, py0, px1, py1), _) in enumerate(self.patches):
+            index[(y >= py0) & (y < py1) & (x >= px0) & (x < px1)] = i + 1
+        return index
+
+    def reflectances(self, wavelength: float) -> np.ndarray:
+        """
+        The function returns the reflectance of the background and of every patch at a wavelength.
+        """
+        spectra = [self.background] + [reflectance for _, reflectance in self.patches]
+        return np.array([spectrum(wavelength) if callable(spectrum) else spectrum for spectrum in spectra],
+                        dtype=np.float32)
+
+
+class SimulatedCamera:
+
+    def __init__(self, kurios: SimulatedKurios = None, width: int = 2448, height: int = 2048,
+                 sensor_type: SENSOR_TYPE = SENSOR_TYPE.MONOCHROME, bit_depth: int = 12, arm_time: float = 0.0,
+                 readout_time: float = 0.0, time_scale: float = 1.0, scene: SpectralScene = None,
+                 saturation_exposure_us: float = 1e6, read_noise: float = 0.0, shot_noise: bool = False,
+                 seed: int = 0, dark_offset: float = 0.0, dark_current: float = 0.0,
+                 sensor_temperature: float = 25.0, serial_number: str = 'SIMCAM0001', color_correction_matrix=None,
+                 white_balance_matrix=None):
+        """
+        The function initializes a simulated Kiralux camera, which renders a frame for the wavelength the coupled
+        Kurios filter is tuned to.
+
+        @param kurios The simulated Kurios filter in front of the camera. Without filter the frames only show the
+        shading of the optics.
+        @param width The sensor width in pixels.
+        @param height The sensor height in pixels.
+        @param sensor_type The sensor type, `SENSOR_TYPE.BAYER` for a color camera.
+        @param bit_depth The bit depth of the sensor.
+        @param arm_time The time in seconds `arm` takes.
+        @param readout_time The time in seconds between the end of an exposure and the frame being available. The
+        camera ignores hardware triggers until the readout finished.
+        @param time_scale Factor applied to the modelled exposure and readout times, to run long scans quickly.
+        @param scene Optional `SpectralScene`. With a scene the signal is proportional to the exposure time, without
+        it every wavelength renders a fixed level independent of the exposure.
+        @param saturation_exposure_us The exposure time in microseconds at which a relative irradiance of 1 reaches
+        the full scale of the sensor.
+        @param read_noise The standard deviation of the read noise in counts, only used with a scene.
+        @param shot_noise If True, the photon shot noise is added, only used with a scene.
+        @param seed The seed of the noise, so simulated runs are reproducible.
+        @param dark_offset The dark offset in counts per pixel, only used with a scene or while `covered` is True.
+        @param dark_current The mean dark current in counts per second per pixel at 25 degC. It varies from pixel to
+        pixel with a fixed pattern and doubles every 6 K of `sensor_temperature`.
+        @param sensor_temperature The sensor temperature in degC.
+        @param serial_number The serial number reported by the camera discovery.
+        @param color_correction_matrix The 3x3 color correction matrix of a color camera, None for the identity.
+        @param white_balance_matrix The 3x3 default white balance matrix of a color camera, None for the identity.
+        """
+        self._kurios = kurios
+        self.serial_number = serial_number
+        self.dark_offset = dark_offset
+        self.dark_current = dark_current
+        self.sensor_temperature = sensor_temperature
+        # True while the lens is covered for dark frames
+        self.covered = False
+        self._dark_seed = seed
+        self._dark_pattern = None
+        self.scene = scene
+        self.saturation_exposure_us = saturation_exposure_us
+        self.read_noise = read_noise
+        self.shot_noise = shot_noise
+        self._rng = np.random.default_rng(seed)
+        self._patch_map = None
+        self.sensor_width_pixels = width
+        self.sensor_height_pixels = height
+        self._roi = (0, 0, width, height)
+        self._binx = 1
+        self._biny = 1
+        self._shading = None
+        self.camera_sensor_type = sensor_type
+        self.bit_depth = bit_depth
+        self.color_filter_array_phase = 0
+        self.color_correction_matrix = np.eye(3, dtype=np.float32) if color_correction_matrix is None else \
+            np.asarray(color_correction_matrix, dtype=np.float32).reshape(3, 3)
+        self.white_balance_matrix = np.eye(3, dtype=np.float32) if white_balance_matrix is None else \
+            np.asarray(white_balance_matrix, dtype=np.float32).reshape(3, 3)
+        self.arm_time = arm_time
+        self.readout_time = readout_time
+        self.time_scale = time_scale
+        self.operation_mode = OPERATION_MODE.SOFTWARE_TRIGGERED
+        self.frames_per_trigger_zero_for_unlimited = 0
+        self.image_poll_timeout_ms = 0
+        self.exposure_time_us = 0
+        self.is_armed = False
+        self.arm_count = 0
+        self.missed_triggers = 0
+        self._frame_count = 0
+        self._trigger_index = 0
+        self._busy_until = 0.0
+        self._armed_at = 0.0
+
+    @property
+    def sensor_readout_time_ns(self):
+        return int(self.readout_time*self.time_scale*1e9)
+
+    @property
+    def frame_time_us(self):
+        return int(self.exposure_time_us*self.time_scale + self.readout_time*self.time_scale*1e6)
+
+    @property
+    def roi(self):
+        """
+        The region of interest as (upper left x, upper left y, lower right x, lower right y) in sensor pixels, the
+        lower right corner being exclusive. It can only be changed while the camera is disarmed.
+        """
+        return self._roi
+
+    @roi.setter
+    def roi(self, roi):
+        if self.is_armed:
+            raise RuntimeError('The roi can only be set while the camera is disarmed')
+        x0, y0, x1, y1 = (int(value) for value in roi)
+        x0 = min(max(x0, 0), self.sensor_width_pixels - 1)
+        y0 = min(max(y0, 0), self.sensor_height_pixels - 1)
+        x1 = min(max(x1, x0 + 1), self.sensor_width_pixels)
+        y1 = min(max(y1, y0 + 1), self.sensor_height_pixels)
+        self._roi = (x0, y0, x1, y1)
+        self._shading = None
+        self._patch_map = None
+        self._dark_pattern = None
+
+    @property
+    def binx(self):
+        return self._binx
+
+    @binx.setter
+    def binx(self, binx):
+        if self.is_armed:
+            raise RuntimeError('The binning can only be set while the camera is disarmed')
+        self._binx = max(int(binx), 1)
+        self._shading = None
+        self._patch_map = None
+        self._dark_pattern = None
+
+    @property
+    def biny(self):
+        return self._biny
+
+    @biny.setter
+    def biny(self, biny):
+        if self.is_armed:
+            raise RuntimeError('The binning can only be set while the camera is disarmed')
+        self._biny = max(int(biny), 1)
+        self._shading = None
+        self._patch_map = None
+        self._dark_pattern = None
+
+    @property
+    def image_width_pixels(self):
+        return (self._roi[2] - self._roi[0])//self._binx
+
+    @property
+    def image_height_pixels(self):
+        return (self._roi[3] - self._roi[1])//self._biny
+
+    def get_color_correction_matrix(self):
+        return self.color_correction_matrix.copy()
+
+    def get_default_white_balance_matrix(self):
+        return self.white_balance_matrix.copy()
+
+    def arm(self, frames_to_buffer):
+        time.sleep(self.arm_time)
+        self.arm_count += 1
+        self.is_armed = True
+        self._trigger_index = 0
+        self._busy_until = 0.0
+        self._frame_count = 0
+        self._armed_at = time.perf_counter()
+
+    def disarm(self):
+        self.is_armed = False
+
+    def issue_software_trigger(self):
+        pass
+
+    def get_pending_frame_or_null(self):
+        """
+        The function waits for the next frame and returns it. In software triggered mode a frame is exposed when it
+        is requested, in hardware triggered mode every trigger pulse of the coupled Kurios sequence starts an
+        exposure, unless the camera is still busy with the previous frame.
+
+        @return a `SimulatedFrame`, or None if no frame arrives within the poll timeout.
+        """
+        if not self.is_armed:
+            return None
+        exposure_time = self.exposure_time_us*1e-6*self.time_scale
+        readout_time = self.readout_time*self.time_scale
+        if self.operation_mode == OPERATION_MODE.HARDWARE_TRIGGERED:
+            start = self._next_trigger()
+            if start is None:
+                time.sleep(self.image_poll_timeout_ms*1e-3)
+                return None
+        else:
+            start = time.perf_counter()
+        ready = start + exposure_time + readout_time
+        self._busy_until = ready
+        time.sleep(max(ready - time.perf_counter(), 0.0))
+        wavelength = self._kurios.wavelength_at(start + exposure_time/2) if self._kurios is not None else 550
+        frame = self._render(wavelength)
+        frame.time_stamp_relative_ns_or_null = int((start - self._armed_at)*1e9)
+        return frame
+
+    def _next_trigger(self):
+        if self._kurios is None or self._kurios.trigger_time(self._trigger_index) is None:
+            return None
+        while True:
+            start = self._kurios.trigger_time(self._trigger_index)
+            self._trigger_index += 1
+            if start >= self._busy_until:
+                return start
+            self.missed_triggers += 1
+
+    def _region_shading(self) -> np.ndarray:
+        # radial fall off of the illumination over the whole sensor, cropped to the roi and summed over the bins
+        if self._shading is None:
+            x0, y0 = self._roi[:2]
+            width = self.image_width_pixels*self._binx
+            height = self.image_height_pixels*self._biny
+            y, x = np.ogrid[y0:y0 + height, x0:x0 + width]
+            shading = 1 - 0.25*((x/self.sensor_width_pixels - 0.5)**2 + (y/self.sensor_height_pixels - 0.5)**2)
+            shading = shading.reshape(self.image_height_pixels, self._biny, self.image_width_pixels, self._binx)
+            self._shading = shading.sum(axis=(1, 3))
+        return self._shading
+
+    def _render(self, wavelength: int) -> SimulatedFrame:
+        # binned pixels add up beyond the bit depth of a single pixel
+        full_scale = min((2**self.bit_depth - 1)*self._binx*self._biny, 2**16 - 1)
+        if self.covered:
+            image = self._render_dark(full_scale)
+        elif self.scene is None:
+            level = (wavelength % 256) + 2**(self.bit_depth - 2)
+            image = np.minimum(np.rint(level*self._region_shading()), full_scale).astype(np.uint16)
+        else:
+            image = self._render_scene(wavelength, full_scale)
+        self._frame_count += 1
+        return SimulatedFrame(image, self._frame_count)
+
+    def _render_scene(self, wavelength: int, full_scale: int) -> np.ndarray:
+        if self._patch_map is None:
+            x0, y0 = self._roi[:2]
+            width = self.image_width_pixels*self._binx
+            height = self.image_height_pixels*self._biny
+            self._patch_map = self.scene.patch_map(x0, y0, width, height, self.sensor_width_pixels,
+                                                   self.sensor_height_pixels)
+            y, x = np.ogrid[y0:y0 + height, x0:x0 + width]
+            self._pixel_shading = (1 - 0.25*((x/self.sensor_width_pixels - 0.5)**2
+                                             + (y/self.sensor_height_pixels - 0.5)**2)).astype(np.float32)
+        # counts of a single pixel for a relative irradiance of 1
+        scale = (2**self.bit_depth - 1)*self.exposure_time_us/self.saturation_exposure_us
+        lut = self.scene.reflectances(wavelength)*np.float32(self.scene.illumination_power(wavelength)*scale)
+        signal = lut[self._patch_map]
+        signal *= self._pixel_shading
+        if (self._binx, self._biny) != (1, 1):
+            signal = signal.reshape(self.image_height_pixels, self._biny, self.image_width_pixels,
+                                    self._binx).sum(axis=(1, 3))
+        if self.dark_offset or self.dark_current:
+            signal += self._dark_signal()
+        return self._add_noise(signal, full_scale)
+
+    def _render_dark(self, full_scale: int) -> np.ndarray:
+        signal = self._dark_signal().copy()
+        return self._add_noise(signal, full_scale)
+
+    def _dark_signal(self) -> np.ndarray:
+        # offset and dark current of every pixel of the region, the pattern is fixed in sensor coordinates
+        if self._dark_pattern is None:
+            pattern = np.random.default_rng(self._dark_seed + 1).lognormal(0.0, 0.4, (self.sensor_height_pixels,
+                                                                                      self.sensor_width_pixels))
+            x0, y0 = self._roi[:2]
+            width = self.image_width_pixels*self._binx
+            height = self.image_height_pixels*self._biny
+            pattern = pattern[y0:y0 + height, x0:x0 + width].astype(np.float32)
+            self._dark_pattern = pattern.reshape(self.image_height_pixels, self._biny, self.image_width_pixels,
+                                                 self._binx).sum(axis=(1, 3))
+        bins = self._binx*self._biny
+        current = self.dark_current*self.exposure_time_us*1e-6*2**((self.sensor_temperature - 25.0)/6.0)
+        return np.float32(self.dark_offset*bins) + self._dark_pattern*np.float32(current)
+
+    def _add_noise(self, signal: np.ndarray, full_scale: int) -> np.ndarray:
+        if self.shot_noise:
+            # gain of one electron per count
+            signal += np.sqrt(np.maximum(signal, 0))*self._rng.standard_normal(signal.shape, dtype=np.float32)
+        if self.read_noise > 0:
+            signal += self._rng.standard_normal(signal.shape, dtype=np.float32)*np.float32(self.read_noise)
+        np.clip(signal, 0, full_scale, out=signal)
+        return np.rint(signal).astype(np.uint16)
+
+    def dispose(self):
+        self.is_armed = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exception_type, exception_value, exception_traceback):
+        self.dispose()
+        return False
+
+
+class SimulatedTLCameraSDK:
+
+    def __init__(self, camera: SimulatedCamera, discovery_time: float = 0.0):
+        """
+        The function initializes a simulated camera SDK, which serves a single simulated camera.
+
+        @param camera The camera returned by `open_camera`.
+        @param discovery_time The time in seconds `discover_available_cameras` takes.
+        """
+        self._camera = camera
+        self.discovery_time = discovery_time
+        self.open_count = 0
+
+    def discover_available_cameras(self):
+        time.sleep(self.discovery_time)
+        return [self._camera.serial_number]
+
+    def open_camera(self, camera_serial_number):
+        self.open_count += 1
+        return self._camera
+
+    def dispose(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exception_type, exception_value, exception_traceback):
+        self.dispose()
+        return False
+
+
+class SimulatedMonoToColorProcessor:
+
+    def __init__(self, color_filter_array_phase=0, color_correction_matrix=None, white_balance_matrix=None):
+        self._pattern = cfa_pattern(color_filter_array_phase)
+        self._color_correction_matrix = color_correction_matrix
+        self._white_balance_matrix = white_balance_matrix
+
+    def transform_to_48(self, input_image, image_width_pixels, image_height_pixels):
+        """
+        The function demosaics the raw image and applies the white balance and the color correction matrix, returning
+        a flat array like the TSI SDK.
+        """
+        raw = np.asarray(input_image).reshape(image_height_pixels, image_width_pixels)
+        return develop(raw, {'cfa_pattern': self._pattern, 'color_correction_matrix': self._color_correction_matrix,
+                             'white_balance_matrix': self._white_balance_matrix}).reshape(-1)
+
+    def dispose(self):
+        pass
+
+
+class SimulatedMonoToColorProcessorSDK:
+
+    def create_mono_to_color_processor(self, camera_sensor_type, color_filter_array_phase, color_correction_matrix,
+                                       default_white_balance_matrix, bit_depth):
+        return SimulatedMonoToColorProcessor(color_filter_array_phase, color_correction_matrix,
+                                             default_white_balance_matrix)
+
+    def dispose(self):
+        pass
+
+
+# The `SimulatedPowerMeterInstrument` class answers the SCPI commands `ThorlabsPM100` sends to a PM100 power meter,
+# so it can replace the VISA resource. The measured power follows the illumination of a `SpectralScene` at the
+# wavelength the coupled Kurios filter transmits.
+class SimulatedPowerMeterInstrument:
+
+    def __init__(self, kurios: SimulatedKurios = None, scene: SpectralScene = None, peak_power: float = 1e-3,
+                 noise: float = 0.0, read_time: float = 0.0, seed: int = 0) -> None:
+        """
+        The function initializes the simulated power meter.
+
+        @param kurios The simulated Kurios filter in front of the sensor. Without filter 550 nm is measured.
+        @param scene The `SpectralScene` providing the illumination spectrum, a halogen lamp if None.
+        @param peak_power The power in W measured at the brightest wavelength of the illumination.
+        @param noise The relative standard deviation of a reading.
+        @param read_time The time in seconds a reading takes.
+        @param seed The seed of the noise.
+        """
+        self._kurios = kurios
+        self.scene = scene if scene is not None else SpectralScene()
+        self.peak_power = peak_power
+        self.noise = noise
+        self.read_time = read_time
+        self._rng = np.random.default_rng(seed)
+        # settings written with a value, keyed by the upper case command
+        self.settings = {'SENSE:CORRECTION:WAVELENGTH': '550', 'CONFIGURE': 'POW'}
+        self.commands = []
+        self.read_count = 0
+        self._response = ''
+
+    def power(self) -> float:
+        """
+        The function returns one power reading in W.
+        """
+        wavelength = self._kurios.actual_wavelength() if self._kurios is not None else 550
+        power = self.peak_power*self.scene.illumination_power(wavelength)
+        if self.noise > 0:
+            power *= 1 + self.noise*self._rng.standard_normal()
+        return power
+
+    def write(self, command: str):
+        self.commands.append(command)
+        parts = command.strip().split(None, 1)
+        if len(parts) == 2:
+            self.settings[parts[0].upper()] = parts[1]
+
+    def query(self, command: str) -> str:
+        self.commands.append(command)
+        head = command.strip().upper().rstrip('?')
+        if head in ('READ', 'MEASURE', 'MEASURE:POWER', 'MEAS:POW', 'FETCH'):
+            time.sleep(self.read_time)
+            self.read_count += 1
+            self._response = f'{self.power():.9e}'
+        elif head == '*IDN':
+            self._response = 'Thorlabs,PM100D,SIM0001,2.0.0'
+        else:
+            self._response = self.settings.get(head, '0')
+        return self._response
+
+    def read(self) -> str:
+        return self._response
+
+
+def create_simulated_session(width: int = 2448, height: int = 2048, sensor_type: SENSOR_TYPE = SENSOR_TYPE.MONOCHROME,
+                             time_scale: float = 1.0, discovery_time: float = 0.0, open_time: float = 0.0,
+                             arm_time: float = 0.0, readout_time: float = 0.0, tuning_time: float = 0.0,
+                             tuning_time_per_nm: float = 0.0, bandwidth_switch_time: float = 0.0,
+                             scene: SpectralScene = None, saturation_exposure_us: float = 1e6,
+                             read_noise: float = 0.0, shot_noise: bool = False, seed: int = 0,
+                             kurios: SimulatedKurios = None, dark_offset: float = 0.0, dark_current: float = 0.0,
+                             sensor_temperature: float = 25.0, kurios_serial: str = 'SIM0001',
+                             camera_serial: str = 'SIMCAM0001', min_settle_time: float = 0.0,
+                             seed_settle_time: float = 0.0,
+                             color_correction_matrix=None, white_balance_matrix=None):
+    """
+    The function builds an `AcquisitionSession` on a simulated camera and Kurios filter.
+
+    @param width The sensor width in pixels.
+    @param height The sensor height in pixels.
+    @param sensor_type The sensor type of the simulated camera.
+    @param time_scale Factor applied to the modelled exposure and readout times of the camera.
+    @param discovery_time The time in seconds the camera discovery takes.
+    @param open_time The time in seconds opening the Kurios takes.
+    @param arm_time The time in seconds arming the camera takes.
+    @param readout_time The time in seconds the camera needs to read out a frame.
+    @param tuning_time The time in seconds every wavelength change of the Kurios takes.
+    @param tuning_time_per_nm The additional tuning time in seconds per nm of the wavelength jump.
+    @param bandwidth_switch_time The time in seconds a change of the bandwidth mode of the Kurios takes.
+    @param scene Optional `SpectralScene` in front of the camera, see `SimulatedCamera`.
+    @param saturation_exposure_us The exposure time in microseconds saturating a relative irradiance of 1.
+    @param read_noise The standard deviation of the read noise in counts.
+    @param shot_noise If True, the photon shot noise is added.
+    @param seed The seed of the noise.
+    @param kurios A `SimulatedKurios` to use, e.g. shared with a simulated power meter. The tuning parameters are
+    ignored if it is given.
+    @param dark_offset The dark offset in counts per pixel, see `SimulatedCamera`.
+    @param dark_current The mean dark current in counts per second per pixel at 25 degC.
+    @param sensor_temperature The sensor temperature in degC.
+    @param kurios_serial The serial number of the simulated Kurios, unless `kurios` is given.
+    @param camera_serial The serial number of the simulated camera.
+    @param min_settle_time The shortest settle time of the filter, see `FilterSettler`. The simulated filter only
+    reports the new wavelength after its modelled tuning time, so no floor is needed.
+    @param seed_settle_time The settle time expected for jump sizes not measured yet, see `FilterSettler`. The
+    simulated filter is seen settling every jump, so the first one of a size measures it right away.
+    @param color_correction_matrix The 3x3 color correction matrix of a color camera, None for the identity.
+    @param white_balance_matrix The 3x3 white balance matrix of a color camera, None for the identity.
+
+    @return an unopened `AcquisitionSession`.
+    """
+    from acquisition_session import AcquisitionSession
+    if kurios is None:
+        kurios = SimulatedKurios(serial_number=kurios_serial, open_time=open_time, tuning_time=tuning_time,
+                                 tuning_time_per_nm=tuning_time_per_nm, bandwidth_switch_time=bandwidth_switch_time)
+    camera = SimulatedCamera(kurios=kurios, width=width, height=height, sensor_type=sensor_type,
+                             arm_time=arm_time, readout_time=readout_time, time_scale=time_scale, scene=scene,
+                             saturation_exposure_us=saturation_exposure_us, read_noise=read_noise,
+                             shot_noise=shot_noise, seed=seed, dark_offset=dark_offset, dark_current=dark_current,
+                             sensor_temperature=sensor_temperature, serial_number=camera_serial,
+                             color_correction_matrix=color_correction_matrix,
+                             white_balance_matrix=white_balance_matrix)
+    return AcquisitionSession(camera_sdk_factory=lambda: SimulatedTLCameraSDK(camera, discovery_time=discovery_time),
+                              mono_to_color_sdk_factory=SimulatedMonoToColorProcessorSDK,
+                              kurios=kurios,
+                              sensor_types=SENSOR_TYPE,
+                              operation_modes=OPERATION_MODE,
+                              arm_settle_time=0.0,
+                              kurios_serial=kurios.serial_number,
+                              camera_serial=camera_serial,
+                              min_settle_time=min_settle_time,
+                              seed_settle_time=seed_settle_time)
+
+
+def create_simulated_power_calibrator(kurios: SimulatedKurios = None, scene: SpectralScene = None,
+                                      peak_power: float = 1e-3, noise: float = 0.0, read_time: float = 0.0,
+                                      seed: int = 0):
+    """
+    The function builds a `PowerCalibrator` on a simulated Kurios filter and power meter.
+
+    @param kurios A `SimulatedKurios` to use, e.g. the one of a simulated session, a new one if None.
+    @param scene The `SpectralScene` providing the illumination spectrum.
+    @param peak_power The power in W at the brightest wavelength of the illumination.
+    @param noise The relative standard deviation of a power reading.
+    @param read_time The time in seconds a power reading takes.
+    @param seed The seed of the noise.
+
+    @return the connected `PowerCalibrator`.
+    """
+    from power_calibrator import PowerCalibrator
+    if kurios is None:
+        kurios = SimulatedKurios()
+    instrument = SimulatedPowerMeterInstrument(kurios=kurios, scene=scene, peak_power=peak_power, noise=noise,
+                                               read_time=read_time, seed=seed)
+    return PowerCalibrator(kurios=kurios, power_meter_instrument=instrument, min_settle_time=0.0,
+                           seed_settle_time=0.0)
+
+
+# The `SimulatedSessionFactory` class creates simulated sessions for the rigs of a `RigCoordinator`. Unlike a lambda
+# it can be passed to the rig processes, which build their own simulated devices with the serial numbers of the rig.
+class SimulatedSessionFactory:
+
+    def __init__(self, **session_options) -> None:
+        """
+        The function stores the options of the simulated sessions.
+
+        @param session_options Keyword arguments of `create_simulated_session`, apart from the serial numbers.
+        """
+        self.session_options = session_options
+
+    def __call__(self, rig):
+        return create_simulated_session(kurios_serial=rig.kurios_serial, camera_serial=rig.camera_serial,
+                                        **self.session_options)
@@ -0,0 +1,174 @@
+import json
+import os
+import threading
+import time
+
+
+# The `_Span` class times one block of code. The duration is added to an optional dictionary of totals and, while the
+# tracer is enabled, recorded as complete event of the trace.
+class _Span:
+
+    __slots__ = ('_tracer', '_name', '_totals', '_total_key', '_args', '_start')
+
+    def __init__(self, tracer, name, totals, total_key, args):
+        self._tracer = tracer
+        self._name = name
+        self._totals = totals
+        self._total_key = total_key if total_key is not None else name
+        self._args = args
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, exception_type, exception_value, exception_traceback):
+        end = time.perf_counter()
+        if self._totals is not None:
+            self._totals[self._total_key] += end - self._start
+        if self._tracer.enabled:
+            self._tracer._record(self._name, self._start, end, self._args)
+        return False
+
+
+# The `_NullSpan` class is returned while tracing is disabled and nothing has to be timed, entering and leaving it
+# does nothing.
+class _NullSpan:
+
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exception_type, exception_value, exception_traceback):
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+
+
+# The `SpanTracer` class records spans around the hardware calls and processing steps of the acquisition, from any
+# thread, and exports them in the Chrome trace event format, which chrome://tracing and https://ui.perfetto.dev
+# show as one timeline per thread. Tracing is switched on and off at runtime, while it is off a span costs one
+# attribute check.
+class SpanTracer:
+
+    def __init__(self) -> None:
+        """
+        The function initializes a disabled tracer without events.
+        """
+        self.enabled = False
+        self._events = []
+        self._thread_names = {}
+        self._origin = time.perf_counter()
+
+    def enable(self):
+        """
+        The function starts recording spans.
+        """
+        self.enabled = True
+
+    def disable(self):
+        """
+        The function stops recording spans, the recorded events are kept for `export`.
+        """
+        self.enabled = False
+
+    def clear(self):
+        """
+        The function deletes the recorded events and restarts the time axis of the trace.
+        """
+        self._events = []
+        self._thread_names = {}
+        self._origin = time.perf_counter()
+
+    def span(self, name: str, totals: dict = None, total_key: str = None, **args):
+        """
+        The function returns a context manager timing the enclosed block.
+
+        @param name The name of the span in the trace.
+        @param totals Optional dictionary, whose entry `total_key` is increased by the duration of the block, also
+        while tracing is disabled.
+        @param total_key The key of the duration in `totals`, the name of the span if it is None.
+        @param args Values shown with the span in the trace, e.g. the wavelength.
+        """
+        if not self.enabled and totals is None:
+            return _NULL_SPAN
+        return _Span(self, name, totals, total_key, args)
+
+    def instant(self, name: str, **args):
+        """
+        The function records a point in time, e.g. a trigger or a cancelled scan, while tracing is enabled.
+
+        @param name The name of the event in the trace.
+        @param args Values shown with the event in the trace.
+        """
+        if self.enabled:
+            self._record(name, time.perf_counter(), None, args)
+
+    def _record(self, name, start, end, args):
+        thread = threading.current_thread()
+        thread_id = thread.native_id
+        if thread_id not in self._thread_names:
+            self._thread_names[thread_id] = thread.name
+        event = {'name': name, 'ph': 'X' if end is not None else 'i', 'ts': (start - self._origin)*1e6,
+                 'pid': os.getpid(), 'tid': thread_id}
+        if end is not None:
+            event['dur'] = (end - start)*1e6
+        else:
+            event['s'] = 't'
+        if args:
+            event['args'] = args
+        # appending to a list is atomic, so the worker threads need no lock
+        self._events.append(event)
+
+    @property
+    def events(self) -> list:
+        """
+        The recorded events in the Chrome trace event format.
+        """
+        return list(self._events)
+
+    def export(self, path: str) -> str:
+        """
+        The function writes the recorded events as Chrome trace JSON file, with the thread names as metadata.
+
+        @param path The path of the JSON file.
+
+        @return the path of the written file.
+        """
+        metadata = [{'name': 'thread_name', 'ph': 'M', 'pid': os.getpid(), 'tid': thread_id, 'args': {'name': name}}
+                    for thread_id, name in list(self._thread_names.items())]
+        with open(path, 'w') as file:
+            json.dump({'traceEvents': metadata + self.events, 'displayTimeUnit': 'ms'}, file, default=str)
+        return path
+
+    def recording(self, path: str):
+        """
+        The function returns a context manager, which clears the events and enables tracing on entering and
+        disables tracing and exports the trace to the given path on leaving.
+
+        @param path The path of the JSON file.
+        """
+        return _Recording(self, path)
+
+
+# The `_Recording` class is the context manager of `SpanTracer.recording`.
+class _Recording:
+
+    def __init__(self, tracer, path):
+        self._tracer = tracer
+        self._path = path
+
+    def __enter__(self):
+        self._tracer.clear()
+        self._tracer.enable()
+        return self._tracer
+
+    def __exit__(self, exception_type, exception_value, exception_traceback):
+        self._tracer.disable()
+        self._tracer.export(self._path)
+        return False
+
+
+# the tracer shared by all modules of the acquisition
+TRACER = SpanTracer()
@@ -0,0 +1,94 @@
+ASCENDING = 'ascending'
+SERPENTINE = 'serpentine'
+NEAREST_NEIGHBOR = 'nearest_neighbor'
+
+
+# The `SweepOrder` class decides in which order the wavelengths of a sweep are visited. Repeated sweeps in ascending
+# order end every pass with the long jump from the longest back to the shortest wavelength, the serpentine order
+# runs every second pass backwards instead and the nearest neighbor order always continues with the wavelength,
+# which is reached fastest from the current one.
+class SweepOrder:
+
+    def __init__(self, strategy=SERPENTINE, settler=None) -> None:
+        """
+        The function initializes the sweep order.
+
+        @param strategy `ASCENDING`, `SERPENTINE`, `NEAREST_NEIGHBOR`, a list of wavelengths in nm giving a custom
+        order, or a callable taking the wavelengths, the pass index and the start wavelength and returning the
+        ordered wavelengths.
+        @param settler Optional `FilterSettler`, whose learned settle times are used as travel cost instead of the
+        jump size in nm.
+        """
+        if isinstance(strategy, str) and strategy not in (ASCENDING, SERPENTINE, NEAREST_NEIGHBOR):
+            raise ValueError(f'Unknown sweep order {strategy}')
+        self.strategy = strategy
+        self.settler = settler
+
+    def order(self, wavelengths: list, pass_index: int = 0, start_wavelength: int = None) -> list:
+        """
+        The function orders the wavelengths of one pass.
+
+        @param wavelengths The wavelengths in nm of the sweep.
+        @param pass_index The number of the pass, starting at 0.
+        @param start_wavelength The wavelength in nm the filter is tuned to before the pass, None if unknown.
+
+        @return the list of wavelengths in the order they are scanned.
+        """
+        wavelengths = [int(wl) for wl in wavelengths]
+        if callable(self.strategy):
+            ordered = [int(wl) for wl in self.strategy(wavelengths, pass_index, start_wavelength)]
+        elif not isinstance(self.strategy, str):
+            ordered = [int(wl) for wl in self.strategy]
+        elif self.strategy == ASCENDING:
+            ordered = sorted(wavelengths)
+        elif self.strategy == SERPENTINE:
+            ordered = sorted(wavelengths, reverse=pass_index % 2 == 1)
+        else:
+            ordered = self._nearest_neighbor(wavelengths, start_wavelength)
+        if sorted(ordered) != sorted(wavelengths):
+            raise ValueError('The sweep order has to contain every wavelength of the sweep exactly once')
+        return ordered
+
+    def _nearest_neighbor(self, wavelengths, start_wavelength):
+        waiting = sorted(wavelengths)
+        current = start_wavelength if start_wavelength is not None else waiting[0]
+        ordered = []
+        while waiting:
+            current = min(waiting, key=lambda wl: self.cost(current, wl))
+            waiting.remove(current)
+            ordered.append(current)
+        return ordered
+
+    def cost(self, wavelength_from: int, wavelength_to: int) -> float:
+        """
+        The function returns the cost of the filter transition between two wavelengths: the predicted settle time
+        in seconds if a settler with a learned model is given, otherwise the jump in nm.
+        """
+        jump = abs(int(wavelength_to) - int(wavelength_from))
+        if self.settler is not None and self.settler.settle_model:
+            # the jump in nm breaks ties between jumps of the same settle time class
+            return self.settler.predict(jump) + jump*1e-9
+        return jump
+
+    @staticmethod
+    def travel(ordered: list, start_wavelength: int = None) -> int:
+        """
+        The function returns the total filter travel in nm of a pass.
+
+        @param ordered The wavelengths in scan order.
+        @param start_wavelength The wavelength in nm the filter is tuned to before the pass, None if unknown.
+        """
+        path = ([start_wavelength] if start_wavelength is not None else []) + list(ordered)
+        return sum(abs(int(b) - int(a)) for a, b in zip(path[:-1], path[1:]))
+
+    def predicted_settle_time(self, ordered: list, start_wavelength: int = None) -> float:
+        """
+        The function returns the total settle time in seconds of a pass predicted by the settler, 0 without settler.
+
+        @param ordered The wavelengths in scan order.
+        @param start_wavelength The wavelength in nm the filter is tuned to before the pass, None if unknown.
+        """
+        if self.settler is None:
+            return 0.0
+        path = ([start_wavelength] if start_wavelength is not None else []) + list(ordered)
+        return sum(self.settler.predict(abs(int(b) - int(a))) for a, b in zip(path[:-1], path[1:]))
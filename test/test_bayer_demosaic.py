@@ -0,0 +1,55 @@
+import numpy as np
+import pytest
+from bayer_demosaic import cfa_pattern, color_correct, demosaic, develop
+from simulated_devices import SENSOR_TYPE, create_simulated_session
+from automization import CameraFilterSyncronizer
+from tiff_stream_writer import read_sorted_stack
+
+WHITE_BALANCE = np.diag([1.8, 1.0, 1.4])
+COLOR_CORRECTION = np.array([[1.5, -0.3, -0.2], [-0.2, 1.4, -0.2], [-0.1, -0.4, 1.5]])
+
+
+def test_cfa_pattern_follows_the_region_offset():
+    assert cfa_pattern(0) == 'RGGB'
+    assert cfa_pattern(0, x_offset=1) == 'GRBG'
+    assert cfa_pattern(0, y_offset=1) == 'GBRG'
+    assert cfa_pattern(0, x_offset=1, y_offset=1) == 'BGGR'
+
+
+def test_demosaic_keeps_samples_and_interpolates_flat_fields():
+    raw = np.full((6, 8), 100, dtype=np.uint16)
+    raw[0::2, 0::2] = 40
+    rgb = demosaic(raw, 'RGGB')
+    assert rgb.shape == (6, 8, 3)
+    np.testing.assert_allclose(rgb[..., 0], 40)
+    np.testing.assert_allclose(rgb[..., 1], 100)
+    assert rgb[0, 0, 0] == 40 and rgb[0, 1, 1] == 100
+
+
+def test_color_correct_applies_white_balance_before_the_matrix():
+    rgb = np.ones((1, 1, 3), dtype=np.float32)
+    color_correct(rgb, COLOR_CORRECTION, WHITE_BALANCE)
+    np.testing.assert_allclose(rgb[0, 0], COLOR_CORRECTION @ np.diag(WHITE_BALANCE), rtol=1e-6)
+
+
+def test_develop_skips_the_color_matrices_of_normalized_pages():
+    raw = np.full((4, 4), 256, dtype=np.uint16)
+    metadata = {'cfa_pattern': 'RGGB', 'color_correction_matrix': COLOR_CORRECTION.ravel().tolist(),
+                'white_balance_matrix': WHITE_BALANCE.ravel().tolist()}
+    assert not np.allclose(develop(raw, metadata), 256)
+    np.testing.assert_array_equal(develop(raw, dict(metadata, normalized=True)), 256)
+
+
+@pytest.mark.parametrize('raw_bayer', [False, True])
+def test_white_reference_develops_neutral(tmp_path, raw_bayer):
+    # a scan of the calibration target itself is white, whichever way the color is processed
+    session = create_simulated_session(width=32, height=24, sensor_type=SENSOR_TYPE.BAYER, time_scale=0.0,
+                                       color_correction_matrix=COLOR_CORRECTION, white_balance_matrix=WHITE_BALANCE)
+    with session:
+        syncroniser = CameraFilterSyncronizer(list(range(500, 503)), 1000, session=session)
+        syncroniser.gatherImages(str(tmp_path), 'calib.tif', None, True, raw_bayer=raw_bayer)
+        syncroniser.gatherImages(str(tmp_path), 'scan.tif', str(tmp_path / 'calib.tif'), False, raw_bayer=raw_bayer)
+    wavelengths, stack = read_sorted_stack(str(tmp_path / 'scan.tif'))
+    assert list(wavelengths) == [500, 501, 502]
+    assert stack.shape == (3, 24, 32, 3)
+    np.testing.assert_allclose(stack, 256, atol=1)
@@ -0,0 +1,31 @@
+import pytest
+from exposure_schedule import ExposureSchedule
+
+
+def test_schedule_looks_up_and_sums_the_exposures():
+    schedule = ExposureSchedule({500.0: 2000.7, 510: 4000})
+    assert schedule.exposure(500) == 2000
+    assert schedule.total_exposure([500, 510, 510]) == pytest.approx(0.01)
+    assert schedule.as_dict() == {500: 2000, 510: 4000}
+    with pytest.raises(KeyError):
+        schedule.exposure(520)
+
+
+def test_power_calibration_exposes_bright_bands_shorter(tmp_path):
+    csv_path = tmp_path/'Calib_x10.csv'
+    csv_path.write_text('wavelengths,power_meas\n500,1e-3\n600,4e-3\n700,2e-2\n')
+    schedule = ExposureSchedule.from_power_calibration(str(csv_path), [500, 550, 600, 700], 40000, min_exposure=4000)
+    assert schedule.exposure(500) == 40000
+    assert schedule.exposure(550) == 16000
+    assert schedule.exposure(600) == 10000
+    # 2000 us would be proportional, the minimum is kept
+    assert schedule.exposure(700) == 4000
+
+
+def test_preview_brings_every_band_to_the_target_level():
+    schedule = ExposureSchedule.from_preview({500: 1000, 600: 4000, 700: 0}, preview_exposure=10000,
+                                             full_scale=4095, target_fraction=0.8, min_exposure=1000,
+                                             max_exposure=50000)
+    assert schedule.exposure(500) == int(10000*0.8*4095/1000)
+    assert schedule.exposure(600) == int(10000*0.8*4095/4000)
+    assert schedule.exposure(700) == 50000
@@ -0,0 +1,41 @@
+from filter_settle import FilterSettler
+from simulated_devices import SimulatedKurios
+
+
+# The `EagerKurios` class reports every wavelength as tuned as soon as it is set, like the controller does.
+class EagerKurios(SimulatedKurios):
+
+    def KuriosGetWavelength(self, hdl, value):
+        value[0] = self.wavelength
+        return 0
+
+
+def test_filter_reporting_at_once_waits_the_seed_and_learns_nothing():
+    kurios = EagerKurios(wavelength=500)
+    settler = FilterSettler(kurios, 0, min_settle_time=0.01, seed_settle_time=0.05)
+    assert settler.tune(540) >= 0.05
+    assert settler.settle_model == {}
+    assert settler.tune(541) >= 0.05
+    assert settler.tune(541) < 0.05
+
+
+def test_filter_seen_settling_replaces_the_seed():
+    kurios = SimulatedKurios(wavelength=500, tuning_time=0.02)
+    settler = FilterSettler(kurios, 0, min_settle_time=0.0, seed_settle_time=0.2)
+    settle_time = settler.tune(505)
+    assert settle_time >= 0.2
+    count, mean = settler.settle_model[0]
+    assert count == 1 and 0.02 <= mean < 0.2
+    assert settler.predict(3) == mean
+    assert settler.tune(510) < 0.2
+
+
+def test_unmeasured_jumps_are_not_expected_faster_than_smaller_ones():
+    settler = FilterSettler(SimulatedKurios(), 0, seed_settle_time=0.3)
+    settler.learn(5, 0.05)
+    settler.learn(25, 0.5)
+    assert settler.predict(0) == 0.0
+    assert settler.predict(8) == 0.05
+    assert settler.predict(15) == 0.3
+    assert settler.predict(25) == 0.5
+    assert settler.predict(100) == 0.5
@@ -0,0 +1,33 @@
+import numpy as np
+from frame_averager import FrameAverager
+
+
+def test_mean_and_std_match_numpy():
+    rng = np.random.default_rng(0)
+    frames = rng.normal(1000, 30, (7, 12, 16, 3)).astype(np.float32)
+    averager = FrameAverager((12, 16, 3))
+    for frame in frames:
+        averager.add(frame)
+    assert averager.count == 7
+    np.testing.assert_allclose(averager.mean, frames.mean(axis=0), rtol=1e-5)
+    np.testing.assert_allclose(averager.std(), frames.std(axis=0, ddof=1), rtol=1e-3)
+
+
+def test_uint16_frames_are_accumulated_without_overflow():
+    averager = FrameAverager((2, 2))
+    for value in (65535, 65535, 65533):
+        averager.add(np.full((2, 2), value, dtype=np.uint16))
+    np.testing.assert_allclose(averager.mean, 65534.33, rtol=1e-6)
+    np.testing.assert_allclose(averager.std(), np.std([65535, 65535, 65533], ddof=1), rtol=1e-3)
+
+
+def test_single_frame_has_zero_std_and_reset_starts_over():
+    averager = FrameAverager((3, 4))
+    averager.add(np.full((3, 4), 5.0))
+    out = np.empty((3, 4), dtype=np.float32)
+    assert averager.std(out) is out
+    np.testing.assert_array_equal(out, 0)
+    averager.reset()
+    averager.add(np.full((3, 4), 9.0))
+    assert averager.count == 1
+    np.testing.assert_array_equal(averager.mean, 9)
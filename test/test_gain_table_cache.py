@@ -0,0 +1,31 @@
+import os
+import numpy as np
+from gain_table_cache import GainTableCache, compute_gain
+
+
+def test_compute_gain_saturates_dark_calibration_pixels():
+    gain = compute_gain(np.array([[128, 0]], dtype=np.uint16))
+    assert gain.dtype == np.float32
+    assert gain[0, 0] == 2
+    assert np.isfinite(gain[0, 1]) and gain[0, 1] >= 2**16
+
+
+def test_tables_are_reused_until_the_calibration_changes(tmp_path):
+    calibration_path = str(tmp_path/'calib.tif')
+    with open(calibration_path, 'wb') as file:
+        file.write(b'first')
+    calibration = np.full((4, 4), 64, dtype=np.uint16)
+
+    cache = GainTableCache(calibration_path)
+    np.testing.assert_array_equal(cache.gain(500, lambda: calibration), 4)
+    reopened = GainTableCache(calibration_path)
+    np.testing.assert_array_equal(reopened.gain(500, lambda: None), 4)
+    assert (cache.misses, reopened.hits) == (1, 1)
+
+    with open(calibration_path, 'wb') as file:
+        file.write(b'second content')
+    rewritten = GainTableCache(calibration_path)
+    assert rewritten.file_key != cache.file_key
+    np.testing.assert_array_equal(rewritten.gain(500, lambda: calibration*2), 2)
+    assert rewritten.misses == 1
+    assert os.listdir(calibration_path + '.gains') == [f'{rewritten.file_key}_500nm_256.npy']
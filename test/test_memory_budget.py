@@ -0,0 +1,60 @@
+import numpy as np
+import pytest
+from memory_budget import MemoryBudget, parse_size
+
+# one buffer of the pools below takes 1 KiB
+SHAPE = (16, 32)
+
+
+def test_parse_size_reads_binary_units():
+    assert parse_size('512M') == 512*2**20
+    assert parse_size('1.5 GB') == 3*2**29
+    assert parse_size('10k') == 10*2**10
+    assert parse_size(1000) == 1000
+    with pytest.raises(ValueError):
+        parse_size('lots')
+
+
+def test_pools_keep_the_depth_in_memory_and_spill_the_rest():
+    budget = MemoryBudget('6K')
+    try:
+        pools = budget.pools_for([('raw', SHAPE, np.uint16, 10, 1, 4)])
+        assert pools['raw'].count == 10
+        assert pools['raw'].spill_count == 4
+        assert budget.allocated <= budget.limit
+    finally:
+        budget.close()
+
+
+def test_pools_share_the_budget_in_request_order():
+    budget = MemoryBudget('8K')
+    try:
+        budget.reserve('scratch', 2**10)
+        pools = budget.pools_for([('raw', SHAPE, np.uint16, 5, 1, 2), ('output', SHAPE, np.uint16, 6, 1, 2)])
+        report = budget.report()['pools']
+        assert (report['raw']['buffers'], report['raw']['spilled_buffers']) == (5, 0)
+        assert (report['output']['buffers'], report['output']['spilled_buffers']) == (2, 4)
+        assert budget.allocated == budget.limit
+        assert pools['output'].count == 6
+    finally:
+        budget.close()
+
+
+def test_pools_without_spilling_get_fewer_buffers():
+    budget = MemoryBudget('3K', spill=False)
+    try:
+        pool = budget.pool('raw', SHAPE, np.uint16, 8, minimum=1, depth=2)
+        assert (pool.count, pool.spill_count) == (3, 0)
+    finally:
+        budget.close()
+
+
+@pytest.mark.parametrize('spill', [True, False])
+def test_budget_below_the_pipeline_depth_is_refused(spill):
+    budget = MemoryBudget('3K', spill=spill)
+    budget.reserve('scratch', 2**10)
+    with pytest.raises(MemoryError):
+        budget.pools_for([('raw', SHAPE, np.uint16, 10, 1, 3)])
+    assert budget.pools == {}
+    budget.close()
+    assert budget.allocated == 0
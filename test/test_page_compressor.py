@@ -0,0 +1,40 @@
+import numpy as np
+import pytest
+import tifffile
+from page_compressor import DEFAULT_MAX_PENDING, PageCompressor
+from tiff_stream_writer import StreamingTiffWriter, read_page_metadata
+
+
+@pytest.mark.parametrize('shape', [(100, 70), (100, 70, 3)])
+@pytest.mark.parametrize('predictor', [True, False])
+def test_compressed_pages_read_back_unchanged(tmp_path, shape, predictor):
+    rng = np.random.default_rng(0)
+    images = [rng.integers(0, 2**16, shape, dtype=np.uint16), np.full(shape, 1000, dtype=np.uint16)]
+    path = str(tmp_path/'stack.tif')
+    with PageCompressor('deflate', workers=2, rows_per_strip=16, predictor=predictor) as compressor, \
+            StreamingTiffWriter(path) as writer:
+        for wavelength, image in zip((500, 501), images):
+            writer.write_page(image, {'wavelength': wavelength}, compressed=compressor.submit(image))
+    with tifffile.TiffFile(path) as file:
+        assert [page.compression for page in file.pages] == [tifffile.COMPRESSION.ADOBE_DEFLATE]*2
+        for page, image in zip(file.pages, images):
+            np.testing.assert_array_equal(page.asarray(), image)
+    assert [metadata['wavelength'] for metadata in read_page_metadata(path)] == [500, 501]
+    assert compressor.page_count == 2 and compressor.ratio > 1
+
+
+def test_pages_beyond_max_pending_are_left_uncompressed():
+    with PageCompressor('deflate', workers=1, max_pending=1) as compressor:
+        image = np.zeros((512, 512), dtype=np.uint16)
+        pages = [compressor.submit(image) for _ in range(3)]
+        assert pages[0] is not None
+        assert compressor.uncompressed_pages == sum(page is None for page in pages)
+        pages[0].result()
+        assert compressor.submit(image) is not None
+
+
+def test_default_max_pending_is_capped():
+    with PageCompressor('deflate', workers=64) as compressor:
+        assert compressor.max_pending == DEFAULT_MAX_PENDING
+    with PageCompressor('deflate', workers=1) as compressor:
+        assert compressor.max_pending == 2
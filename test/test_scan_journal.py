@@ -0,0 +1,81 @@
+import os
+import numpy as np
+from scan_journal import ScanJournal
+from tiff_stream_writer import StreamingTiffWriter, read_page_metadata
+
+PARAMETERS = {'exposures': [[500, 1000], [510, 1000], [520, 1000]], 'frames_per_wavelength': 1}
+
+
+def write_scan(path, journal, wavelengths, recorded, append=False):
+    """
+    The function writes one page per wavelength and records the first `recorded` ones in the journal, like an
+    interrupted scan.
+    """
+    with StreamingTiffWriter(path, append=append) as writer:
+        for index, wavelength in enumerate(wavelengths):
+            writer.write_page(np.full((8, 8), wavelength, dtype=np.uint16), {'wavelength': wavelength})
+            if index < recorded:
+                journal.record(wavelength, 1, writer.file_size)
+    journal.close()
+
+
+def test_resume_cuts_off_the_pages_after_the_last_recorded_wavelength(tmp_path):
+    path = str(tmp_path/'scan.tif')
+    journal = ScanJournal(path, PARAMETERS)
+    journal.reset()
+    write_scan(path, journal, [500, 510, 520], recorded=2)
+    with open(journal.journal_path, 'a') as file:
+        # the line being written when the scan died
+        file.write('{"wavelength": 52')
+
+    resumed = ScanJournal(path, PARAMETERS)
+    assert resumed.resume() == [500, 510]
+    resumed.close()
+    assert [metadata['wavelength'] for metadata in read_page_metadata(path)] == [500, 510]
+
+    with StreamingTiffWriter(path, append=True) as writer:
+        writer.write_page(np.full((8, 8), 520, dtype=np.uint16), {'wavelength': 520})
+    assert [metadata['wavelength'] for metadata in read_page_metadata(path)] == [500, 510, 520]
+
+
+def test_other_settings_start_over(tmp_path):
+    path = str(tmp_path/'scan.tif')
+    journal = ScanJournal(path, PARAMETERS)
+    journal.reset()
+    write_scan(path, journal, [500, 510], recorded=2)
+
+    resumed = ScanJournal(path, dict(PARAMETERS, frames_per_wavelength=2))
+    assert resumed.resume() == []
+    resumed.close()
+    assert not os.path.exists(path)
+
+
+def test_stack_not_matching_the_journal_is_not_resumed(tmp_path):
+    path = str(tmp_path/'scan.tif')
+    journal = ScanJournal(path, PARAMETERS)
+    journal.reset()
+    write_scan(path, journal, [500, 510], recorded=2)
+    # another scan overwrote the stack
+    write_scan(path, ScanJournal(str(tmp_path/'other.tif'), {}), [600, 610], recorded=0)
+
+    resumed = ScanJournal(path, PARAMETERS)
+    assert resumed.resume() == []
+    resumed.close()
+
+
+def test_interrupted_append_is_cut_back_to_its_base(tmp_path):
+    path = str(tmp_path/'scan.tif')
+    journal = ScanJournal(path, PARAMETERS)
+    journal.reset()
+    write_scan(path, journal, [500, 510], recorded=2)
+    journal.finish()
+    assert not os.path.exists(journal.journal_path)
+
+    appending = ScanJournal(path, dict(PARAMETERS, append=True))
+    assert appending.append() == []
+    write_scan(path, appending, [505], recorded=0, append=True)
+
+    resumed = ScanJournal(path, dict(PARAMETERS, append=True))
+    assert resumed.append() == []
+    resumed.close()
+    assert [metadata['wavelength'] for metadata in read_page_metadata(path)] == [500, 510]
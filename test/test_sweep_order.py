@@ -0,0 +1,50 @@
+import pytest
+from filter_settle import FilterSettler
+from simulated_devices import SimulatedKurios
+from sweep_order import ASCENDING, NEAREST_NEIGHBOR, SERPENTINE, SweepOrder
+
+WAVELENGTHS = [500, 430, 730, 600]
+
+
+def test_ascending_keeps_the_order_of_every_pass():
+    order = SweepOrder(ASCENDING)
+    assert order.order(WAVELENGTHS, 0) == order.order(WAVELENGTHS, 1) == [430, 500, 600, 730]
+
+
+def test_serpentine_reverses_every_second_pass():
+    order = SweepOrder(SERPENTINE)
+    assert order.order(WAVELENGTHS, 0) == [430, 500, 600, 730]
+    assert order.order(WAVELENGTHS, 1) == [730, 600, 500, 430]
+    assert order.order(WAVELENGTHS, 2) == [430, 500, 600, 730]
+
+
+def test_nearest_neighbor_starts_at_the_filter_wavelength():
+    order = SweepOrder(NEAREST_NEIGHBOR)
+    assert order.order(WAVELENGTHS, start_wavelength=590) == [600, 500, 430, 730]
+    assert order.order(WAVELENGTHS) == [430, 500, 600, 730]
+
+
+def test_nearest_neighbor_follows_the_learned_settle_times():
+    settler = FilterSettler(SimulatedKurios(), 0, bucket_size=10, seed_settle_time=0.3)
+    # jumps of 10-19 nm settle slower than jumps of 20-29 nm
+    settler.learn(15, 1.0)
+    settler.learn(25, 0.1)
+    order = SweepOrder(NEAREST_NEIGHBOR, settler=settler)
+    assert order.cost(500, 515) > order.cost(500, 525)
+    assert order.order([515, 525], start_wavelength=500) == [525, 515]
+    assert order.predicted_settle_time([525, 515], start_wavelength=500) == pytest.approx(1.1)
+
+
+def test_custom_orders_have_to_cover_the_sweep():
+    assert SweepOrder([600, 430, 730, 500]).order(WAVELENGTHS) == [600, 430, 730, 500]
+    assert SweepOrder(lambda wavelengths, index, start: wavelengths[::-1]).order(WAVELENGTHS) == WAVELENGTHS[::-1]
+    with pytest.raises(ValueError):
+        SweepOrder([430, 500]).order(WAVELENGTHS)
+    with pytest.raises(ValueError):
+        SweepOrder('random')
+
+
+def test_travel_sums_the_jumps_from_the_start():
+    assert SweepOrder.travel([430, 500, 600, 730]) == 300
+    assert SweepOrder.travel([430, 500, 600, 730], start_wavelength=730) == 600
+    assert SweepOrder.travel([]) == 0
@@ -0,0 +1,157 @@
+import json
+import os
+import time
+import numpy as np
+import tifffile
+
+
+# The `StreamingTiffWriter` class keeps one BigTIFF file open for a whole scan and appends every frame as a new page.
+# Reopening the file with `append=True` for every frame parses the existing page chain each time, which makes the
+# writing time grow with the number of pages already in the stack.
+class StreamingTiffWriter:
+
+    def __init__(self, file_path: str, overwrite: bool = True, append: bool = False) -> None:
+        """
+        The function opens the output file for writing.
+
+        @param file_path The path of the TIFF stack to write.
+        @param overwrite If True, an existing file is replaced, otherwise writing to an existing file raises a
+        `FileExistsError`.
+        @param append If True, the pages are appended to an existing BigTIFF stack, e.g. to continue an
+        interrupted scan.
+        """
+        append = append and os.path.exists(file_path)
+        if os.path.exists(file_path) and not overwrite and not append:
+            raise FileExistsError(f'{file_path} already exists')
+        self.file_path = file_path
+        self._tiff = tifffile.TiffWriter(file_path, bigtiff=True, append=append)
+        self.page_count = 0
+        self.page_write_times = []
+
+    def write_page(self, image: np.ndarray, metadata: dict = None, compressed=None):
+        """
+        The function appends an image as one page to the stack. The metadata is stored as JSON in the image
+        description of the page, so it stays attached to the page in any order.
+
+        @param image The image data, 2D for mono and 3D (height, width, 3) for color images.
+        @param metadata Dictionary of JSON serializable page information, e.g. the wavelength.
+        @param compressed Optional `page_compressor.CompressedPage` of the image, whose compressed strips are
+        written instead of the image data.
+        """
+        start = time.perf_counter()
+        description = json.dumps(metadata) if metadata is not None else None
+        if compressed is None:
+            self._tiff.write(data=image, description=description, metadata=None, photometric=self._photometric(image))
+        else:
+            self._tiff.write(data=iter(compressed.result().strips), shape=image.shape, dtype=image.dtype,
+                             compression=compressed.compression,
+                             predictor='horizontal' if compressed.predictor else None,
+                             rowsperstrip=compressed.rows_per_strip, description=description, metadata=None,
+                             photometric=self._photometric(image))
+        self.page_count += 1
+        self.page_write_times.append(time.perf_counter() - start)
+
+    @property
+    def file_size(self) -> int:
+        """
+        The size of the stack in bytes after the pages written so far, which are flushed to the file.
+        """
+        filehandle = self._tiff.filehandle
+        filehandle.flush()
+        return filehandle.tell()
+
+    @staticmethod
+    def _photometric(image: np.ndarray) -> str:
+        return 'rgb' if image.ndim == 3 and image.shape[-1] == 3 else 'minisblack'
+
+    def close(self):
+        """
+        The function writes the remaining file structure and closes the file. Closing twice does nothing.
+        """
+        if self._tiff is not None:
+            self._tiff.close()
+            self._tiff = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exception_type, exception_value, exception_traceback):
+        # the pages written so far stay readable if the scan failed
+        self.close()
+        return False
+
+
+def read_page_metadata(file_path: str) -> list:
+    """
+    The function reads the page metadata written by `StreamingTiffWriter`.
+
+    @param file_path The path of the TIFF stack.
+
+    @return a list with one dictionary per page, empty for pages without metadata.
+    """
+    metadata = []
+    with tifffile.TiffFile(file_path) as file:
+        for page in file.pages:
+            try:
+                metadata.append(json.loads(page.description))
+            except (ValueError, TypeError):
+                metadata.append({})
+    return metadata
+
+
+def read_sorted_stack(file_path: str, statistic: str = 'mean', develop: bool = True) -> tuple:
+    """
+    The function reads a TIFF stack written in any wavelength order, e.g. by a serpentine sweep, and sorts its pages
+    by the wavelength stored in their metadata.
+
+    @param file_path The path of the TIFF stack.
+    @param statistic For stacks of averaged frames, 'mean' or 'std' selects the pages to read.
+    @param develop If True, raw Bayer pages are demosaiced and color corrected to RGB, see `bayer_demosaic`.
+
+    @return a tuple of the list of wavelengths in nm in ascending order and the array of the matching pages.
+    """
+    metadata = read_page_metadata(file_path)
+    if any('wavelength' not in page for page in metadata):
+        raise ValueError(f'{file_path} has pages without wavelength metadata')
+    indices = [i for i, page in enumerate(metadata) if page.get('statistic', 'mean') == statistic]
+    indices.sort(key=lambda i: metadata[i]['wavelength'])
+    with tifffile.TiffFile(file_path) as file:
+        pages = [file.pages[i].asarray() for i in indices]
+    if develop:
+        from bayer_demosaic import develop as develop_page
+        pages = [develop_page(page, metadata[i]) if 'cfa_pattern' in metadata[i] else page
+                 for i, page in zip(indices, pages)]
+    stack = np.stack(pages) if pages else np.empty((0,))
+    return [metadata[i]['wavelength'] for i in indices], stack
+
+
+if __name__ == "__main__":
+    # benchmark: write time per page for reopening the file per frame compared to one open writer
+    page_count = 301
+    image = np.zeros((2048, 2448), dtype=np.uint16)
+    append_path = 'benchmark_append.tif'
+    stream_path = 'benchmark_stream.tif'
+    for path in (append_path, stream_path):
+        if os.path.exists(path):
+            os.remove(path)
+
+    append_times = []
+    for i in range(page_count):
+        start = time.perf_counter()
+        with tifffile.TiffWriter(append_path, append=True) as tiff:
+            tiff.write(data=image)
+        append_times.append(time.perf_counter() - start)
+
+    with StreamingTiffWriter(stream_path) as writer:
+        for i in range(page_count):
+            writer.write_page(image, {'wavelength': 430 + i})
+    stream_times = writer.page_write_times
+
+    block = 50
+    print('pages      append [ms/page]   stream [ms/page]')
+    for first in range(0, page_count, block):
+        append_mean = np.mean(append_times[first:first + block])*1e3
+        stream_mean = np.mean(stream_times[first:first + block])*1e3
+        print(f'{first:4d}-{min(first + block, page_count) - 1:<4d}  {append_mean:12.2f}   {stream_mean:16.2f}')
+    for path in (append_path, stream_path):
+        os.remove(path)